@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+annealing_optimizer.py - シミュレーテッドアニーリングエンジン
+石垣島ツアー最適化システム
+
+- 近傍: 2-opt（区間反転）、relocate（車両間移動）、swap（交換）
+- 距離差分は影響する辺のみで O(1) 計算し、受理判定を先に行う
+- 時間枠は各ルートの開始時刻・最遅開始時刻（スラック）配列で判定
+  （車両間 relocate / swap は O(1)、ルート内の変更は該当ルートのみ再計算）
+- 各停車の遅延は現状より悪化させない（希望時間内の停車は枠内を維持）
+- 温度は initial_temperature から cooling_rate で冷却、実時間予算で打ち切り
+"""
+
+import logging
+import math
+import random
+import time
+from typing import Callable, List, Optional
+
+from routing_problem import DEPOT, RoutingProblem
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatedAnnealingOptimizer:
+    """差分評価型シミュレーテッドアニーリングによる複数車両ルート改善"""
+
+    def __init__(self,
+                 problem: RoutingProblem,
+                 initial_temperature: float = 200,
+                 cooling_rate: float = 0.95,
+                 iterations_per_temperature: int = 500,
+                 min_temperature: float = 0.01,
+                 time_limit_ms: int = 1000,
+                 max_iterations: Optional[int] = None,
+                 seed: Optional[int] = None):
+        if not 0 < cooling_rate < 1:
+            raise ValueError(f"cooling_rate は 0 と 1 の間で指定してください: {cooling_rate}")
+        self.problem = problem
+        self.initial_temperature = max(float(initial_temperature), min_temperature)
+        self.cooling_rate = float(cooling_rate)
+        self.iterations_per_temperature = max(1, int(iterations_per_temperature))
+        self.min_temperature = float(min_temperature)
+        self.time_limit_ms = max(0, int(time_limit_ms))
+        # リクエスト単位の反復上限（評価手数、温度ステップ単位で確認）
+        self.max_iterations = None if max_iterations is None else max(1, int(max_iterations))
+        self.stop_reason: Optional[str] = None
+        self.rng = random.Random(seed)
+
+        self.stats = {'evaluated_moves': 0, 'accepted_moves': 0, 'elapsed_seconds': 0.0}
+
+    # ===== ルート状態管理 =====
+
+    def _refresh_route(self, r: int) -> None:
+        """ルート r の開始時刻・最遅開始時刻・位置情報を再計算"""
+        problem = self.problem
+        travel = problem.travel_rows
+        tw_end = problem.tw_end_list
+        service = problem.service_minutes
+        route = self.routes[r]
+
+        starts = problem.route_start_times(route)
+        latest = [0.0] * len(route)
+        for k in range(len(route) - 1, -1, -1):
+            node = route[k]
+            limit = max(tw_end[node], starts[k])
+            self.limit[node] = limit
+            if k == len(route) - 1:
+                latest[k] = limit
+            else:
+                latest[k] = min(limit, latest[k + 1] - service - travel[node][route[k + 1]])
+            self.route_of[node] = r
+            self.index_of[node] = k
+
+        self.starts[r] = starts
+        self.latest[r] = latest
+        self.loads[r] = problem.route_load(route)
+
+    def _depart(self, r: int, position: int):
+        """ルート r の position 番目の直前地点と出発時刻"""
+        if position == 0:
+            return DEPOT, float(self.problem.depot_open_minutes)
+        return self.routes[r][position - 1], self.starts[r][position - 1] + self.problem.service_minutes
+
+    def _fits(self, r: int, position: int, node: int, next_position: int) -> bool:
+        """
+        ルート r の position 直前地点の後に node を置き、
+        next_position の停車へ続ける場合の時間枠判定（O(1)）
+        """
+        problem = self.problem
+        travel = problem.travel_rows
+        prev, depart = self._depart(r, position)
+        start = max(depart + travel[prev][node], problem.tw_start_list[node])
+        if start > self.limit[node]:
+            return False
+        route = self.routes[r]
+        if next_position < len(route):
+            arrival = start + problem.service_minutes + travel[node][route[next_position]]
+            if arrival > self.latest[r][next_position]:
+                return False
+        return True
+
+    def _route_within_limits(self, route: List[int]) -> bool:
+        """ルート全体の時間枠判定（ルート内の変更用）"""
+        limit = self.limit
+        return all(t <= limit[node]
+                   for node, t in zip(route, self.problem.route_start_times(route)))
+
+    # ===== 実行 =====
+
+    def solve(self, initial_routes: List[List[int]],
+              optimization_log: Optional[List[str]] = None,
+              should_stop: Optional[Callable[[], bool]] = None,
+              progress: Optional[Callable[[int, List[List[int]]], None]] = None) -> List[List[int]]:
+        """
+        SA実行
+
+        Args:
+            initial_routes: 車両順の初期ルート（ゲストノード番号のリスト）
+            should_stop: True を返したら温度ループを打ち切る（外部からの停止要求）
+            progress: 温度段階ごとに (評価手数, 暫定最良ルート) で呼ばれる
+
+        Returns:
+            改善後の車両順ルート（最良解）
+        """
+        problem = self.problem
+        num_vehicles = problem.num_vehicles
+        num_nodes = problem.num_guests + 1
+
+        self.routes = [list(route) for route in initial_routes]
+        self.route_of = [0] * num_nodes
+        self.index_of = [0] * num_nodes
+        self.limit = [0.0] * num_nodes
+        self.starts = [[] for _ in range(num_vehicles)]
+        self.latest = [[] for _ in range(num_vehicles)]
+        self.loads = [0] * num_vehicles
+        for r in range(num_vehicles):
+            self._refresh_route(r)
+
+        initial_distance = sum(problem.route_distance(route) for route in self.routes)
+        if problem.num_guests < 2:
+            return self.routes
+
+        dist = problem.dist_rows
+        demand = problem.demand_list
+        capacity = problem.capacity_list
+        routes = self.routes
+        route_of = self.route_of
+        index_of = self.index_of
+        loads = self.loads
+        rng_random = self.rng.random
+        rng_randrange = self.rng.randrange
+        exp = math.exp
+
+        current = initial_distance
+        best = current
+        best_routes = [list(route) for route in routes]
+
+        temperature = self.initial_temperature
+        deadline = time.perf_counter() + self.time_limit_ms / 1000
+        started = time.perf_counter()
+        evaluated = 0
+        accepted = 0
+
+        self.stop_reason = None
+        while temperature > self.min_temperature:
+            if time.perf_counter() >= deadline:
+                self.stop_reason = 'time_limit'
+                break
+            if should_stop is not None and should_stop():
+                self.stop_reason = 'stopped'
+                break
+            if self.max_iterations is not None and evaluated >= self.max_iterations:
+                self.stop_reason = 'iterations'
+                break
+            for _ in range(self.iterations_per_temperature):
+                evaluated += 1
+                u = rng_randrange(1, num_nodes)
+                a = route_of[u]
+                route_a = routes[a]
+                i = index_of[u]
+                len_a = len(route_a)
+                prev_u = route_a[i - 1] if i > 0 else DEPOT
+                next_u = route_a[i + 1] if i + 1 < len_a else DEPOT
+                move = rng_random()
+
+                if move < 0.4:
+                    # --- 2-opt: route_a[i..j] を反転 ---
+                    if len_a < 3:
+                        continue
+                    j = rng_randrange(len_a)
+                    if j == i:
+                        continue
+                    if j < i:
+                        i, j = j, i
+                    head = route_a[i - 1] if i > 0 else DEPOT
+                    tail = route_a[j + 1] if j + 1 < len_a else DEPOT
+                    first = route_a[i]
+                    last = route_a[j]
+                    delta = (dist[head][last] + dist[first][tail] -
+                             dist[head][first] - dist[last][tail])
+                    if delta > 0 and rng_random() >= exp(-delta / temperature):
+                        continue
+                    candidate = route_a[:i] + route_a[i:j + 1][::-1] + route_a[j + 1:]
+                    if not self._route_within_limits(candidate):
+                        continue
+                    routes[a] = candidate
+                    self._refresh_route(a)
+
+                elif move < 0.75:
+                    # --- relocate: u を別車両の position の前へ移動 ---
+                    b = rng_randrange(num_vehicles)
+                    if b == a or loads[b] + demand[u] > capacity[b]:
+                        continue
+                    route_b = routes[b]
+                    position = rng_randrange(len(route_b) + 1)
+                    before = route_b[position - 1] if position > 0 else DEPOT
+                    after = route_b[position] if position < len(route_b) else DEPOT
+                    delta = (dist[prev_u][next_u] - dist[prev_u][u] - dist[u][next_u] +
+                             dist[before][u] + dist[u][after] - dist[before][after])
+                    if delta > 0 and rng_random() >= exp(-delta / temperature):
+                        continue
+                    if not self._fits(b, position, u, position):
+                        continue
+                    del route_a[i]
+                    route_b.insert(position, u)
+                    self._refresh_route(a)
+                    self._refresh_route(b)
+
+                else:
+                    # --- swap: u と v を交換 ---
+                    v = rng_randrange(1, num_nodes)
+                    b = route_of[v]
+                    j = index_of[v]
+                    if v == u or (a == b and abs(i - j) < 2):
+                        continue
+                    route_b = routes[b]
+                    prev_v = route_b[j - 1] if j > 0 else DEPOT
+                    next_v = route_b[j + 1] if j + 1 < len(route_b) else DEPOT
+                    delta = (dist[prev_u][v] + dist[v][next_u] + dist[prev_v][u] + dist[u][next_v] -
+                             dist[prev_u][u] - dist[u][next_u] - dist[prev_v][v] - dist[v][next_v])
+                    if delta > 0 and rng_random() >= exp(-delta / temperature):
+                        continue
+                    if a == b:
+                        candidate = list(route_a)
+                        candidate[i], candidate[j] = v, u
+                        if not self._route_within_limits(candidate):
+                            continue
+                        routes[a] = candidate
+                        self._refresh_route(a)
+                    else:
+                        shift = demand[v] - demand[u]
+                        if (loads[a] + shift > max(capacity[a], loads[a]) or
+                                loads[b] - shift > max(capacity[b], loads[b])):
+                            continue
+                        if not (self._fits(a, i, v, i + 1) and self._fits(b, j, u, j + 1)):
+                            continue
+                        route_a[i] = v
+                        route_b[j] = u
+                        self._refresh_route(a)
+                        self._refresh_route(b)
+
+                accepted += 1
+                current += delta
+                if current < best - 1e-9:
+                    best = current
+                    best_routes = [list(route) for route in routes]
+
+            temperature *= self.cooling_rate
+            if progress is not None:
+                progress(evaluated, best_routes)
+
+        elapsed = time.perf_counter() - started
+        self.stats = {'evaluated_moves': evaluated, 'accepted_moves': accepted, 'elapsed_seconds': elapsed}
+
+        if optimization_log is not None:
+            rate = evaluated / elapsed if elapsed > 0 else 0
+            optimization_log.append(
+                f"[SA] 評価{evaluated}手 ({rate:,.0f}手/秒), 受理{accepted}手, "
+                f"距離 {initial_distance:.1f}km → {best:.1f}km"
+            )
+        return best_routes
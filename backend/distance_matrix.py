@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+distance_matrix.py - リクエスト単位の距離行列
+石垣島ツアー最適化システム
+
+デポ（アクティビティ地点）・車両出発地・全ピックアップ地点の
+N×N 距離行列を NumPy の一括計算で構築し、各最適化ヘルパーは
+インデックス参照のみで距離を取得する。
+移動時間は問題インスタンス（RoutingProblem）が切り出した距離から計算する。
+
+複数ツアーの一括最適化では、全ツアーの地点（重複は1点）の行列を1回だけ計算し、
+ツアーごとの行列はそこから切り出す（SharedDistanceMatrix）。
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371  # 地球の半径（km）
+
+
+def haversine_cross(from_lats: np.ndarray, from_lngs: np.ndarray,
+                    to_lats: np.ndarray, to_lngs: np.ndarray) -> np.ndarray:
+    """2つの地点集合間のハバーサイン距離行列（km, 行=from, 列=to）を一括計算"""
+    lat1 = np.radians(np.asarray(from_lats, dtype=np.float64))
+    lng1 = np.radians(np.asarray(from_lngs, dtype=np.float64))
+    lat2 = np.radians(np.asarray(to_lats, dtype=np.float64))
+    lng2 = np.radians(np.asarray(to_lngs, dtype=np.float64))
+
+    dlat = lat2[None, :] - lat1[:, None]
+    dlng = lng2[None, :] - lng1[:, None]
+
+    a = (np.sin(dlat / 2) ** 2 +
+         np.cos(lat1)[:, None] * np.cos(lat2)[None, :] *
+         np.sin(dlng / 2) ** 2)
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(np.clip(1 - a, 0, None)))
+
+    return EARTH_RADIUS_KM * c
+
+
+def haversine_matrix(lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """緯度経度配列から全点間のハバーサイン距離行列（km）を一括計算"""
+    return haversine_cross(lats, lngs, lats, lngs)
+
+
+class DistanceMatrix:
+    """
+    デポ・車両出発地・ピックアップ地点の距離行列
+
+    インデックス配置:
+        0           : デポ（アクティビティ地点）
+        1..V        : 車両出発地（vehicles の順）
+        V+1..V+G    : ゲストのピックアップ地点（guests の順）
+    """
+
+    DEPOT = 0
+
+    def __init__(self, activity_location: Dict, vehicles: List[Dict], guests: List[Dict]):
+        lats = [activity_location['lat']]
+        lngs = [activity_location['lng']]
+
+        self.vehicle_index: Dict[str, int] = {}
+        for vehicle in vehicles:
+            self.vehicle_index[vehicle['id']] = len(lats)
+            lats.append(vehicle['location']['lat'])
+            lngs.append(vehicle['location']['lng'])
+
+        self.guest_offset = len(lats)
+        self.guest_index: Dict[str, int] = {}
+        for guest in guests:
+            if guest.get('id') is not None:
+                self.guest_index[guest['id']] = len(lats)
+            lats.append(guest['pickup_lat'])
+            lngs.append(guest['pickup_lng'])
+
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+        self.km = haversine_matrix(self.lats, self.lngs)
+
+        # スカラー参照はPythonリストの方が高速
+        self._rows = self.km.tolist()
+
+    def __getstate__(self):
+        # プロセス間転送時はリスト表現を送らず、受信側で再構築する
+        state = self.__dict__.copy()
+        del state['_rows']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._rows = self.km.tolist()
+
+    @property
+    def size(self) -> int:
+        return len(self._rows)
+
+    def distance(self, i: int, j: int) -> float:
+        """インデックス間の距離（km）"""
+        return self._rows[i][j]
+
+    def row(self, i: int) -> List[float]:
+        """インデックス i から全地点への距離リスト"""
+        return self._rows[i]
+
+    def guest(self, guest: Dict) -> int:
+        """ゲスト（またはルートエントリ）の行列インデックス"""
+        return self.guest_index[guest.get('id', guest.get('guest_id'))]
+
+    def vehicle(self, vehicle: Dict) -> int:
+        """車両出発地の行列インデックス"""
+        return self.vehicle_index[vehicle['id']]
+
+    def subset(self, vehicles: List[Dict], guests: List[Dict]) -> 'DistanceMatrix':
+        """
+        デポ・指定車両・指定ゲストだけの部分行列（距離は再計算せず切り出す）
+
+        プロセス間で受け渡す際に全体行列を転送しないために使う
+        """
+        index = ([self.DEPOT] + [self.vehicle(v) for v in vehicles] +
+                 [self.guest(g) for g in guests])
+        return _slice_matrix(self.lats, self.lngs, self.km, index, vehicles, guests)
+
+    def put_guests(self, guests: List[Dict]) -> None:
+        """
+        ゲストの地点を行列へ反映（既存の距離は再計算せず、該当する行・列のみ計算）
+
+        既存ゲストと同じIDは同じ行・列を新しい地点で上書きし（ピックアップ地点の変更用）、
+        新しいIDだけを末尾に追加する。リスト表現も該当する行・列だけを書き換える
+        """
+        size = self.size
+        for guest in guests:
+            if guest['id'] not in self.guest_index:
+                self.guest_index[guest['id']] = size
+                size += 1
+        positions = [self.guest_index[g['id']] for g in guests]
+
+        grown = size - self.size
+        if grown:
+            self.lats = np.concatenate([self.lats, np.zeros(grown)])
+            self.lngs = np.concatenate([self.lngs, np.zeros(grown)])
+            km = np.zeros((size, size))
+            km[:self.size, :self.size] = self.km
+            self.km = km
+            for row in self._rows:
+                row.extend([0.0] * grown)
+            self._rows.extend([0.0] * size for _ in range(grown))
+
+        self.lats[positions] = [g['pickup_lat'] for g in guests]
+        self.lngs[positions] = [g['pickup_lng'] for g in guests]
+        rows = haversine_cross(self.lats[positions], self.lngs[positions], self.lats, self.lngs)
+        self.km[positions, :] = rows
+        self.km[:, positions] = rows.T
+        for position, row in zip(positions, rows.tolist()):
+            self._rows[position] = row
+            for other, value in enumerate(row):
+                self._rows[other][position] = value
+
+
+def _slice_matrix(lats: np.ndarray, lngs: np.ndarray, km: np.ndarray, index: List[int],
+                  vehicles: List[Dict], guests: List[Dict]) -> DistanceMatrix:
+    """計算済みの行列から DistanceMatrix の配置（デポ・車両・ゲストの順）で切り出す"""
+    sub = DistanceMatrix.__new__(DistanceMatrix)
+    sub.vehicle_index = {v['id']: 1 + k for k, v in enumerate(vehicles)}
+    sub.guest_offset = 1 + len(vehicles)
+    sub.guest_index = {g['id']: sub.guest_offset + k for k, g in enumerate(guests)}
+    sub.lats = lats[index]
+    sub.lngs = lngs[index]
+    sub.km = km[np.ix_(index, index)]
+    sub._rows = sub.km.tolist()
+    return sub
+
+
+class SharedDistanceMatrix:
+    """
+    複数ツアー（アクティビティ地点・車両・ゲスト）の全地点の距離行列
+
+    同じ緯度経度（同じホテル・車庫・アクティビティ地点）は1点にまとめる。
+    ゲスト・車両IDはツアー間で重複しうるため、地点は座標で識別する。
+    """
+
+    def __init__(self, tours: Sequence[Tuple[Dict, List[Dict], List[Dict]]]):
+        self._point_index: Dict[Tuple[float, float], int] = {}
+        self.requested_points = 0
+        for activity_location, vehicles, guests in tours:
+            for point in self._tour_points(activity_location, vehicles, guests):
+                self._point_index.setdefault(point, len(self._point_index))
+                self.requested_points += 1
+
+        points = list(self._point_index)
+        self.lats = np.asarray([lat for lat, _ in points], dtype=np.float64)
+        self.lngs = np.asarray([lng for _, lng in points], dtype=np.float64)
+        self.km = haversine_matrix(self.lats, self.lngs)
+
+    @staticmethod
+    def _tour_points(activity_location: Dict, vehicles: List[Dict], guests: List[Dict]) -> List[Tuple[float, float]]:
+        return ([(activity_location['lat'], activity_location['lng'])] +
+                [(v['location']['lat'], v['location']['lng']) for v in vehicles] +
+                [(g['pickup_lat'], g['pickup_lng']) for g in guests])
+
+    @property
+    def size(self) -> int:
+        return len(self._point_index)
+
+    def for_tour(self, activity_location: Dict, vehicles: List[Dict], guests: List[Dict]) -> DistanceMatrix:
+        """1ツアー分の距離行列（距離は再計算せず切り出す）"""
+        index = [self._point_index[point] for point in self._tour_points(activity_location, vehicles, guests)]
+        return _slice_matrix(self.lats, self.lngs, self.km, index, vehicles, guests)
+
+
+def build_distance_matrix(activity_location: Dict,
+                          vehicles: Optional[List[Dict]] = None,
+                          guests: Optional[List[Dict]] = None) -> DistanceMatrix:
+    """リクエストデータから距離行列を構築"""
+    return DistanceMatrix(activity_location, vehicles or [], guests or [])
@@ -14,17 +14,81 @@ import math
 import random
 import asyncio
 import logging
+import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Tuple, Optional, Any
+from typing import Callable, List, Dict, Tuple, Optional, Any
 from dataclasses import dataclass
 
+import numpy as np
+
+from distance_matrix import DistanceMatrix, build_distance_matrix
+from routing_problem import DEPOT, RoutingProblem
+from genetic_optimizer import GeneticRouteOptimizer
+from annealing_optimizer import SimulatedAnnealingOptimizer
+from local_search import LocalSearchOptimizer
+from insertion_optimizer import InsertionRouteBuilder
+from regret_assignment import AssignmentResult, RegretAssigner
+from savings_optimizer import SavingsRouteBuilder
+from route_workers import VehicleRouteExecutor, cancellation_check
+from solve_budget import CANCELLED, SolveBudget, validate_budget
+from optimization_progress import ProgressReporter
+from tour_plans import TourPlan
+from tour_models import Guest, Stop, Vehicle, VehicleRoute
+
 # ロギング設定
 logger = logging.getLogger(__name__)
 
+# 🆕 race モードのエンジンと時間配分（探索本体, 局所探索）の締切内予算に対する比率
+RACE_TIME_SHARES = {
+    'nearest_neighbor': (0.0, 0.85),
+    'simulated_annealing': (0.6, 0.25),
+    'genetic': (0.6, 0.25)
+}
+# 締切のうちエンジンに割り当てる比率（残りはプロセス間転送・時間決定処理の余裕）
+RACE_BUDGET_RATIO = 0.8
+# 停止要求（クライアント切断等）を確認する間隔（秒）
+RACE_STOP_POLL_SECONDS = 0.1
+
+_TRUE_STRINGS = ('true', '1', 'yes', 'on')
+_FALSE_STRINGS = ('false', '0', 'no', 'off')
+
+
+def _coerce_parameter(default: Any, value: Any) -> Any:
+    """
+    リクエスト指定値を既定値の型に変換
+
+    真偽値は true/false 等の文字列・0/1 を明示的に解釈し（bool("false") は True になるため）、
+    整数は小数部のある値を切り捨てずに拒否する
+
+    Raises:
+        ValueError: 既定値の型として解釈できない値
+    """
+    if default is None:
+        return value
+    if isinstance(default, bool):
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.strip().lower() in _TRUE_STRINGS + _FALSE_STRINGS:
+            return value.strip().lower() in _TRUE_STRINGS
+        if isinstance(value, (int, float)) and value in (0, 1):
+            return bool(value)
+        raise ValueError(value)
+    if isinstance(default, int):
+        if isinstance(value, bool):
+            raise ValueError(value)
+        number = float(value) if isinstance(value, str) else value
+        if isinstance(number, float) and not number.is_integer():
+            raise ValueError(value)
+        return int(number)
+    if isinstance(default, float) and isinstance(value, bool):
+        raise ValueError(value)
+    return type(default)(value)
+
+
 @dataclass
 class OptimizationResult:
     """最適化結果クラス"""
-    routes: List[Dict]
+    routes: List[VehicleRoute]
     total_distance: float
     total_time: int
     efficiency_score: float
@@ -42,6 +106,31 @@ class WeatherImpact:
     comfort_factor: float       # 0-1.0 = 快適度
     activity_recommendation: str
 
+@dataclass
+class WeatherTiming:
+    """
+    リクエスト単位で前計算した気象影響（時間決定処理は停車ごとに再分析せずこれを参照）
+
+    時間帯別予報（weather_data['hourly_forecast']）がある場合は、区間の出発時刻の
+    時間帯の遅延係数を使う。無い場合は全時間帯が同じ気象影響になる
+    """
+    impact: WeatherImpact                    # 全体（現在の気象条件）
+    hourly_impacts: List[WeatherImpact]      # 時間帯(0-23) → 気象影響
+    hourly_summaries: List[Dict[str, Any]]   # 時間帯 → 停車ごとの気象影響（表示用・共有）
+    hourly_recommendations: List[List[str]]  # 時間帯 → 快適性の推奨事項
+    route_summary: Dict[str, Any]            # ルートごとの気象影響概要（表示用・共有）
+    average_speed_kmh: float
+    safety_margin_minutes: int
+    departure_adjustment_minutes: int
+
+    def hour(self, minutes: float) -> int:
+        return int(minutes // 60) % 24
+
+    def travel_minutes(self, distance_km: float, departure_minutes: float) -> int:
+        """気象遅延・安全マージン込みの移動時間（分）"""
+        delay_factor = self.hourly_impacts[self.hour(departure_minutes)].travel_delay_factor
+        return int((distance_km / self.average_speed_kmh) * 60 * delay_factor + self.safety_margin_minutes)
+
 class EnhancedTourOptimizer:
     """
     AI搭載ツアールート最適化クラス（動的時間決定版）
@@ -67,6 +156,59 @@ class EnhancedTourOptimizer:
             'safety_margin_minutes': 15      # 安全マージン
         }
         
+        # 🆕 アルゴリズム別パラメータ（リクエストで上書き可能）
+        self.algorithm_settings = {
+            'genetic': {
+                'population_size': 40,
+                'generations': 75,
+                'crossover_rate': 0.9,
+                'mutation_rate': 0.2,
+                'elite_count': 2,
+                'time_limit_ms': None,
+                'seed': None
+            },
+            'simulated_annealing': {
+                'initial_temperature': 200.0,
+                'cooling_rate': 0.95,
+                'iterations_per_temperature': 500,
+                'min_temperature': 0.01,
+                'time_limit_ms': 1000,
+                'seed': None
+            },
+            # 最近傍法の初期割当（allow_overbooking は全アルゴリズムの定員超過の扱いに共通）
+            'assignment': {
+                'regret_k': 2,
+                'allow_overbooking': False
+            },
+            'insertion': {
+                'strategy': 'regret',
+                'regret_k': 2
+            },
+            # 🆕 複数エンジン同時実行（締切内の最良解、または目標到達で即時返却）
+            'race': {
+                'max_solve_ms': 2000,
+                'target_efficiency_score': None,
+                # 締切までに解が無い場合、停止要求後に解を待つ上限（超えたら節約法の解で代替）
+                'cancel_grace_ms': 1000
+            },
+            # 全アルゴリズム共通の後処理（algorithm_parameters['local_search'] で上書き）
+            'local_search': {
+                'enabled': True,
+                'neighbor_count': 10,
+                'max_segment_length': 3,
+                'time_limit_ms': 500
+            },
+            # 🆕 計画の当日変更時に、変更のあった車両だけに掛けるルート内局所探索
+            'plan_repair': {
+                'neighbor_count': 10,
+                'max_segment_length': 3,
+                'time_limit_ms': 20
+            }
+        }
+        
+        # 🆕 車両別ルート最適化のプロセスプール（起動はアプリ側の startup で行う）
+        self.route_executor = VehicleRouteExecutor()
+        
         logger.info("[OK] EnhancedTourOptimizer 動的時間決定版初期化完了")
 
     def calculate_distance(self, lat1: float, lng1: float, lat2: float, lng2: float) -> float:
@@ -149,6 +291,81 @@ class EnhancedTourOptimizer:
                 activity_recommendation='通常時間帯'
             )
 
+    def _weather_departure_adjustment(self, weather_impact: WeatherImpact) -> int:
+        """気象影響による出発時刻の調整（分）"""
+        if weather_impact.travel_delay_factor > 1.1:
+            # 移動遅延が予想される場合、早め出発
+            return -30  # 30分早める
+        if weather_impact.comfort_factor < 0.6:
+            # 快適度が低い場合、気象条件の良い時間帯に調整
+            if weather_impact.activity_recommendation == "早朝推奨":
+                return -45  # 45分早める
+            if weather_impact.activity_recommendation == "午前推奨":
+                return -15  # 15分早める
+            if weather_impact.activity_recommendation == "午後延期推奨":
+                return +120  # 2時間遅らせる
+        return 0
+
+    def _comfort_recommendations(self, weather_impact: WeatherImpact) -> List[str]:
+        """快適性に基づく推奨事項"""
+        recommendations = []
+        if weather_impact.comfort_factor < 0.7:
+            recommendations.append("休憩時間を長めに取ることを推奨")
+        if weather_impact.wind_speed_kmh > 20:
+            recommendations.append("風が強いため屋内待機時間を考慮")
+        if weather_impact.wave_height_m > 1.5:
+            recommendations.append("海況により活動時間を調整する可能性")
+        return recommendations
+
+    def _weather_impact_summary(self, weather_impact: WeatherImpact) -> Dict[str, Any]:
+        return {
+            'travel_delay_factor': weather_impact.travel_delay_factor,
+            'comfort_factor': weather_impact.comfort_factor,
+            'conditions': {
+                'wind_speed': weather_impact.wind_speed_kmh,
+                'wave_height': weather_impact.wave_height_m,
+                'visibility': weather_impact.visibility_level,
+                'temperature': weather_impact.temperature_c
+            }
+        }
+
+    # 🆕 リクエスト単位の気象影響の前計算
+    def build_weather_timing(self, weather_data: Dict) -> WeatherTiming:
+        """
+        気象分析を1回（時間帯別予報があれば時間帯ごとに1回）だけ行い、時間決定処理用にまとめる
+        """
+        weather_impact = self.analyze_weather_impact(weather_data)
+        hourly_impacts = [weather_impact] * 24
+        for forecast in weather_data.get('hourly_forecast') or []:
+            try:
+                hour = int(str(forecast['hour']).split(':')[0]) % 24
+            except (KeyError, TypeError, ValueError):
+                continue
+            hourly_impacts[hour] = self.analyze_weather_impact({
+                **weather_data,
+                **{key: forecast[key] for key in ('wind_speed', 'wave_height', 'visibility', 'temperature')
+                   if key in forecast}
+            })
+        # 同じ気象影響の時間帯は表示用の辞書も共有する
+        summaries: Dict[int, Tuple[Dict[str, Any], List[str]]] = {}
+        for impact in hourly_impacts:
+            if id(impact) not in summaries:
+                summaries[id(impact)] = (self._weather_impact_summary(impact), self._comfort_recommendations(impact))
+        return WeatherTiming(
+            impact=weather_impact,
+            hourly_impacts=hourly_impacts,
+            hourly_summaries=[summaries[id(impact)][0] for impact in hourly_impacts],
+            hourly_recommendations=[summaries[id(impact)][1] for impact in hourly_impacts],
+            route_summary={
+                'travel_delay_factor': weather_impact.travel_delay_factor,
+                'comfort_factor': weather_impact.comfort_factor,
+                'activity_recommendation': weather_impact.activity_recommendation
+            },
+            average_speed_kmh=self.average_speed_kmh,
+            safety_margin_minutes=self.time_adjustment_settings['safety_margin_minutes'],
+            departure_adjustment_minutes=self._weather_departure_adjustment(weather_impact)
+        )
+
     def _parse_time(self, time_str: str) -> tuple:
         """時間文字列を時・分にパース"""
         try:
@@ -168,251 +385,782 @@ class EnhancedTourOptimizer:
         minute = minutes % 60
         return f"{hour:02d}:{minute:02d}"
 
-    # 🆕 動的出発時間決定システム
-    def calculate_optimal_departure_times(self, guests: List[Dict], weather_data: Dict) -> Dict[str, str]:
+    # 🆕 動的到着時間決定システム
+    def calculate_optimal_arrival_time(self, departure_time: str, distance_km: float, weather_data: Dict,
+                                       timing: Optional[WeatherTiming] = None) -> Dict[str, Any]:
         """
-        ゲストの希望時間と気象情報から最適な出発時間を動的決定
+        出発時間・距離・気象条件から最適な到着時間を動的計算
+
+        timing（前計算済みの気象影響）を渡した場合は気象分析を省略する
         """
-        weather_impact = self.analyze_weather_impact(weather_data)
+        if timing is None:
+            timing = self.build_weather_timing(weather_data)
+        return self._arrival_analysis(timing, self._time_to_minutes(departure_time), distance_km)
+
+    def _arrival_analysis(self, timing: WeatherTiming, departure_minutes: int, distance_km: float) -> Dict[str, Any]:
+        """到着時間の詳細分析（詳細出力を要求された場合のみ停車ごとに構築）"""
+        hour = timing.hour(departure_minutes)
+        weather_impact = timing.hourly_impacts[hour]
         
-        # ゲストの希望時間を収集・分析
-        guest_preferences = []
-        for guest in guests:
-            start_time = guest.get('preferred_pickup_start', '08:30')
-            end_time = guest.get('preferred_pickup_end', '09:00')
-            
-            start_minutes = self._time_to_minutes(start_time)
-            end_minutes = self._time_to_minutes(end_time)
-            
-            # 希望時間範囲の中央値
-            preferred_minutes = (start_minutes + end_minutes) // 2
-            guest_preferences.append({
-                'guest_id': guest.get('id', ''),
-                'guest_name': guest.get('name', ''),
-                'preferred_minutes': preferred_minutes,
-                'flexibility': end_minutes - start_minutes,  # 時間の柔軟性
-                'weight': guest.get('num_people', 1)  # 人数による重み
-            })
+        # 基本移動時間計算
+        base_travel_time_minutes = (distance_km / timing.average_speed_kmh) * 60
         
-        # 重み付き平均で最適時間を計算
-        total_weight = sum(p['weight'] for p in guest_preferences)
-        if total_weight == 0:
-            base_departure_minutes = 9 * 60  # 09:00
-        else:
-            weighted_sum = sum(p['preferred_minutes'] * p['weight'] for p in guest_preferences)
-            base_departure_minutes = weighted_sum // total_weight
+        # 気象による移動時間調整
+        weather_adjusted_time = base_travel_time_minutes * weather_impact.travel_delay_factor
         
-        # 気象影響による調整
-        weather_adjustment = 0
+        # 安全マージン追加
+        safety_margin = timing.safety_margin_minutes
+        total_travel_time = weather_adjusted_time + safety_margin
         
-        if weather_impact.travel_delay_factor > 1.1:
-            # 移動遅延が予想される場合、早め出発
-            weather_adjustment = -30  # 30分早める
-        elif weather_impact.comfort_factor < 0.6:
-            # 快適度が低い場合、気象条件の良い時間帯に調整
-            if weather_impact.activity_recommendation == "早朝推奨":
-                weather_adjustment = -45  # 45分早める
-            elif weather_impact.activity_recommendation == "午前推奨":
-                weather_adjustment = -15  # 15分早める
-            elif weather_impact.activity_recommendation == "午後延期推奨":
-                weather_adjustment = +120  # 2時間遅らせる
+        # 到着時間計算（24時間フォーマット調整）
+        arrival_minutes = (departure_minutes + int(total_travel_time)) % (24 * 60)
         
-        # 最終出発時間決定
-        adjusted_departure_minutes = base_departure_minutes + weather_adjustment
+        return {
+            'arrival_time': self._minutes_to_time(arrival_minutes),
+            'total_travel_time_minutes': int(total_travel_time),
+            'base_travel_time_minutes': int(base_travel_time_minutes),
+            'weather_delay_minutes': int(weather_adjusted_time - base_travel_time_minutes),
+            'safety_margin_minutes': safety_margin,
+            'weather_impact': timing.hourly_summaries[hour],
+            'comfort_recommendations': timing.hourly_recommendations[hour],
+            'activity_suitability': weather_impact.activity_recommendation
+        }
+
+    def _resolve_algorithm_parameters(self, algorithm: str, overrides: Optional[Dict] = None) -> Dict[str, Any]:
+        """アルゴリズム既定パラメータにリクエスト指定値を反映"""
+        parameters = dict(self.algorithm_settings.get(algorithm, {}))
+        for key, value in (overrides or {}).items():
+            if key not in parameters:
+                continue
+            try:
+                parameters[key] = _coerce_parameter(parameters[key], value)
+            except (TypeError, ValueError):
+                raise ValueError(f"無効なパラメータ: {key}={value!r}")
+        return parameters
+
+    def _build_routing_problem(self, guests: List[Dict], vehicles: List[Dict],
+                               activity_location: Dict, weather_impact: WeatherImpact,
+                               distance_matrix: DistanceMatrix) -> RoutingProblem:
+        """ソルバー共通の問題インスタンスを構築（気象遅延・安全マージン込み）"""
+        return RoutingProblem(
+            guests, vehicles, activity_location, distance_matrix,
+            average_speed_kmh=self.average_speed_kmh,
+            delay_factor=weather_impact.travel_delay_factor,
+            margin_minutes=self.time_adjustment_settings['safety_margin_minutes']
+        )
+
+    def _solve_genetic(self, problem: RoutingProblem, parameters: Dict[str, Any],
+                       optimization_log: List[str], budget: SolveBudget,
+                       reporter: Optional[ProgressReporter] = None) -> List[List[int]]:
+        """遺伝的アルゴリズムで配車と巡回順を同時決定"""
+        optimization_log.append(
+            f"[GENETIC] 遺伝的アルゴリズム開始: 集団{parameters['population_size']}, "
+            f"世代{parameters['generations']}"
+        )
+        # 希望時間順（従来の並び）と節約法の解を初期集団に含める
+        time_order = sorted(
+            range(1, problem.num_guests + 1),
+            key=lambda node: problem.tw_start_list[node]
+        )
+        savings = SavingsRouteBuilder(problem)
+        savings_order = [node for route in savings.build() for node in route] + savings.unassigned
+        engine = GeneticRouteOptimizer(problem, max_iterations=budget.max_iterations, **parameters)
+        progress = None
+        if reporter:
+            generations = min(engine.generations, budget.max_iterations or engine.generations)
+            progress = reporter.stage('genetic', problem, generations)
+        routes = engine.solve(seeds=[time_order, savings_order], optimization_log=optimization_log,
+                              should_stop=budget.should_stop, progress=progress)
+        budget.record('genetic', engine.stop_reason)
         
-        # 安全時間帯に調整（06:00-18:00の範囲内）
-        adjusted_departure_minutes = max(6 * 60, min(18 * 60, adjusted_departure_minutes))
+        cost = problem.evaluate(routes)
+        optimization_log.append(
+            f"[GENETIC] 距離{cost.distance:.1f}km, 希望時間超過{cost.lateness_minutes:.0f}分, "
+            f"定員超過{cost.overflow_people}名"
+        )
+        return routes
+
+    def _solve_savings(self, problem: RoutingProblem,
+                       optimization_log: List[str]) -> List[List[int]]:
+        """Clarke-Wright 節約法でルートを構築"""
+        routes = SavingsRouteBuilder(problem).build(optimization_log)
         
-        optimal_departure_time = self._minutes_to_time(adjusted_departure_minutes)
+        cost = problem.evaluate(routes)
+        optimization_log.append(
+            f"[SAVINGS] 距離{cost.distance:.1f}km, 希望時間超過{cost.lateness_minutes:.0f}分, "
+            f"定員超過{cost.overflow_people}名"
+        )
+        return routes
+
+    def _solve_simulated_annealing(self, problem: RoutingProblem, parameters: Dict[str, Any],
+                                   optimization_log: List[str], budget: SolveBudget,
+                                   reporter: Optional[ProgressReporter] = None) -> List[List[int]]:
+        """シミュレーテッドアニーリングで節約法の初期解を改善"""
+        optimization_log.append(
+            f"[SA] シミュレーテッドアニーリング開始: 初期温度{parameters['initial_temperature']}, "
+            f"冷却率{parameters['cooling_rate']}, 時間予算{parameters['time_limit_ms']}ms"
+        )
+        savings = SavingsRouteBuilder(problem)
+        initial_routes = savings.build(optimization_log)
+        if reporter:
+            reporter.incumbent('savings', problem, initial_routes)
+        # 節約法で乗り切らなかったゲストを除いた部分問題で改善（未割当は呼び出し側でまとめて報告）
+        seated = problem
+        if savings.unassigned:
+            kept = sorted(node for route in initial_routes for node in route)
+            renumber = {node: k for k, node in enumerate(kept, start=1)}
+            seated = problem.guest_subproblem(kept)
+            initial_routes = [[renumber[node] for node in route] for route in initial_routes]
+        engine = SimulatedAnnealingOptimizer(seated, max_iterations=budget.max_iterations, **parameters)
+        routes = engine.solve(initial_routes, optimization_log=optimization_log, should_stop=budget.should_stop,
+                              progress=reporter.stage('simulated_annealing', seated) if reporter else None)
+        budget.record('simulated_annealing', engine.stop_reason)
+        if savings.unassigned:
+            routes = [[kept[node - 1] for node in route] for route in routes]
+        return routes
+
+    def _solve_insertion(self, problem: RoutingProblem, parameters: Dict[str, Any],
+                         optimization_log: List[str]) -> List[List[int]]:
+        """時間枠付き挿入法（VRPTW）でルートを構築"""
+        engine = InsertionRouteBuilder(problem, **parameters)
+        routes = engine.build(optimization_log)
         
-        return {
-            'optimal_departure_time': optimal_departure_time,
-            'base_time': self._minutes_to_time(base_departure_minutes),
-            'weather_adjustment_minutes': weather_adjustment,
-            'weather_reason': weather_impact.activity_recommendation,
-            'guest_preference_average': self._minutes_to_time(base_departure_minutes),
-            'flexibility_analysis': {
-                'high_flexibility_guests': len([p for p in guest_preferences if p['flexibility'] > 60]),
-                'low_flexibility_guests': len([p for p in guest_preferences if p['flexibility'] <= 30]),
-                'total_guests': len(guest_preferences)
-            }
-        }
+        cost = problem.evaluate(routes)
+        optimization_log.append(
+            f"[INSERTION] 距離{cost.distance:.1f}km, 希望時間超過{cost.lateness_minutes:.0f}分, "
+            f"定員超過{cost.overflow_people}名"
+        )
+        return routes
 
-    # 🆕 動的到着時間決定システム
-    def calculate_optimal_arrival_time(self, departure_time: str, distance_km: float, weather_data: Dict) -> Dict[str, Any]:
+    def _release_unseated(self, problem: RoutingProblem, routes: List[List[int]],
+                          optimization_log: List[str],
+                          allow_overbooking: bool = False) -> Tuple[RoutingProblem, List[List[int]], List[Dict]]:
         """
-        出発時間・距離・気象条件から最適な到着時間を動的計算
+        定員を超えた車両からゲストを降ろし、どの車両にも載っていないゲストと合わせて未割当にする
+
+        降ろすのは超過分以上の人数で最小の組（無ければ最大の組）から。
+        allow_overbooking=True の場合は定員超過をそのまま残す
+
+        Returns:
+            (未割当ゲストを除いた問題インスタンス, そのノード番号でのルート, 未割当ゲスト)
         """
-        weather_impact = self.analyze_weather_impact(weather_data)
+        demand = problem.demand_list
+        routes = [list(route) for route in routes]
+        if not allow_overbooking:
+            for vehicle_position, route in enumerate(routes):
+                capacity = problem.capacity_list[vehicle_position]
+                excess = problem.route_load(route) - capacity
+                while excess > 0:
+                    enough = [node for node in route if demand[node] >= excess]
+                    node = (min(enough, key=lambda n: demand[n]) if enough
+                            else max(route, key=lambda n: demand[n]))
+                    route.remove(node)
+                    excess -= demand[node]
+                    guest = problem.guests[node - 1]
+                    optimization_log.append(
+                        f"[CAPACITY] {problem.vehicles[vehicle_position]['name']}の定員({capacity}名)超過のため"
+                        f"未割当: {guest['name']} ({guest['num_people']}名)"
+                    )
+
+        seated = {node for route in routes for node in route}
+        unseated = [node for node in range(1, problem.num_guests + 1) if node not in seated]
+        if not unseated:
+            return problem, routes, []
+
+        optimization_log.append(
+            f"[CAPACITY] 定員内に乗れないゲスト: {len(unseated)}組 "
+            f"({sum(demand[node] for node in unseated)}名)"
+        )
+        kept = sorted(seated)
+        renumber = {node: k for k, node in enumerate(kept, start=1)}
+        return (problem.guest_subproblem(kept),
+                [[renumber[node] for node in route] for route in routes],
+                [problem.guests[node - 1] for node in unseated])
+
+    def _improve_with_local_search(self, problem: RoutingProblem,
+                                   routes: List[List[int]],
+                                   parameters: Dict[str, Any],
+                                   optimization_log: List[str],
+                                   budget: SolveBudget,
+                                   reporter: Optional[ProgressReporter] = None) -> List[List[int]]:
+        """構築済みルートに 2-opt / Or-opt / cross-exchange を適用（締切到達済みなら省略）"""
+        if not parameters.pop('enabled', True):
+            optimization_log.append("[LOCAL] 局所探索: 無効")
+            return routes
+        if budget.should_stop():
+            budget.skip('local_search')
+            optimization_log.append("[LOCAL] 局所探索: 締切到達または停止要求のため省略")
+            return routes
+        engine = LocalSearchOptimizer(problem, max_iterations=budget.max_iterations, **parameters)
+        if reporter:
+            reporter.incumbent('construction', problem, routes)
+        routes = engine.improve(routes, optimization_log, budget.should_stop,
+                                reporter.stage('local_search', problem) if reporter else None)
+        budget.record('local_search', engine.stop_reason)
+        return routes
+
+    # 🆕 複数エンジン同時実行（race モード）
+    def _race_engine_parameters(self, engine: str, algorithm_parameters: Dict,
+                                budget_ms: float) -> Dict[str, Any]:
+        """race の各エンジンへ渡すパラメータ（締切内に収まる時間予算を設定）"""
+        parameters = {k: v for k, v in algorithm_parameters.items() if k not in self.algorithm_settings['race']}
+        local_search = parameters.get('local_search')
+        if isinstance(local_search, bool):
+            local_search = {'enabled': local_search}
+        local_search = dict(local_search or {})
         
-        # 基本移動時間計算
-        base_travel_time_minutes = (distance_km / self.average_speed_kmh) * 60
+        search_share, local_share = RACE_TIME_SHARES[engine]
+        if search_share:
+            parameters['time_limit_ms'] = int(budget_ms * search_share)
+        local_search['time_limit_ms'] = int(budget_ms * local_share)
+        parameters['local_search'] = local_search
+        return parameters
+
+    def _race_rank(self, result: Dict) -> tuple:
+        """race の優劣（未割当ゲスト数 → 評価値の順に小さい方が良い）"""
+        return (len(result.get('unassigned_guests', [])), result['solution_quality']['cost'])
+
+    async def _optimize_race(self, guests: List[Dict], vehicles: List[Dict],
+                             activity_location: Dict, activity_start_time: str,
+                             weather_data: Optional[Dict],
+                             algorithm_parameters: Optional[Dict],
+                             max_solve_ms: Optional[int] = None,
+                             max_iterations: Optional[int] = None,
+                             verbose_timing: bool = False,
+                             should_stop: Optional[Callable[[], bool]] = None) -> Dict:
+        """
+        最近傍法+局所探索・SA・GA を共通の距離行列でワーカープロセスに同時投入し、
+        目標効率スコアに最初に到達した解、または締切（max_solve_ms）時点の最良解を返す。
+        決着後に残ったエンジンには停止要求を送り、その結果は破棄する。
+        リクエストの max_solve_ms が指定されていれば race 設定の締切より優先する。
+        should_stop が True を返した場合（クライアント切断等）も全エンジンへ停止要求を送る。
+        """
+        self.performance_stats['total_optimizations'] += 1
+        algorithm_parameters = algorithm_parameters or {}
+        settings = self._resolve_algorithm_parameters('race', algorithm_parameters)
+        validate_budget(max_solve_ms, max_iterations)
+        max_solve_ms = max(100, int(max_solve_ms if max_solve_ms is not None else settings['max_solve_ms']))
+        target = settings['target_efficiency_score']
+        target = float(target) if target is not None else None
         
-        # 気象による移動時間調整
-        weather_adjusted_time = base_travel_time_minutes * weather_impact.travel_delay_factor
+        race_log = [
+            f"[RACE] 同時実行開始: {', '.join(RACE_TIME_SHARES)} (締切{max_solve_ms}ms"
+            + (f", 目標効率{target:.1f}%)" if target is not None else ")")
+        ]
+        distance_matrix = build_distance_matrix(activity_location, vehicles, guests)
+        race_log.append(f"[MATRIX] 距離行列構築: {distance_matrix.size}×{distance_matrix.size}（全エンジンで共有）")
         
-        # 安全マージン追加
-        safety_margin = self.time_adjustment_settings['safety_margin_minutes']
-        total_travel_time = weather_adjusted_time + safety_margin
+        executor = self.route_executor
+        budget_ms = max_solve_ms * RACE_BUDGET_RATIO
+        slot = executor.open_cancel_slot()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max_solve_ms / 1000
+        tasks = {
+            asyncio.ensure_future(executor.run(
+                run_optimization_in_worker,
+                guests, vehicles, activity_location, activity_start_time, engine, weather_data,
+                self._race_engine_parameters(engine, algorithm_parameters, budget_ms),
+                distance_matrix, slot, None, max_iterations, verbose_timing
+            )): engine
+            for engine in RACE_TIME_SHARES
+        }
         
-        # 到着時間計算
-        departure_minutes = self._time_to_minutes(departure_time)
-        arrival_minutes = departure_minutes + int(total_travel_time)
+        entries: Dict[str, Dict[str, Any]] = {}
+        best = None       # (エンジン, 結果)
+        winner = None     # 目標到達の最初の解
         
-        # 24時間フォーマット調整
-        if arrival_minutes >= 24 * 60:
-            arrival_minutes = arrival_minutes % (24 * 60)
+        def record(task) -> None:
+            nonlocal best, winner
+            engine = tasks[task]
+            try:
+                result = task.result()
+            except Exception as e:
+                entries[engine] = {'status': 'error', 'error': str(e)}
+                race_log.append(f"[RACE] {engine}: エラー {e}")
+                return
+            quality = result['solution_quality']
+            entries[engine] = {
+                'status': 'finished',
+                'efficiency_score': result['efficiency_score'],
+                'total_distance': result['total_distance'],
+                'cost': quality['cost'],
+                'lateness_minutes': quality['lateness_minutes'],
+                'overflow_people': quality['overflow_people'],
+                'unassigned_count': len(result.get('unassigned_guests', [])),
+                'optimization_time': result['optimization_time']
+            }
+            race_log.append(
+                f"[RACE] {engine}: 評価値{quality['cost']:.1f}, 距離{result['total_distance']}km, "
+                f"効率{result['efficiency_score']:.1f}%, {result['optimization_time'] * 1000:.0f}ms"
+            )
+            if best is None or self._race_rank(result) < self._race_rank(best[1]):
+                best = (engine, result)
+            reached = (target is not None and not result.get('unassigned_guests') and
+                       result['efficiency_score'] >= target)
+            if reached and (winner is None or self._race_rank(result) < self._race_rank(winner[1])):
+                winner = (engine, result)
         
-        arrival_time = self._minutes_to_time(arrival_minutes)
+        pending = set(tasks)
+        cancelled = False
+        while pending and winner is None:
+            if should_stop is not None and should_stop():
+                cancelled = True
+                race_log.append("[RACE] 外部からの停止要求 → 全エンジンへ停止要求")
+                break
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            if should_stop is not None:
+                timeout = min(timeout, RACE_STOP_POLL_SECONDS)
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                record(task)
         
-        # 快適性に基づく推奨事項
-        comfort_recommendations = []
-        if weather_impact.comfort_factor < 0.7:
-            comfort_recommendations.append("休憩時間を長めに取ることを推奨")
-        if weather_impact.wind_speed_kmh > 20:
-            comfort_recommendations.append("風が強いため屋内待機時間を考慮")
-        if weather_impact.wave_height_m > 1.5:
-            comfort_recommendations.append("海況により活動時間を調整する可能性")
+        # 残りのエンジンへ停止要求（探索を打ち切り、その時点の解を返して終了する）
+        executor.cancel(slot)
+        grace_expired = False
+        if best is None and pending:
+            race_log.append("[RACE] 締切までに完了したエンジンなし → 停止要求後の最初の解を採用")
+            grace_ms = max(0, int(settings['cancel_grace_ms']))
+            grace_deadline = loop.time() + grace_ms / 1000
+            while best is None and pending:
+                timeout = grace_deadline - loop.time()
+                if timeout <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    record(task)
+            grace_expired = best is None and bool(pending)
+            if grace_expired:
+                race_log.append(f"[RACE] 停止要求後{grace_ms}ms以内に解が返らず → 節約法の解で代替")
+        for task in pending:
+            entries[tasks[task]] = {'status': 'cancelled'}
+        executor.release_cancel_slot_when_done(pending, slot)
+        
+        if grace_expired:
+            # 停止しないエンジンは待たず、同一プロセスで構築法のみの解を返す
+            best = ('savings', await self.optimize_multi_vehicle_routes(
+                guests, vehicles, activity_location, activity_start_time, 'savings', weather_data,
+                {'local_search': False}, distance_matrix=distance_matrix, verbose_timing=verbose_timing
+            ))
+        if best is None:
+            raise RuntimeError("race: 全エンジンの実行に失敗しました")
+        
+        engine, result = winner or best
+        if winner:
+            decided_by = 'target'
+        elif grace_expired:
+            decided_by = 'fallback'
+        else:
+            decided_by = 'cancelled' if cancelled else ('deadline' if pending else 'completed')
+        reason = {'target': '目標到達', 'cancelled': '停止要求時点の最良解', 'deadline': '締切時点の最良解',
+                  'completed': '全エンジン完了後の最良解', 'fallback': '停止猶予切れの代替解'}[decided_by]
+        race_log.append(f"[RACE] 採用: {engine} ({reason}, 停止 {len(pending)}エンジン)")
+        
+        self.performance_stats['successful_optimizations'] += 1
+        result = dict(result)
+        result['algorithm_used'] = 'race_dynamic_timing'
+        result['optimization_log'] = race_log + result['optimization_log']
+        result['solve_status'] = dict(result['solve_status'],
+                                      cut_short=result['solve_status']['cut_short'] or decided_by in ('deadline', 'cancelled', 'fallback'),
+                                      max_solve_ms=max_solve_ms)
+        if cancelled:
+            result['solve_status']['stages'] = dict(result['solve_status']['stages'], race=CANCELLED)
+        result['race_summary'] = {
+            'winner': engine,
+            'decided_by': decided_by,
+            'max_solve_ms': max_solve_ms,
+            'target_efficiency_score': target,
+            'engines': {name: entries.get(name, {'status': 'cancelled'}) for name in RACE_TIME_SHARES}
+        }
+        return result
+
+    async def _build_vehicle_route(self, vehicle: Dict, problem: RoutingProblem, route: List[int],
+                                   activity_location: Dict, timing: WeatherTiming,
+                                   optimization_log: List[str],
+                                   preserve_order: bool = True,
+                                   verbose: bool = False) -> VehicleRoute:
+        """1台分のルート結果（停車・時刻・距離・効率）を構築"""
+        passenger_count = problem.route_load(route)
+        optimization_log.append(f"[VEHICLE] {vehicle['name']}: {len(route)}組 ({passenger_count}名)")
+        
+        # 🆕 動的時間決定ルート最適化
+        stops, route_distance, route_time, final_arrival_minutes, final_arrival_analysis = \
+            await self._optimize_route_with_dynamic_timing(
+                problem, route, activity_location, timing, optimization_log,
+                preserve_order=preserve_order, verbose=verbose
+            )
+        optimization_log.append(f"[RESULT] {vehicle['name']}: 距離{route_distance:.1f}km, 時間{route_time}分")
         
+        return VehicleRoute(
+            vehicle=Vehicle.from_dict(vehicle),
+            stops=stops,
+            distance_km=route_distance,
+            estimated_time=route_time,
+            passenger_count=passenger_count,
+            efficiency_score=self._calculate_route_efficiency(stops, vehicle['capacity'], route_distance),
+            weather_impact_summary=timing.route_summary,
+            final_arrival_minutes=final_arrival_minutes,
+            activity_location=activity_location,
+            final_arrival_analysis=final_arrival_analysis
+        )
+
+    # 🆕 計画の当日変更（ゲスト追加・キャンセル・変更）
+    async def create_plan(self, plan_id: str, guests: List[Dict], vehicles: List[Dict],
+                          activity_location: Dict, activity_start_time: str,
+                          algorithm: str = 'nearest_neighbor',
+                          weather_data: Optional[Dict] = None,
+                          algorithm_parameters: Optional[Dict] = None,
+                          max_solve_ms: Optional[int] = None,
+                          max_iterations: Optional[int] = None) -> Tuple[TourPlan, Dict]:
+        """
+        通常の最適化で計画を作成し、以降の変更に使うルート・距離行列を保持する
+
+        Returns:
+            (計画, optimize_multi_vehicle_routes の結果)
+        """
+        distance_matrix = build_distance_matrix(activity_location, vehicles, guests)
+        result = await self.optimize_multi_vehicle_routes(
+            guests, vehicles, activity_location, activity_start_time, algorithm,
+            weather_data, algorithm_parameters, distance_matrix,
+            max_solve_ms=max_solve_ms, max_iterations=max_iterations
+        )
+        # race はワーカー側で行列を構築するため、保持用の行列はここで構築したものを使う
+        rendered = {route.vehicle_id: route for route in result['routes']}
+        plan = TourPlan(
+            plan_id=plan_id,
+            algorithm=algorithm,
+            activity_location=activity_location,
+            activity_start_time=activity_start_time,
+            weather_data=result['weather_summary']['conditions'],
+            vehicles=vehicles,
+            guests={guest['id']: guest for guest in guests},
+            routes=[rendered[v['id']].guest_ids() if v['id'] in rendered else [] for v in vehicles],
+            unassigned=[guest['guest_id'] for guest in result.get('unassigned_guests', [])],
+            distance_matrix=distance_matrix,
+            rendered=rendered
+        )
+        plan.route_distances = {vehicle_id: route.distance_km for vehicle_id, route in rendered.items()}
+        return plan, result
+
+    def _plan_problem(self, plan: TourPlan, extra_guests: Optional[List[Dict]] = None):
+        """
+        計画のルート上のゲスト（+ 追加ゲスト）で問題インスタンスを構築
+
+        Returns:
+            (問題インスタンス, 車両順のノード番号ルート, 前計算済みの気象影響)
+        """
+        timing = self.build_weather_timing(plan.weather_data)
+        problem = self._build_routing_problem(
+            plan.routed_guests() + list(extra_guests or []), plan.vehicles,
+            plan.activity_location, timing.impact, plan.distance_matrix
+        )
+        routes = [[problem.node_of[guest_id] for guest_id in route] for route in plan.routes]
+        return problem, routes, timing
+
+    def _repair_plan_routes(self, problem: RoutingProblem, routes: List[List[int]],
+                            vehicle_positions: set) -> None:
+        """変更のあった車両だけルート内局所探索（2-opt / Or-opt）で巡回順を整える"""
+        parameters = self._resolve_algorithm_parameters('plan_repair')
+        for position in vehicle_positions:
+            route = routes[position]
+            if len(route) < 3:
+                continue
+            sub = problem.vehicle_subproblem(position, route)
+            sub_route = LocalSearchOptimizer(sub, **parameters).improve([list(range(1, len(route) + 1))])[0]
+            routes[position] = [route[node - 1] for node in sub_route]
+
+    def _insert_plan_guests(self, problem: RoutingProblem, routes: List[List[int]],
+                            nodes: List[int], optimization_log: List[str]) -> Tuple[List[List[int]], List[int]]:
+        """
+        空き定員のある車両へ1組ずつ最安挿入（挿入のたびに積載を更新し、定員に入らないゲストは未割当のまま返す）
+
+        Returns:
+            (挿入後のルート, 挿入できなかったノード)
+        """
+        if not nodes:
+            return routes, []
+        routes, relaxed, rejected = InsertionRouteBuilder(problem, strategy='cheapest').insert(routes, nodes)
+        for node in relaxed:
+            optimization_log.append(
+                f"[PLAN] {problem.guests[node - 1]['name']}: 時間枠内の挿入位置が無いため緩和配置"
+            )
+        return routes, rejected
+
+    async def _apply_plan_routes(self, plan: TourPlan, problem: RoutingProblem,
+                                 routes: List[List[int]], timing: WeatherTiming,
+                                 optimization_log: List[str]) -> List[str]:
+        """新しいルートを計画へ反映し、巡回順が変わった車両だけ表示用ルートを再構築"""
+        new_routes = [[problem.guests[node - 1]['id'] for node in route] for route in routes]
+        changed = []
+        for vehicle, route, old_route, new_route in zip(plan.vehicles, routes, plan.routes, new_routes):
+            vehicle_id = vehicle['id']
+            # 地点・希望時間の変わったゲストを含む車両は順序が同じでも再構築
+            if old_route == new_route and vehicle_id not in plan.stale_vehicles:
+                continue
+            changed.append(vehicle_id)
+            if not new_route:
+                plan.rendered.pop(vehicle_id, None)
+                plan.route_distances.pop(vehicle_id, None)
+                continue
+            route_result = await self._build_vehicle_route(
+                vehicle, problem, route, plan.activity_location, timing, optimization_log
+            )
+            plan.rendered[vehicle_id] = route_result
+            plan.route_distances[vehicle_id] = route_result.distance_km
+        plan.routes = new_routes
+        plan.stale_vehicles.clear()
+        return changed
+
+    def plan_result(self, plan: TourPlan, optimization_log: Optional[List[str]] = None,
+                    changed_vehicles: Optional[List[str]] = None) -> Dict:
+        """計画の現在のルートを最適化結果と同じ形式で返す"""
+        problem, routes, _ = self._plan_problem(plan)
+        solution_cost = problem.evaluate(routes)
+        route_results = [plan.rendered[v['id']] for v in plan.vehicles if v['id'] in plan.rendered]
         return {
-            'arrival_time': arrival_time,
-            'total_travel_time_minutes': int(total_travel_time),
-            'base_travel_time_minutes': int(base_travel_time_minutes),
-            'weather_delay_minutes': int(weather_adjusted_time - base_travel_time_minutes),
-            'safety_margin_minutes': safety_margin,
-            'weather_impact': {
-                'travel_delay_factor': weather_impact.travel_delay_factor,
-                'comfort_factor': weather_impact.comfort_factor,
-                'conditions': {
-                    'wind_speed': weather_impact.wind_speed_kmh,
-                    'wave_height': weather_impact.wave_height_m,
-                    'visibility': weather_impact.visibility_level,
-                    'temperature': weather_impact.temperature_c
-                }
+            'plan': plan.summary(),
+            'routes': route_results,
+            'total_distance': round(sum(plan.route_distances.values()), 1),
+            'total_time': max((route.estimated_time for route in route_results), default=0),
+            'efficiency_score': self._calculate_overall_efficiency(
+                [route.total_distance for route in route_results],
+                [route.passenger_count for route in route_results],
+                list(plan.guests.values()), plan.vehicles
+            ),
+            'algorithm_used': f'{plan.algorithm}_dynamic_timing',
+            'optimization_log': optimization_log or [],
+            'changed_vehicles': changed_vehicles or [],
+            'solution_quality': {
+                'distance_km': round(solution_cost.distance, 2),
+                'lateness_minutes': round(solution_cost.lateness_minutes, 1),
+                'overflow_people': solution_cost.overflow_people,
+                'cost': round(solution_cost.cost, 2)
             },
-            'comfort_recommendations': comfort_recommendations,
-            'activity_suitability': weather_impact.activity_recommendation
+            'unassigned_guests': [
+                {
+                    'guest_id': guest_id,
+                    'name': plan.guests[guest_id]['name'],
+                    'num_people': plan.guests[guest_id]['num_people'],
+                    'reason': 'capacity_exceeded'
+                }
+                for guest_id in plan.unassigned
+            ]
         }
 
+    async def add_plan_guest(self, plan: TourPlan, guest: Dict) -> Dict:
+        """ゲスト追加: 既存ルートへの最安挿入 + 挿入先車両のルート内局所探索"""
+        optimization_log = []
+        changed = await self._add_plan_guest(plan, guest, optimization_log)
+        plan.touch()
+        return self.plan_result(plan, optimization_log, changed)
+
+    async def remove_plan_guest(self, plan: TourPlan, guest_id: str) -> Dict:
+        """ゲストキャンセル: 停車を除去して前後を直結し、ルート内局所探索で整える"""
+        optimization_log = []
+        changed = await self._remove_plan_guest(plan, guest_id, optimization_log)
+        plan.touch()
+        return self.plan_result(plan, optimization_log, changed)
+
+    async def update_plan_guest(self, plan: TourPlan, guest_id: str, changes: Dict) -> Dict:
+        """
+        ゲスト変更: 人数・地点・希望時間の変更はキャンセル + 追加として再配置し、
+        名前・ホテル名のみの変更はルートを変えずに反映する
+        """
+        guest = dict(plan.guests[guest_id], **changes)
+        optimization_log = []
+        routing_fields = ('pickup_lat', 'pickup_lng', 'num_people', 'preferred_pickup_start', 'preferred_pickup_end')
+        if all(guest[key] == plan.guests[guest_id][key] for key in routing_fields):
+            optimization_log.append(f"[PLAN] ゲスト情報更新: {guest['name']}（ルート変更なし）")
+            plan.guests[guest_id] = guest
+            position = plan.vehicle_position(guest_id)
+            if position is not None:
+                plan.stale_vehicles.add(plan.vehicles[position]['id'])
+            problem, routes, timing = self._plan_problem(plan)
+            changed = await self._apply_plan_routes(plan, problem, routes, timing, optimization_log)
+        else:
+            changed = set(await self._remove_plan_guest(plan, guest_id, optimization_log))
+            changed |= set(await self._add_plan_guest(plan, guest, optimization_log))
+            changed = [v['id'] for v in plan.vehicles if v['id'] in changed]
+        plan.touch()
+        return self.plan_result(plan, optimization_log, changed)
+
+    async def _add_plan_guest(self, plan: TourPlan, guest: Dict, optimization_log: List[str]) -> List[str]:
+        optimization_log.append(f"[PLAN] ゲスト追加: {guest['name']} ({guest['num_people']}名)")
+        # 地点が行列に無い（または変更された）場合のみ、その行・列を計算
+        matrix = plan.distance_matrix
+        index = matrix.guest_index.get(guest['id'])
+        if index is None or (matrix.lats[index], matrix.lngs[index]) != (guest['pickup_lat'], guest['pickup_lng']):
+            matrix.put_guests([guest])
+        plan.guests[guest['id']] = guest
+        
+        problem, routes, timing = self._plan_problem(plan, [guest])
+        node = problem.num_guests
+        routes, rejected = self._insert_plan_guests(problem, routes, [node], optimization_log)
+        if rejected:
+            plan.unassigned.append(guest['id'])
+            optimization_log.append(f"[PLAN] {guest['name']}: 空き定員のある車両が無いため未割当")
+        else:
+            position = next(r for r, route in enumerate(routes) if node in route)
+            self._repair_plan_routes(problem, routes, {position})
+            optimization_log.append(f"[PLAN] {guest['name']} → {plan.vehicles[position]['name']}")
+        
+        return await self._apply_plan_routes(plan, problem, routes, timing, optimization_log)
+
+    async def _remove_plan_guest(self, plan: TourPlan, guest_id: str, optimization_log: List[str]) -> List[str]:
+        """停車を除去し、空いた定員に入る未割当ゲストがいれば続けて挿入する"""
+        guest = plan.guests[guest_id]
+        optimization_log.append(f"[PLAN] キャンセル: {guest['name']} ({guest['num_people']}名)")
+        if guest_id in plan.unassigned:
+            plan.unassigned.remove(guest_id)
+            del plan.guests[guest_id]
+            return []
+        
+        position = plan.vehicle_position(guest_id)
+        waiting = [plan.guests[waiting_id] for waiting_id in plan.unassigned]
+        problem, routes, timing = self._plan_problem(plan, waiting)
+        routes[position].remove(problem.node_of[guest_id])
+        touched = {position}
+        
+        # 空いた定員で未割当ゲストを救済
+        if waiting:
+            routes, rejected = self._insert_plan_guests(
+                problem, routes, [problem.node_of[g['id']] for g in waiting], optimization_log
+            )
+            rejected_ids = {problem.guests[node - 1]['id'] for node in rejected}
+            for waiting_guest in waiting:
+                if waiting_guest['id'] in rejected_ids:
+                    continue
+                node = problem.node_of[waiting_guest['id']]
+                r = next(r for r, route in enumerate(routes) if node in route)
+                plan.unassigned.remove(waiting_guest['id'])
+                touched.add(r)
+                optimization_log.append(f"[PLAN] 未割当から配置: {waiting_guest['name']} → {plan.vehicles[r]['name']}")
+        
+        self._repair_plan_routes(problem, routes, touched)
+        del plan.guests[guest_id]
+        return await self._apply_plan_routes(plan, problem, routes, timing, optimization_log)
+
     # 🆕 時間制約を考慮したルート最適化（気象対応版）
-    async def _optimize_route_with_dynamic_timing(self, assigned_guests: List[Dict], 
+    def _departure_minutes(self, problem: RoutingProblem, nodes: np.ndarray, timing: WeatherTiming) -> int:
+        """
+        🆕 動的出発時間決定: 乗車人数で重み付けした希望時間帯の中央値 + 気象調整
+        （06:00-18:00 に制限、ゲストがいなければ 09:00 基準）
+        """
+        preferred = (problem.tw_start[nodes].astype(np.int64) + problem.tw_end[nodes].astype(np.int64)) // 2
+        weights = problem.demand[nodes]
+        total_weight = int(weights.sum())
+        base_minutes = int(preferred @ weights) // total_weight if total_weight else 9 * 60
+        return max(6 * 60, min(18 * 60, base_minutes + timing.departure_adjustment_minutes))
+
+    async def _optimize_route_with_dynamic_timing(self, problem: RoutingProblem,
+                                                route: List[int],
                                                 activity_location: Dict, 
-                                                weather_data: Dict,
-                                                optimization_log: List[str]) -> List[Dict]:
+                                                timing: WeatherTiming,
+                                                optimization_log: List[str],
+                                                preserve_order: bool = False,
+                                                verbose: bool = False
+                                                ) -> Tuple[List[Stop], float, int, int, Optional[Dict[str, Any]]]:
         """
         動的時間決定システムを使用したルート最適化
+        
+        時刻は問題インスタンスの配列（希望時間帯の分・区間距離）から整数の分で計算する
+        preserve_order=True の場合はソルバーが決めた巡回順をそのまま使う
+        verbose=True の場合は停車ごと・目的地の到着時間分析（arrival_analysis）を含める
+        
+        Returns:
+            (停車リスト, ルート距離 km, 最初のピックアップから目的地到着までの分,
+             目的地到着（分）, 目的地の到着時間分析)
         """
         optimization_log.append("[TIMING] 動的時間決定システム開始")
         
-        # 最適出発時間決定
-        departure_analysis = self.calculate_optimal_departure_times(assigned_guests, weather_data)
-        optimal_departure = departure_analysis['optimal_departure_time']
+        # ゲストを希望時間順にソート（調整版）
+        if not preserve_order:
+            route = sorted(route, key=problem.tw_start_list.__getitem__)
+        nodes = np.asarray(route, dtype=np.int64)
         
-        optimization_log.append(f"[TIMING] 最適出発時間: {optimal_departure}")
-        optimization_log.append(f"[TIMING] 気象調整: {departure_analysis['weather_adjustment_minutes']}分")
-        optimization_log.append(f"[TIMING] 気象理由: {departure_analysis['weather_reason']}")
+        # 最適出発時間決定
+        departure_minutes = self._departure_minutes(problem, nodes, timing)
+        optimization_log.append(f"[TIMING] 最適出発時間: {self._minutes_to_time(departure_minutes)}")
+        optimization_log.append(f"[TIMING] 気象調整: {timing.departure_adjustment_minutes}分")
+        optimization_log.append(f"[TIMING] 気象理由: {timing.impact.activity_recommendation}")
         
-        # ルート構築
-        route = []
-        current_time_minutes = self._time_to_minutes(optimal_departure)
-        current_lat = activity_location['lat']
-        current_lng = activity_location['lng']
+        # 区間距離（デポ → 各ゲスト → デポ）と希望時間帯（分）を配列から一括取得
+        stops = np.concatenate(([DEPOT], nodes, [DEPOT]))
+        leg_distances = problem.dist[stops[:-1], stops[1:]].tolist()
+        window_starts = problem.tw_start[nodes].astype(np.int64).tolist()
+        window_ends = problem.tw_end[nodes].astype(np.int64).tolist()
         
-        # ゲストを希望時間順にソート（調整版）
-        sorted_guests = sorted(assigned_guests, key=lambda g: self._time_to_minutes(g.get('preferred_pickup_start', '08:30')))
+        # 最初のゲストの希望開始時刻に間に合う出発時刻（06:00以降）
+        current_time_minutes = departure_minutes
+        if route:
+            first_travel = timing.travel_minutes(leg_distances[0], current_time_minutes)
+            current_time_minutes = max(6 * 60, window_starts[0] - first_travel)
+            optimization_log.append(f"[TIMING] ルート出発時刻: {self._minutes_to_time(current_time_minutes)}")
         
-        for i, guest in enumerate(sorted_guests):
-            # 各ゲストへの移動距離計算
-            distance_to_guest = self.calculate_distance(
-                current_lat, current_lng,
-                guest['pickup_lat'], guest['pickup_lng']
-            )
+        pickups = []  # (ピックアップ分, 区間の出発分, 移動分, 待機分)
+        for guest_preferred_start, distance_to_guest in zip(window_starts, leg_distances):
+            # 動的到着時間計算（前計算済みの気象影響を参照）
+            travel_time = timing.travel_minutes(distance_to_guest, current_time_minutes)
             
-            # 動的到着時間計算
-            arrival_analysis = self.calculate_optimal_arrival_time(
-                self._minutes_to_time(current_time_minutes),
-                distance_to_guest,
-                weather_data
-            )
+            # ピックアップ時間: 希望開始前に着いた場合は待機（以降の時刻と整合）
+            arrival_minutes = current_time_minutes + travel_time
+            pickup_time_minutes = max(arrival_minutes, guest_preferred_start)
+            pickups.append((pickup_time_minutes, current_time_minutes, travel_time,
+                            pickup_time_minutes - arrival_minutes))
             
-            # ピックアップ時間調整
-            travel_time = arrival_analysis['total_travel_time_minutes']
-            pickup_time_minutes = current_time_minutes + travel_time
-            pickup_time = self._minutes_to_time(pickup_time_minutes)
+            # 次の時間を更新
+            current_time_minutes = pickup_time_minutes + 5  # 乗車時間5分
+        
+        stops = []
+        for node, guest_preferred_end, distance_to_guest, (pickup_time_minutes, leg_departure, travel_time, wait_minutes) in zip(
+                route, window_ends, leg_distances, pickups):
+            guest = problem.guests[node - 1]
+            hour = timing.hour(leg_departure)
             
             # ゲストの希望時間との適合性チェック
-            guest_preferred_start = self._time_to_minutes(guest.get('preferred_pickup_start', '08:30'))
-            guest_preferred_end = self._time_to_minutes(guest.get('preferred_pickup_end', '09:00'))
-            
-            time_compliance = "acceptable"
-            if pickup_time_minutes < guest_preferred_start:
-                time_compliance = "early"
-                if pickup_time_minutes < guest_preferred_start - 30:
-                    # 30分以上早い場合は調整
-                    pickup_time_minutes = guest_preferred_start
-                    pickup_time = self._minutes_to_time(pickup_time_minutes)
-            elif pickup_time_minutes > guest_preferred_end:
-                time_compliance = "late"
-                if pickup_time_minutes > guest_preferred_end + 30:
-                    # 30分以上遅い場合は調整
-                    pickup_time_minutes = guest_preferred_end
-                    pickup_time = self._minutes_to_time(pickup_time_minutes)
+            time_compliance = "late" if pickup_time_minutes > guest_preferred_end else "acceptable"
             
-            # ルートエントリ作成
-            route_entry = {
-                'guest_id': guest['id'],
-                'name': guest['name'],
-                'hotel_name': guest['hotel_name'],
-                'pickup_lat': guest['pickup_lat'],
-                'pickup_lng': guest['pickup_lng'],
-                'num_people': guest['num_people'],
-                'pickup_time': pickup_time,
-                'arrival_analysis': arrival_analysis,
-                'time_compliance': time_compliance,
-                'distance_from_previous': round(distance_to_guest, 1),
-                'travel_time_minutes': travel_time,
-                'weather_impact': arrival_analysis['weather_impact'],
-                'comfort_recommendations': arrival_analysis['comfort_recommendations']
-            }
-            
-            route.append(route_entry)
-            
-            # 次の位置と時間を更新
-            current_lat = guest['pickup_lat']
-            current_lng = guest['pickup_lng']
-            current_time_minutes = pickup_time_minutes + 5  # 乗車時間5分
+            stops.append(Stop(
+                guest=Guest.from_dict(guest),
+                pickup_minutes=pickup_time_minutes,
+                time_compliance=time_compliance,
+                distance_from_previous=distance_to_guest,
+                travel_time_minutes=travel_time,
+                wait_minutes=wait_minutes,
+                weather_impact=timing.hourly_summaries[hour],
+                comfort_recommendations=timing.hourly_recommendations[hour],
+                arrival_analysis=self._arrival_analysis(timing, leg_departure, distance_to_guest) if verbose else None
+            ))
             
             optimization_log.append(
-                f"[PICKUP] {guest['name']}: {pickup_time} "
+                f"[PICKUP] {guest['name']}: {self._minutes_to_time(pickup_time_minutes)} "
                 f"({time_compliance}, 移動{travel_time}分, 距離{distance_to_guest:.1f}km)"
             )
         
+        route_distance = 0
+        for distance in leg_distances:
+            route_distance += distance
+        route_time = 0
+        final_arrival_minutes = 0
+        final_arrival_analysis = None
+        
         # 最終目的地への移動
-        if route:
-            final_distance = self.calculate_distance(
-                current_lat, current_lng,
-                activity_location['lat'], activity_location['lng']
-            )
-            
-            final_arrival_analysis = self.calculate_optimal_arrival_time(
-                self._minutes_to_time(current_time_minutes),
-                final_distance,
-                weather_data
-            )
-            
-            final_arrival_time = final_arrival_analysis['arrival_time']
+        if stops:
+            final_distance = leg_distances[-1]
+            final_impact = timing.hourly_impacts[timing.hour(current_time_minutes)]
+            final_arrival_minutes = (
+                current_time_minutes + timing.travel_minutes(final_distance, current_time_minutes)
+            ) % (24 * 60)
+            route_time = final_arrival_minutes - pickups[0][0]
             
-            optimization_log.append(f"[ARRIVAL] 目的地到着: {final_arrival_time}")
-            optimization_log.append(f"[WEATHER] 活動適性: {final_arrival_analysis['activity_suitability']}")
+            optimization_log.append(f"[ARRIVAL] 目的地到着: {self._minutes_to_time(final_arrival_minutes)}")
+            optimization_log.append(f"[WEATHER] 活動適性: {final_impact.activity_recommendation}")
             
-            # ルートに到着情報を追加
-            route[-1]['final_destination'] = {
-                'arrival_time': final_arrival_time,
-                'arrival_analysis': final_arrival_analysis,
-                'activity_location': activity_location
-            }
+            if verbose:
+                final_arrival_analysis = self._arrival_analysis(timing, current_time_minutes, final_distance)
         
-        return route
+        return stops, route_distance, route_time, final_arrival_minutes, final_arrival_analysis
 
     async def optimize_multi_vehicle_routes(self, 
                                           guests: List[Dict], 
@@ -420,12 +1168,40 @@ class EnhancedTourOptimizer:
                                           activity_location: Dict, 
                                           activity_start_time: str,
                                           algorithm: str = 'nearest_neighbor',
-                                          weather_data: Dict = None) -> Dict:
+                                          weather_data: Dict = None,
+                                          algorithm_parameters: Dict = None,
+                                          distance_matrix: Optional[DistanceMatrix] = None,
+                                          max_solve_ms: Optional[int] = None,
+                                          max_iterations: Optional[int] = None,
+                                          should_stop: Optional[Callable[[], bool]] = None,
+                                          progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                                          verbose_timing: bool = False) -> Dict:
         """
         複数車両の最適ルート計算（動的時間決定版）
+        
+        distance_matrix を渡した場合は再計算せずに使用する（アルゴリズム比較での共有用）
+        max_solve_ms / max_iterations は全エンジン共通の求解予算。締切・上限に達した
+        探索系エンジンはその時点の暫定最良解を返し、結果の solve_status に打ち切りを記録する。
+        should_stop が True を返した場合も同様に打ち切る（外部からの停止要求）
+        progress を渡すと探索中の暫定解とログ行をイベント（辞書）として逐次通知する
+        verbose_timing=True の場合は停車ごとの到着時間分析（arrival_analysis）を結果に含める
         """
+        if algorithm == 'race':
+            return await self._optimize_race(
+                guests, vehicles, activity_location, activity_start_time,
+                weather_data, algorithm_parameters, max_solve_ms, max_iterations, verbose_timing,
+                should_stop
+            )
+        
+        budget = SolveBudget(max_solve_ms, max_iterations, cancel_check=should_stop)
         start_time = datetime.now()
         optimization_log = []
+        reporter = None
+        if progress is not None:
+            reporter = ProgressReporter(
+                progress, optimization_log,
+                lambda distances, loads: self._calculate_overall_efficiency(distances, loads, guests, vehicles)
+            )
         
         try:
             self.performance_stats['total_optimizations'] += 1
@@ -442,61 +1218,110 @@ class EnhancedTourOptimizer:
                     'temperature': 26
                 }
             
-            # 気象影響分析
-            weather_impact = self.analyze_weather_impact(weather_data)
+            # 気象影響分析（リクエスト単位で1回だけ行い、時間決定処理はこれを参照）
+            timing = self.build_weather_timing(weather_data)
+            weather_impact = timing.impact
             optimization_log.append(f"[WEATHER] 気象条件: 風速{weather_impact.wind_speed_kmh}km/h, 波高{weather_impact.wave_height_m}m")
             optimization_log.append(f"[WEATHER] 移動遅延係数: {weather_impact.travel_delay_factor:.2f}")
             optimization_log.append(f"[WEATHER] 快適度: {weather_impact.comfort_factor:.2f}")
             optimization_log.append(f"[WEATHER] 推奨: {weather_impact.activity_recommendation}")
             
-            # 全ゲスト確実配置
-            vehicle_assignments = await self._assign_all_guests_guaranteed(guests, vehicles, optimization_log)
+            # 距離行列を一括構築（デポ・車両出発地・全ピックアップ地点）
+            if distance_matrix is None:
+                distance_matrix = build_distance_matrix(activity_location, vehicles, guests)
+                optimization_log.append(f"[MATRIX] 距離行列構築: {distance_matrix.size}×{distance_matrix.size}")
+            else:
+                optimization_log.append(f"[MATRIX] 距離行列共有: {distance_matrix.size}×{distance_matrix.size}")
+            
+            problem = self._build_routing_problem(
+                guests, vehicles, activity_location, weather_impact, distance_matrix
+            )
+            algorithm_parameters = algorithm_parameters or {}
+            assignment_parameters = self._resolve_algorithm_parameters(
+                'assignment', algorithm_parameters.get('assignment')
+            )
+            unassigned_guests = []
+            local_search_overrides = algorithm_parameters.get('local_search')
+            if isinstance(local_search_overrides, bool):
+                local_search_overrides = {'enabled': local_search_overrides}
+            optimization_log.append(
+                f"[BUDGET] 求解予算: 締切{budget.max_solve_ms if budget.max_solve_ms is not None else '-'}ms, "
+                f"反復上限{budget.max_iterations if budget.max_iterations is not None else '-'}"
+            )
+            
+            if algorithm == 'genetic':
+                parameters = self._resolve_algorithm_parameters(algorithm, algorithm_parameters)
+                vehicle_routes = self._solve_genetic(problem, parameters, optimization_log, budget, reporter)
+            elif algorithm == 'insertion':
+                parameters = self._resolve_algorithm_parameters(algorithm, algorithm_parameters)
+                vehicle_routes = self._solve_insertion(problem, parameters, optimization_log)
+            elif algorithm == 'savings':
+                vehicle_routes = self._solve_savings(problem, optimization_log)
+            elif algorithm == 'simulated_annealing':
+                parameters = self._resolve_algorithm_parameters(algorithm, algorithm_parameters)
+                vehicle_routes = self._solve_simulated_annealing(problem, parameters, optimization_log, budget, reporter)
+            else:
+                # regret-k 割当（定員内に乗れないゲストは割当失敗として報告）
+                assignment_result = self._assign_guests_by_regret(
+                    guests, vehicles, optimization_log, distance_matrix, assignment_parameters
+                )
+                unassigned_guests = assignment_result.unassigned
+                if unassigned_guests:
+                    unassigned_ids = {g['id'] for g in unassigned_guests}
+                    problem = self._build_routing_problem(
+                        [g for g in guests if g['id'] not in unassigned_ids],
+                        vehicles, activity_location, weather_impact, distance_matrix
+                    )
+                
+                # 🆕 車両ごとの巡回順（最近傍法 + ルート内局所探索）をプロセスプールで並列実行
+                # ワーカー内の局所探索は残り予算を時間上限として渡す
+                route_parameters = self._resolve_algorithm_parameters('local_search', local_search_overrides)
+                route_parameters['time_limit_ms'] = budget.remaining_ms(route_parameters['time_limit_ms'])
+                route_parameters['max_iterations'] = budget.max_iterations
+                vehicle_routes = await self.route_executor.optimize_routes(
+                    problem, problem.from_assignments(assignment_result.assignments),
+                    route_parameters, optimization_log
+                )
+            
+            # 🆕 定員内に乗れないゲストは未割当として報告（全アルゴリズム共通、定員超過で詰め込まない）
+            problem, vehicle_routes, unseated_guests = self._release_unseated(
+                problem, vehicle_routes, optimization_log, assignment_parameters['allow_overbooking']
+            )
+            unassigned_guests = list(unassigned_guests) + unseated_guests
+            
+            # 🆕 局所探索による後処理（全アルゴリズム共通）
+            vehicle_routes = self._improve_with_local_search(
+                problem, vehicle_routes,
+                self._resolve_algorithm_parameters('local_search', local_search_overrides),
+                optimization_log,
+                budget,
+                reporter
+            )
+            solution_cost = problem.evaluate(vehicle_routes)
             
             routes = []
             total_distance = 0
             total_time = 0
             
-            for vehicle_id, assigned_guests in vehicle_assignments.items():
-                if not assigned_guests:
+            # 🆕 ノード番号の解から直接時刻を決め、停車・ルートは軽量モデル（tour_models）で保持
+            for vehicle, vehicle_route in zip(problem.vehicles, vehicle_routes):
+                if not vehicle_route:
                     continue
                 
-                vehicle = next(v for v in vehicles if v['id'] == vehicle_id)
-                optimization_log.append(f"[VEHICLE] {vehicle['name']}: {len(assigned_guests)}組 ({sum(g['num_people'] for g in assigned_guests)}名)")
-                
-                # 🆕 動的時間決定ルート最適化
-                optimized_route = await self._optimize_route_with_dynamic_timing(
-                    assigned_guests, activity_location, weather_data, optimization_log
+                route_result = await self._build_vehicle_route(
+                    vehicle, problem, vehicle_route, activity_location, timing,
+                    optimization_log, preserve_order=True, verbose=verbose_timing
                 )
+                routes.append(route_result)
                 
-                route_distance = self._calculate_route_distance(optimized_route, activity_location)
-                route_time = self._calculate_route_time(optimized_route, activity_location)
-                
-                routes.append({
-                    'vehicle_id': vehicle_id,
-                    'vehicle_name': vehicle['name'],
-                    'driver': vehicle['driver'],
-                    'capacity': vehicle['capacity'],
-                    'route': optimized_route,
-                    'total_distance': round(route_distance, 1),
-                    'estimated_time': route_time,
-                    'passenger_count': sum(g['num_people'] for g in assigned_guests),
-                    'efficiency_score': self._calculate_route_efficiency(
-                        optimized_route, vehicle['capacity'], route_distance
-                    ),
-                    'weather_impact_summary': {
-                        'travel_delay_factor': weather_impact.travel_delay_factor,
-                        'comfort_factor': weather_impact.comfort_factor,
-                        'activity_recommendation': weather_impact.activity_recommendation
-                    }
-                })
-                
-                total_distance += route_distance
-                total_time = max(total_time, route_time)
-                
-                optimization_log.append(f"[RESULT] {vehicle['name']}: 距離{route_distance:.1f}km, 時間{route_time}分")
+                total_distance += route_result.distance_km
+                total_time = max(total_time, route_result.estimated_time)
             
             # 全体効率スコア計算
-            efficiency_score = self._calculate_overall_efficiency(routes, guests, vehicles)
+            efficiency_score = self._calculate_overall_efficiency(
+                [route.total_distance for route in routes], [route.passenger_count for route in routes],
+                guests, vehicles
+            )
             
             # 統計情報
             optimization_log.append(f"[SUMMARY] 総距離: {total_distance:.1f}km")
@@ -510,7 +1335,14 @@ class EnhancedTourOptimizer:
             optimization_duration = (end_time - start_time).total_seconds()
             
             optimization_log.append(f"[TIME] 最適化時間: {optimization_duration:.2f}秒")
+            solve_status = budget.summary()
+            if solve_status['cut_short']:
+                cut = [f"{stage}={reason}" for stage, reason in solve_status['stages'].items()
+                       if reason != 'completed']
+                optimization_log.append(f"[BUDGET] 求解予算により打ち切り: {', '.join(cut)} → 暫定最良解を返却")
             optimization_log.append(f"[COMPLETE] 動的時間決定最適化完了")
+            if reporter:
+                reporter.log()
             
             # 統計更新
             self.performance_stats['successful_optimizations'] += 1
@@ -524,6 +1356,22 @@ class EnhancedTourOptimizer:
                 'efficiency_score': efficiency_score,
                 'algorithm_used': f'{algorithm}_dynamic_timing',
                 'optimization_log': optimization_log,
+                'solution_quality': {
+                    'distance_km': round(solution_cost.distance, 2),
+                    'lateness_minutes': round(solution_cost.lateness_minutes, 1),
+                    'overflow_people': solution_cost.overflow_people,
+                    'cost': round(solution_cost.cost, 2)
+                },
+                'solve_status': solve_status,
+                'unassigned_guests': [
+                    {
+                        'guest_id': guest['id'],
+                        'name': guest['name'],
+                        'num_people': guest['num_people'],
+                        'reason': 'capacity_exceeded'
+                    }
+                    for guest in unassigned_guests
+                ],
                 'weather_summary': {
                     'conditions': weather_data,
                     'impact_analysis': {
@@ -533,7 +1381,7 @@ class EnhancedTourOptimizer:
                     },
                     'timing_adjustments': {
                         'total_routes': len(routes),
-                        'weather_adjusted_routes': len([r for r in routes if r.get('weather_impact_summary')])
+                        'weather_adjusted_routes': len([r for r in routes if r.weather_impact_summary])
                     }
                 }
             }
@@ -544,117 +1392,40 @@ class EnhancedTourOptimizer:
             raise
 
     # 既存のヘルパーメソッド（省略部分は元のコードと同じ）
-    async def _assign_all_guests_guaranteed(self, guests: List[Dict], vehicles: List[Dict], optimization_log: List[str]) -> Dict[str, List[Dict]]:
-        """全ゲスト確実配置アルゴリズム（既存）"""
-        optimization_log.append("[ASSIGN] 全ゲスト確実配置アルゴリズム開始")
+    def _assign_guests_by_regret(self, guests: List[Dict], vehicles: List[Dict], optimization_log: List[str],
+                                 distance_matrix: Optional[DistanceMatrix] = None,
+                                 parameters: Optional[Dict[str, Any]] = None) -> AssignmentResult:
+        """regret-k 割当（定員超過は割当失敗として明示）"""
+        parameters = parameters or self._resolve_algorithm_parameters('assignment')
+        optimization_log.append(f"[ASSIGN] regret-{parameters['regret_k']}割当開始")
         
-        assignments = {vehicle['id']: [] for vehicle in vehicles}
-        unassigned_guests = guests.copy()
+        if distance_matrix is None:
+            distance_matrix = build_distance_matrix({'lat': 0.0, 'lng': 0.0}, vehicles, guests)
         
-        # Phase 1: 通常配置
-        for guest in guests.copy():
-            best_vehicle = None
-            min_total_cost = float('inf')
-            
-            for vehicle in vehicles:
-                current_passengers = sum(g['num_people'] for g in assignments[vehicle['id']])
-                
-                if current_passengers + guest['num_people'] > vehicle['capacity']:
-                    continue
-                
-                if not assignments[vehicle['id']]:
-                    distance_cost = self.calculate_distance(
-                        vehicle['location']['lat'], vehicle['location']['lng'],
-                        guest['pickup_lat'], guest['pickup_lng']
-                    )
-                else:
-                    last_guest = assignments[vehicle['id']][-1]
-                    distance_cost = self.calculate_distance(
-                        last_guest['pickup_lat'], last_guest['pickup_lng'],
-                        guest['pickup_lat'], guest['pickup_lng']
-                    )
-                
-                if distance_cost < min_total_cost:
-                    min_total_cost = distance_cost
-                    best_vehicle = vehicle['id']
-            
-            if best_vehicle:
-                assignments[best_vehicle].append(guest)
-                unassigned_guests.remove(guest)
-                optimization_log.append(f"[ASSIGN] {guest['name']} → 車両{best_vehicle}")
-        
-        # Phase 2: 未配置ゲストの強制配置
-        if unassigned_guests:
-            optimization_log.append(f"[ASSIGN] Phase 2: 未配置ゲスト {len(unassigned_guests)}組の強制配置")
-            
-            for guest in unassigned_guests:
-                best_vehicle = None
-                min_overflow = float('inf')
-                
-                for vehicle in vehicles:
-                    current_passengers = sum(g['num_people'] for g in assignments[vehicle['id']])
-                    overflow = max(0, current_passengers + guest['num_people'] - vehicle['capacity'])
-                    
-                    if overflow < min_overflow:
-                        min_overflow = overflow
-                        best_vehicle = vehicle['id']
-                
-                if best_vehicle:
-                    assignments[best_vehicle].append(guest)
-                    optimization_log.append(f"[ASSIGN] 強制配置: {guest['name']} → 車両{best_vehicle}")
-        
-        return assignments
-
-    def _calculate_route_distance(self, route: List[Dict], activity_location: Dict) -> float:
-        """ルート総距離計算"""
-        if not route:
-            return 0
-        
-        total_distance = 0
-        prev_lat = activity_location['lat']
-        prev_lng = activity_location['lng']
-        
-        for stop in route:
-            distance = self.calculate_distance(prev_lat, prev_lng, stop['pickup_lat'], stop['pickup_lng'])
-            total_distance += distance
-            prev_lat = stop['pickup_lat']
-            prev_lng = stop['pickup_lng']
-        
-        # 最終目的地への距離
-        final_distance = self.calculate_distance(prev_lat, prev_lng, activity_location['lat'], activity_location['lng'])
-        total_distance += final_distance
+        result = RegretAssigner(distance_matrix, **parameters).assign(guests, vehicles)
         
-        return total_distance
-
-    def _calculate_route_time(self, route: List[Dict], activity_location: Dict) -> int:
-        """ルート総時間計算"""
-        if not route:
-            return 0
-        
-        # 最初のピックアップ時間から最後の到着時間まで
-        first_pickup = route[0]['pickup_time']
-        
-        # 最後のゲストの情報または最終目的地情報から到着時間を取得
-        if 'final_destination' in route[-1]:
-            last_arrival = route[-1]['final_destination']['arrival_time']
-        else:
-            # フォールバック: 最後のピックアップ時間＋推定移動時間
-            last_pickup = route[-1]['pickup_time']
-            estimated_travel = 60  # 1時間と仮定
-            last_pickup_minutes = self._time_to_minutes(last_pickup)
-            last_arrival = self._minutes_to_time(last_pickup_minutes + estimated_travel)
-        
-        first_minutes = self._time_to_minutes(first_pickup)
-        last_minutes = self._time_to_minutes(last_arrival)
+        vehicle_names = {vehicle['id']: vehicle['name'] for vehicle in vehicles}
+        for vehicle_id, assigned in result.assignments.items():
+            for guest in assigned:
+                optimization_log.append(f"[ASSIGN] {guest['name']} → {vehicle_names[vehicle_id]}")
+        for guest in result.overbooked:
+            optimization_log.append(f"[ASSIGN] 定員超過を許可して配置: {guest['name']} ({guest['num_people']}名)")
+        if result.unassigned:
+            optimization_log.append(
+                f"[ASSIGN] 定員不足で割当不可: {len(result.unassigned)}組 "
+                f"({sum(g['num_people'] for g in result.unassigned)}名)"
+            )
+            for guest in result.unassigned:
+                optimization_log.append(f"[ASSIGN] 割当不可: {guest['name']} ({guest['num_people']}名)")
         
-        return last_minutes - first_minutes
+        return result
 
-    def _calculate_route_efficiency(self, route: List[Dict], vehicle_capacity: int, route_distance: float) -> float:
+    def _calculate_route_efficiency(self, stops: List[Stop], vehicle_capacity: int, route_distance: float) -> float:
         """ルート効率計算"""
-        if not route:
+        if not stops:
             return 0
         
-        passenger_count = sum(stop['num_people'] for stop in route)
+        passenger_count = sum(stop.guest.num_people for stop in stops)
         capacity_utilization = min(passenger_count / vehicle_capacity, 1.0)
         distance_efficiency = max(0, 1 - (route_distance - 15) / 30)
         time_compliance = 1.0
@@ -662,21 +1433,22 @@ class EnhancedTourOptimizer:
         efficiency = (capacity_utilization * 0.4 + distance_efficiency * 0.3 + time_compliance * 0.3) * 100
         return min(efficiency, 100)
 
-    def _calculate_overall_efficiency(self, routes: List[Dict], guests: List[Dict], vehicles: List[Dict]) -> float:
-        """全体効率スコア計算"""
-        if not routes:
+    def _calculate_overall_efficiency(self, route_distances: List[float], passenger_counts: List[int],
+                                      guests: List[Dict], vehicles: List[Dict]) -> float:
+        """全体効率スコア計算（使用車両ごとのルート距離・乗車人数から）"""
+        if not route_distances:
             return 0
         
         total_passengers = sum(g['num_people'] for g in guests)
         total_capacity = sum(v['capacity'] for v in vehicles)
-        total_distance = sum(r['total_distance'] for r in routes)
-        used_vehicles = len(routes)
+        total_distance = sum(route_distances)
+        used_vehicles = len(route_distances)
         available_vehicles = len(vehicles)
         
         capacity_utilization = (total_passengers / total_capacity) * 100
         vehicle_utilization = (used_vehicles / available_vehicles) * 100
         distance_efficiency = max(0, 100 - (total_distance - 30) * 1.5)
-        guest_coverage = (sum(r['passenger_count'] for r in routes) / total_passengers) * 100
+        guest_coverage = (sum(passenger_counts) / total_passengers) * 100
         
         overall_efficiency = (
             capacity_utilization * 0.25 +
@@ -706,4 +1478,47 @@ class EnhancedTourOptimizer:
 
     async def get_recent_logs(self, limit: int = 50) -> List[Dict]:
         """最近の最適化ログ取得"""
-        return self.optimization_logs[-limit:] if self.optimization_logs else []
\ No newline at end of file
+        return self.optimization_logs[-limit:] if self.optimization_logs else []
+
+
+# 🆕 アルゴリズム比較用ワーカー処理（プロセスごとにオプティマイザーを1つ保持）
+_worker_optimizer: Optional[EnhancedTourOptimizer] = None
+
+
+def run_optimization_in_worker(guests: List[Dict], vehicles: List[Dict],
+                               activity_location: Dict, activity_start_time: str,
+                               algorithm: str, weather_data: Optional[Dict],
+                               algorithm_parameters: Optional[Dict],
+                               distance_matrix: DistanceMatrix,
+                               cancel_slot: Optional[int] = None,
+                               max_solve_ms: Optional[int] = None,
+                               max_iterations: Optional[int] = None,
+                               verbose_timing: bool = False) -> Dict:
+    """
+    1アルゴリズム分の最適化をワーカープロセスで実行する
+
+    処理時間はワーカー内で計測するため、他アルゴリズムの待ち時間を含まない
+    cancel_slot を指定すると、親からの停止要求で探索を打ち切る
+    max_solve_ms / max_iterations はワーカー内で開始する求解予算
+    """
+    global _worker_optimizer
+    if _worker_optimizer is None:
+        _worker_optimizer = EnhancedTourOptimizer()
+    
+    started = time.perf_counter()
+    result = asyncio.run(_worker_optimizer.optimize_multi_vehicle_routes(
+        guests=guests,
+        vehicles=vehicles,
+        activity_location=activity_location,
+        activity_start_time=activity_start_time,
+        algorithm=algorithm,
+        weather_data=weather_data,
+        algorithm_parameters=algorithm_parameters,
+        distance_matrix=distance_matrix,
+        max_solve_ms=max_solve_ms,
+        max_iterations=max_iterations,
+        should_stop=cancellation_check(cancel_slot),
+        verbose_timing=verbose_timing
+    ))
+    result['optimization_time'] = round(time.perf_counter() - started, 3)
+    return result
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+genetic_optimizer.py - 遺伝的アルゴリズムエンジン
+石垣島ツアー最適化システム
+
+- 染色体 = 全ゲストの巡回順（整数順列配列）
+- 復号 = 車両順に定員まで詰める分割（集団全体を一括処理）。どの車両にも入らない残りは未割当
+- 適応度 = 距離 + 希望時間超過ペナルティ + 未割当人数ペナルティ
+  （距離行列への NumPy ギャザーで集団全体を同時評価）
+- 順序交叉（OX）と交換・逆位突然変異
+"""
+
+import logging
+import time
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from routing_problem import DEPOT, RoutingProblem
+
+logger = logging.getLogger(__name__)
+
+
+class GeneticRouteOptimizer:
+    """遺伝的アルゴリズムによる複数車両ルート最適化"""
+
+    def __init__(self,
+                 problem: RoutingProblem,
+                 population_size: int = 40,
+                 generations: int = 75,
+                 crossover_rate: float = 0.9,
+                 mutation_rate: float = 0.2,
+                 elite_count: int = 2,
+                 tournament_size: int = 3,
+                 time_limit_ms: Optional[int] = None,
+                 max_iterations: Optional[int] = None,
+                 seed: Optional[int] = None):
+        self.problem = problem
+        self.population_size = max(2, int(population_size))
+        self.generations = max(0, int(generations))
+        self.crossover_rate = crossover_rate
+        self.mutation_rate = mutation_rate
+        self.elite_count = min(max(0, int(elite_count)), self.population_size)
+        self.tournament_size = max(1, int(tournament_size))
+        self.time_limit_ms = None if time_limit_ms is None else max(0, int(time_limit_ms))
+        # リクエスト単位の反復上限（世代数の上限として適用）
+        self.max_iterations = None if max_iterations is None else max(1, int(max_iterations))
+        self.stop_reason: Optional[str] = None
+        self.rng = np.random.default_rng(seed)
+
+    # ===== 集団一括評価 =====
+
+    def _split(self, population: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        巡回順を車両順に定員まで詰めて分割（最終車両にも入らない残りは未割当）
+
+        Returns:
+            vehicle_of: 各位置を担当する車両の番号、未割当は num_vehicles (P×G)
+            unseated: 未割当の人数 (P)
+        """
+        problem = self.problem
+        pop_size, num_guests = population.shape
+        positions = np.arange(num_guests)
+        num_vehicles = problem.num_vehicles
+
+        cumulative = np.cumsum(problem.demand[population + 1], axis=1)
+        start = np.zeros(pop_size, dtype=np.int64)
+        base = np.zeros(pop_size, dtype=np.int64)
+        vehicle_of = np.full((pop_size, num_guests), num_vehicles, dtype=np.int64)
+        rows = np.arange(pop_size)
+
+        for vehicle_position in range(num_vehicles):
+            # 累積人数は単調増加なので、定員内の位置は先頭からの連続区間
+            within = ((cumulative - base[:, None] <= problem.capacity[vehicle_position]) &
+                      (positions >= start[:, None]))
+            vehicle_of[within] = vehicle_position
+            start = start + within.sum(axis=1)
+            base = np.where(start > 0, cumulative[rows, np.maximum(start - 1, 0)], 0)
+
+        unseated = cumulative[:, -1] - base
+        return vehicle_of, unseated
+
+    def evaluate_population(self, population: np.ndarray) -> np.ndarray:
+        """集団全体の適応度（小さいほど良い）を一括計算"""
+        problem = self.problem
+        pop_size, num_guests = population.shape
+        nodes = population + 1
+
+        vehicle_of, unseated = self._split(population)
+        # 未割当は巡回順の末尾区間なので、その直前で最後のルートが終わる
+        seated = vehicle_of < problem.num_vehicles
+        route_start = np.ones((pop_size, num_guests), dtype=bool)
+        route_start[:, 1:] = vehicle_of[:, 1:] != vehicle_of[:, :-1]
+        route_end = np.concatenate(
+            [route_start[:, 1:], np.ones((pop_size, 1), dtype=bool)], axis=1
+        ) & seated
+        previous = np.concatenate(
+            [np.zeros((pop_size, 1), dtype=np.int64), nodes[:, :-1]], axis=1
+        )
+        previous = np.where(route_start, DEPOT, previous)
+
+        # 距離: 各辺 + デポへの帰着
+        distance = ((problem.dist[previous, nodes] * seated).sum(axis=1) +
+                    (problem.dist[nodes, DEPOT] * route_end).sum(axis=1))
+
+        # 時間枠: 位置方向は逐次、集団方向はベクトル化
+        travel_in = problem.travel[previous, nodes]
+        window_start = problem.tw_start[nodes]
+        window_end = problem.tw_end[nodes]
+        service = problem.service_minutes
+        t = np.full(pop_size, float(problem.depot_open_minutes))
+        lateness = np.zeros(pop_size)
+        for position in range(num_guests):
+            ready = np.where(route_start[:, position], problem.depot_open_minutes, t + service)
+            t = np.maximum(ready + travel_in[:, position], window_start[:, position])
+            lateness += np.maximum(0.0, t - window_end[:, position]) * seated[:, position]
+
+        return (distance +
+                problem.lateness_weight * lateness +
+                problem.overflow_weight * unseated)
+
+    # ===== 遺伝的操作 =====
+
+    def _initial_population(self, seeds: List[np.ndarray]) -> np.ndarray:
+        num_guests = self.problem.num_guests
+        population = np.empty((self.population_size, num_guests), dtype=np.int64)
+        for i in range(self.population_size):
+            if i < len(seeds):
+                population[i] = seeds[i]
+            else:
+                population[i] = self.rng.permutation(num_guests)
+        return population
+
+    def _tournament(self, fitness: np.ndarray, count: int) -> np.ndarray:
+        candidates = self.rng.integers(0, len(fitness), size=(count, self.tournament_size))
+        winners = np.argmin(fitness[candidates], axis=1)
+        return candidates[np.arange(count), winners]
+
+    def _order_crossover(self, parent1: np.ndarray, parent2: np.ndarray) -> np.ndarray:
+        """順序交叉（OX）"""
+        num_guests = len(parent1)
+        a, b = np.sort(self.rng.choice(num_guests + 1, size=2, replace=False))
+        in_slice = np.zeros(num_guests, dtype=bool)
+        in_slice[parent1[a:b]] = True
+        rest = parent2[~in_slice[parent2]]
+        return np.concatenate([rest[:a], parent1[a:b], rest[a:]])
+
+    def _mutate(self, chromosome: np.ndarray) -> None:
+        """交換または区間反転による突然変異（インプレース）"""
+        num_guests = len(chromosome)
+        i, j = np.sort(self.rng.choice(num_guests, size=2, replace=False))
+        if self.rng.random() < 0.5:
+            chromosome[i], chromosome[j] = chromosome[j], chromosome[i]
+        else:
+            chromosome[i:j + 1] = chromosome[i:j + 1][::-1]
+
+    # ===== 実行 =====
+
+    def solve(self, seeds: Optional[List[List[int]]] = None,
+              optimization_log: Optional[List[str]] = None,
+              should_stop: Optional[Callable[[], bool]] = None,
+              progress: Optional[Callable[[int, Callable[[], List[List[int]]]], None]] = None) -> List[List[int]]:
+        """
+        GA実行
+
+        Args:
+            seeds: 初期集団に含める巡回順（ゲストノード番号のリスト）
+            should_stop: True を返したら世代ループを打ち切る（外部からの停止要求）
+            progress: 世代ごとに (完了世代数, 暫定最良ルートを復号する関数) で呼ばれる
+
+        Returns:
+            車両順のルート（ゲストノード番号のリスト）
+            打ち切り時はその時点の最良個体（stop_reason に理由を記録）
+        """
+        problem = self.problem
+        num_guests = problem.num_guests
+        self.stop_reason = None
+        if num_guests == 0:
+            return [[] for _ in range(problem.num_vehicles)]
+
+        seed_arrays = [np.asarray(seed, dtype=np.int64) - 1 for seed in (seeds or [])
+                       if len(seed) == num_guests]
+
+        if num_guests < 2:
+            best = seed_arrays[0] if seed_arrays else np.arange(num_guests)
+            return self._decode(best)
+
+        population = self._initial_population(seed_arrays)
+        fitness = self.evaluate_population(population)
+        initial_best = float(fitness.min())
+
+        offspring_count = self.population_size - self.elite_count
+        deadline = (time.perf_counter() + self.time_limit_ms / 1000
+                    if self.time_limit_ms is not None else None)
+        generation_limit = self.generations
+        if self.max_iterations is not None and self.max_iterations < generation_limit:
+            generation_limit = self.max_iterations
+            self.stop_reason = 'iterations'
+        completed = 0
+        for _ in range(generation_limit):
+            if deadline is not None and time.perf_counter() >= deadline:
+                self.stop_reason = 'time_limit'
+                break
+            if should_stop is not None and should_stop():
+                self.stop_reason = 'stopped'
+                break
+            elite = population[np.argsort(fitness)[:self.elite_count]]
+
+            parents = self._tournament(fitness, offspring_count * 2).reshape(-1, 2)
+            children = np.empty((offspring_count, num_guests), dtype=np.int64)
+            for k, (p1, p2) in enumerate(parents):
+                if self.rng.random() < self.crossover_rate:
+                    children[k] = self._order_crossover(population[p1], population[p2])
+                else:
+                    children[k] = population[p1]
+                if self.rng.random() < self.mutation_rate:
+                    self._mutate(children[k])
+
+            population = np.concatenate([elite, children]) if self.elite_count else children
+            fitness = self.evaluate_population(population)
+            completed += 1
+            if progress is not None:
+                # 復号は通知が間引かれずに送られるときだけ行う
+                leader = population[int(np.argmin(fitness))]
+                progress(completed, lambda chromosome=leader: self._decode(chromosome))
+
+        best = population[int(np.argmin(fitness))]
+        if optimization_log is not None:
+            optimization_log.append(
+                f"[GENETIC] 集団{self.population_size}, 世代{completed}/{self.generations}: "
+                f"適応度 {initial_best:.1f} → {float(fitness.min()):.1f}"
+            )
+        return self._decode(best)
+
+    def _decode(self, chromosome: np.ndarray) -> List[List[int]]:
+        """染色体を車両順のルートに復号（定員内に乗れないゲストはルートに含めない）"""
+        vehicle_of, _ = self._split(chromosome[None, :])
+        num_vehicles = self.problem.num_vehicles
+        routes: List[List[int]] = [[] for _ in range(num_vehicles)]
+        for vehicle_position, node in zip(vehicle_of[0].tolist(), (chromosome + 1).tolist()):
+            if vehicle_position < num_vehicles:
+                routes[vehicle_position].append(node)
+        return routes
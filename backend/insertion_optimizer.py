@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+insertion_optimizer.py - 時間枠付き挿入法（VRPTW）構築エンジン
+石垣島ツアー最適化システム
+
+Solomon 型の挿入法（最安挿入 / regret-k 挿入）:
+- 各ルートは停車ごとの最早開始時刻（前方）と最遅開始時刻（後方スラック）
+  配列を保持し、挿入可否は直前・直後の2点だけで O(1) 判定する
+- 挿入コストは「全未割当ゲスト × 車両」の行列で保持し、
+  挿入のあったルートの列だけを NumPy で一括更新する
+- どの車両にも時間枠内で入らないゲストは、空き定員のある車両の最も影響の
+  小さい位置へ時間枠だけを緩めて挿入し、ログに明示する
+- 空き定員のある車両が無いゲストは挿入せず未割当として返す
+"""
+
+import logging
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from routing_problem import DEPOT, RoutingProblem
+
+logger = logging.getLogger(__name__)
+
+
+class InsertionRouteBuilder:
+    """スラック配列による O(1) 可否判定付き挿入法"""
+
+    def __init__(self,
+                 problem: RoutingProblem,
+                 strategy: str = 'regret',
+                 regret_k: int = 2):
+        if strategy not in ('regret', 'cheapest'):
+            raise ValueError(f"無効な挿入戦略: {strategy}. 利用可能: ['regret', 'cheapest']")
+        self.problem = problem
+        self.strategy = strategy
+        self.regret_k = max(2, int(regret_k))
+
+    # ===== ルート状態（前方・後方スラック） =====
+
+    def _refresh_route(self, r: int) -> None:
+        """ルート r の最早開始時刻・最遅開始時刻を再計算"""
+        problem = self.problem
+        travel = problem.travel_rows
+        tw_end = problem.tw_end_list
+        service = problem.service_minutes
+        route = self.routes[r]
+
+        starts = problem.route_start_times(route)
+        latest = [0.0] * len(route)
+        for k in range(len(route) - 1, -1, -1):
+            node = route[k]
+            # 既に時間枠外の停車はそれ以上遅らせない
+            limit = max(tw_end[node], starts[k])
+            if k == len(route) - 1:
+                latest[k] = limit
+            else:
+                latest[k] = min(limit, latest[k + 1] - service - travel[node][route[k + 1]])
+
+        self.starts[r] = starts
+        self.latest[r] = latest
+        self.loads[r] = problem.route_load(route)
+
+    def _insertion_column(self, r: int, candidates: np.ndarray):
+        """
+        候補ゲスト全員について、ルート r への最良挿入コストと位置を一括計算
+
+        Returns:
+            cost: 最良挿入の距離増分（不可なら inf）
+            position: 挿入位置
+        """
+        problem = self.problem
+        route = self.routes[r]
+        starts = self.starts[r]
+        latest = self.latest[r]
+        service = problem.service_minutes
+
+        best_cost = np.full(len(candidates), np.inf)
+        best_position = np.zeros(len(candidates), dtype=np.int64)
+
+        spare = problem.capacity_list[r] - self.loads[r]
+        fits_capacity = problem.demand[candidates] <= spare
+        if not fits_capacity.any():
+            return best_cost, best_position
+
+        window_start = problem.tw_start[candidates]
+        window_end = problem.tw_end[candidates]
+        for position in range(len(route) + 1):
+            if position == 0:
+                prev, depart = DEPOT, float(problem.depot_open_minutes)
+            else:
+                prev, depart = route[position - 1], starts[position - 1] + service
+            nxt = route[position] if position < len(route) else DEPOT
+
+            start = np.maximum(depart + problem.travel[prev, candidates], window_start)
+            feasible = fits_capacity & (start <= window_end)
+            if nxt != DEPOT:
+                arrival_next = start + service + problem.travel[candidates, nxt]
+                feasible &= arrival_next <= latest[position]
+
+            cost = (problem.dist[prev, candidates] + problem.dist[candidates, nxt] -
+                    problem.dist[prev, nxt])
+            better = feasible & (cost < best_cost)
+            best_cost = np.where(better, cost, best_cost)
+            best_position = np.where(better, position, best_position)
+
+        return best_cost, best_position
+
+    # ===== 実行 =====
+
+    def build(self, optimization_log: Optional[List[str]] = None) -> List[List[int]]:
+        """
+        挿入法でルートを構築
+
+        Returns:
+            車両順のルート（ゲストノード番号のリスト）
+            定員内に乗せられなかったゲストはルートに含めない
+        """
+        problem = self.problem
+        self._load_routes([[] for _ in range(problem.num_vehicles)])
+        relaxed, unseated = self._insert_nodes(np.arange(1, problem.num_guests + 1))
+
+        if optimization_log is not None:
+            label = f"regret-{self.regret_k}" if self.strategy == 'regret' else "最安挿入"
+            optimization_log.append(
+                f"[INSERTION] {label}挿入法: {problem.num_guests}組を"
+                f"{sum(1 for route in self.routes if route)}台に配置"
+            )
+            if relaxed:
+                names = ', '.join(problem.guests[node - 1]['name'] for node in relaxed)
+                optimization_log.append(f"[INSERTION] 時間枠内に挿入できず緩和配置: {names}")
+            if unseated:
+                names = ', '.join(problem.guests[node - 1]['name'] for node in unseated)
+                optimization_log.append(f"[INSERTION] 空き定員のある車両が無いため未割当: {names}")
+        return self.routes
+
+    def insert(self, routes: List[List[int]],
+               nodes: List[int]) -> Tuple[List[List[int]], List[int], List[int]]:
+        """
+        既存ルートを保ったまま、指定ゲストだけを追加挿入（当日の予約追加など）
+
+        Returns:
+            (挿入後の車両順ルート, 時間枠を緩めて配置したノード, 定員内に入らず挿入しなかったノード)
+        """
+        self._load_routes([list(route) for route in routes])
+        relaxed, unseated = self._insert_nodes(np.asarray(nodes, dtype=np.int64))
+        return self.routes, relaxed, unseated
+
+    def _load_routes(self, routes: List[List[int]]) -> None:
+        num_vehicles = self.problem.num_vehicles
+        self.routes = routes
+        self.starts = [[] for _ in range(num_vehicles)]
+        self.latest = [[] for _ in range(num_vehicles)]
+        self.loads = [0] * num_vehicles
+        for r in range(num_vehicles):
+            if routes[r]:
+                self._refresh_route(r)
+
+    def _insert_nodes(self, unrouted: np.ndarray) -> Tuple[List[int], List[int]]:
+        """未配置ノードを戦略に従って順に挿入し、(緩和配置したノード, 挿入しなかったノード) を返す"""
+        problem = self.problem
+        num_vehicles = problem.num_vehicles
+        cost = np.empty((len(unrouted), num_vehicles))
+        position = np.zeros((len(unrouted), num_vehicles), dtype=np.int64)
+        for r in range(num_vehicles):
+            cost[:, r], position[:, r] = self._insertion_column(r, unrouted)
+
+        relaxed = []
+        unseated = []
+        while len(unrouted):
+            best_route = np.argmin(cost, axis=1)
+            best_cost = cost[np.arange(len(unrouted)), best_route]
+
+            if np.isinf(best_cost).all():
+                # 時間枠内に入るゲストが無い → 1組を緩和挿入（空き定員が無ければ未割当）
+                pick = int(np.argmin(problem.tw_end[unrouted]))
+                node = int(unrouted[pick])
+                r = self._relaxed_insert(node)
+                if r is None:
+                    unseated.append(node)
+                else:
+                    relaxed.append(node)
+            else:
+                if self.strategy == 'regret' and num_vehicles > 1:
+                    k = min(self.regret_k, num_vehicles)
+                    smallest = np.partition(cost, k - 1, axis=1)[:, :k]
+                    smallest = np.sort(smallest, axis=1)
+                    # 挿入先が1つしか無いゲストを最優先（regret = inf）
+                    with np.errstate(invalid='ignore'):
+                        regret = (smallest[:, 1:] - smallest[:, :1]).sum(axis=1)
+                    regret = np.where(np.isinf(best_cost), -np.inf, regret)
+                    regret = np.nan_to_num(regret, nan=-np.inf)
+                    pick = int(np.argmax(regret - 1e-9 * best_cost))
+                else:
+                    pick = int(np.argmin(best_cost))
+                node = int(unrouted[pick])
+                r = int(best_route[pick])
+                self.routes[r].insert(int(position[pick, r]), node)
+                self._refresh_route(r)
+
+            unrouted = np.delete(unrouted, pick)
+            cost = np.delete(cost, pick, axis=0)
+            position = np.delete(position, pick, axis=0)
+            if len(unrouted) and r is not None:
+                cost[:, r], position[:, r] = self._insertion_column(r, unrouted)
+        return relaxed, unseated
+
+    def _relaxed_insert(self, node: int) -> Optional[int]:
+        """
+        時間枠だけを緩めて、空き定員のある車両の距離増分最小位置へ挿入
+
+        Returns:
+            挿入した車両の番号（空き定員のある車両が無ければ None）
+        """
+        problem = self.problem
+        dist = problem.dist_rows
+        demand = problem.demand_list[node]
+
+        best = None
+        for r, route in enumerate(self.routes):
+            if self.loads[r] + demand > problem.capacity_list[r]:
+                continue
+            for position in range(len(route) + 1):
+                prev = route[position - 1] if position > 0 else DEPOT
+                nxt = route[position] if position < len(route) else DEPOT
+                added = dist[prev][node] + dist[node][nxt] - dist[prev][nxt]
+                if best is None or added < best[0]:
+                    best = (added, r, position)
+
+        if best is None:
+            return None
+        _, r, position = best
+        self.routes[r].insert(position, node)
+        self._refresh_route(r)
+        return r
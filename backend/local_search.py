@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+local_search.py - 局所探索による後処理最適化
+石垣島ツアー最適化システム
+
+どの構築アルゴリズムの後にも適用できる改善ステージ:
+- 2-opt（ルート内の区間反転）
+- Or-opt（1〜3停車の区間を別位置・別車両へ移動）
+- cross-exchange（車両間で1〜3停車の区間を交換）
+
+各ゲストの近傍リスト（距離の近い上位K件）に候補を限定するため、
+1日数百停車でも1パスあたりの評価回数は O(G·K) に収まる。
+時間枠は SA と同様、各停車の遅延を現状より悪化させない範囲で判定する。
+"""
+
+import logging
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from routing_problem import DEPOT, RoutingProblem
+
+logger = logging.getLogger(__name__)
+
+IMPROVEMENT_EPSILON = 1e-6
+
+
+class LocalSearchOptimizer:
+    """近傍リスト付き 2-opt / Or-opt / cross-exchange 局所探索"""
+
+    def __init__(self,
+                 problem: RoutingProblem,
+                 neighbor_count: int = 10,
+                 max_segment_length: int = 3,
+                 time_limit_ms: int = 500,
+                 max_iterations: Optional[int] = None):
+        self.problem = problem
+        self.neighbor_count = max(1, int(neighbor_count))
+        self.max_segment_length = max(1, int(max_segment_length))
+        self.time_limit_ms = max(0, int(time_limit_ms))
+        # リクエスト単位の反復上限（パス数）
+        self.max_iterations = None if max_iterations is None else max(1, int(max_iterations))
+        self.stop_reason: Optional[str] = None
+        self.neighbors = self._build_neighbor_lists()
+        self.move_counts = {'two_opt': 0, 'or_opt': 0, 'cross_exchange': 0}
+
+    def _build_neighbor_lists(self) -> List[List[int]]:
+        """各ゲストノードから近いゲストノード上位K件（一括計算）"""
+        num_guests = self.problem.num_guests
+        if num_guests < 2:
+            return [[] for _ in range(num_guests + 1)]
+        k = min(self.neighbor_count, num_guests - 1)
+        guest_dist = self.problem.dist[1:, 1:].copy()
+        np.fill_diagonal(guest_dist, np.inf)
+        nearest = np.argpartition(guest_dist, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(guest_dist, nearest, axis=1).argsort(axis=1)
+        nearest = np.take_along_axis(nearest, order, axis=1) + 1
+        return [[]] + nearest.tolist()
+
+    # ===== 状態管理 =====
+
+    def _refresh_route(self, r: int) -> None:
+        route = self.routes[r]
+        tw_end = self.problem.tw_end_list
+        for k, (node, start) in enumerate(zip(route, self.problem.route_start_times(route))):
+            self.route_of[node] = r
+            self.index_of[node] = k
+            self.limit[node] = max(tw_end[node], start)
+        self.loads[r] = self.problem.route_load(route)
+
+    def _feasible(self, route: List[int]) -> bool:
+        limit = self.limit
+        return all(t <= limit[node]
+                   for node, t in zip(route, self.problem.route_start_times(route)))
+
+    def _node_at(self, r: int, position: int) -> int:
+        route = self.routes[r]
+        if 0 <= position < len(route):
+            return route[position]
+        return DEPOT
+
+    # ===== 近傍操作 =====
+
+    def _try_two_opt(self, u: int) -> float:
+        """u の直後に近傍 v が来るよう区間反転"""
+        dist = self.problem.dist_rows
+        a = self.route_of[u]
+        route = self.routes[a]
+        i = self.index_of[u]
+        next_u = self._node_at(a, i + 1)
+        for v in self.neighbors[u]:
+            if self.route_of[v] != a:
+                continue
+            j = self.index_of[v]
+            if j <= i + 1:
+                continue
+            next_v = self._node_at(a, j + 1)
+            delta = dist[u][v] + dist[next_u][next_v] - dist[u][next_u] - dist[v][next_v]
+            if delta >= -IMPROVEMENT_EPSILON:
+                continue
+            candidate = route[:i + 1] + route[i + 1:j + 1][::-1] + route[j + 1:]
+            if not self._feasible(candidate):
+                continue
+            self.routes[a] = candidate
+            self._refresh_route(a)
+            self.move_counts['two_opt'] += 1
+            return delta
+        return 0.0
+
+    def _try_or_opt(self, u: int) -> float:
+        """u から始まる区間を近傍 v の直後へ移動"""
+        problem = self.problem
+        dist = problem.dist_rows
+        demand = problem.demand_list
+        capacity = problem.capacity_list
+        a = self.route_of[u]
+        route_a = self.routes[a]
+        i = self.index_of[u]
+        prev_u = self._node_at(a, i - 1)
+
+        for length in range(1, self.max_segment_length + 1):
+            if i + length > len(route_a):
+                break
+            segment = route_a[i:i + length]
+            last = segment[-1]
+            after_segment = self._node_at(a, i + length)
+            segment_load = sum(demand[node] for node in segment)
+            removal_gain = (dist[prev_u][u] + dist[last][after_segment] -
+                            dist[prev_u][after_segment])
+
+            for v in self.neighbors[u]:
+                if v in segment:
+                    continue
+                b = self.route_of[v]
+                j = self.index_of[v]
+                if b == a and j == i - 1:
+                    continue
+                after_v = self._node_at(b, j + 1)
+                if b == a and after_v == u:
+                    continue
+                if b != a and self.loads[b] + segment_load > capacity[b]:
+                    continue
+                delta = (dist[v][u] + dist[last][after_v] - dist[v][after_v]) - removal_gain
+                if delta >= -IMPROVEMENT_EPSILON:
+                    continue
+
+                if b == a:
+                    rest = route_a[:i] + route_a[i + length:]
+                    insert_at = rest.index(v) + 1
+                    candidate_a = rest[:insert_at] + segment + rest[insert_at:]
+                    if not self._feasible(candidate_a):
+                        continue
+                    self.routes[a] = candidate_a
+                    self._refresh_route(a)
+                else:
+                    route_b = self.routes[b]
+                    candidate_b = route_b[:j + 1] + segment + route_b[j + 1:]
+                    if not self._feasible(candidate_b):
+                        continue
+                    self.routes[a] = route_a[:i] + route_a[i + length:]
+                    self.routes[b] = candidate_b
+                    self._refresh_route(a)
+                    self._refresh_route(b)
+                self.move_counts['or_opt'] += 1
+                return delta
+        return 0.0
+
+    def _try_cross_exchange(self, u: int) -> float:
+        """u の後続区間と近傍 v から始まる別車両の区間を交換（u → v の辺を作る）"""
+        problem = self.problem
+        dist = problem.dist_rows
+        demand = problem.demand_list
+        capacity = problem.capacity_list
+        a = self.route_of[u]
+        route_a = self.routes[a]
+        i = self.index_of[u]
+        max_length = self.max_segment_length
+
+        for v in self.neighbors[u]:
+            b = self.route_of[v]
+            if b == a:
+                continue
+            route_b = self.routes[b]
+            j = self.index_of[v]
+            prev_v = self._node_at(b, j - 1)
+
+            for length_a in range(1, max_length + 1):
+                if i + 1 + length_a > len(route_a):
+                    break
+                segment_a = route_a[i + 1:i + 1 + length_a]
+                after_a = self._node_at(a, i + 1 + length_a)
+                load_a = sum(demand[node] for node in segment_a)
+
+                for length_b in range(1, max_length + 1):
+                    if j + length_b > len(route_b):
+                        break
+                    segment_b = route_b[j:j + length_b]
+                    after_b = self._node_at(b, j + length_b)
+                    load_b = sum(demand[node] for node in segment_b)
+
+                    new_load_a = self.loads[a] - load_a + load_b
+                    new_load_b = self.loads[b] - load_b + load_a
+                    if (new_load_a > max(capacity[a], self.loads[a]) or
+                            new_load_b > max(capacity[b], self.loads[b])):
+                        continue
+
+                    delta = (dist[u][segment_b[0]] + dist[segment_b[-1]][after_a] +
+                             dist[prev_v][segment_a[0]] + dist[segment_a[-1]][after_b] -
+                             dist[u][segment_a[0]] - dist[segment_a[-1]][after_a] -
+                             dist[prev_v][segment_b[0]] - dist[segment_b[-1]][after_b])
+                    if delta >= -IMPROVEMENT_EPSILON:
+                        continue
+
+                    candidate_a = route_a[:i + 1] + segment_b + route_a[i + 1 + length_a:]
+                    candidate_b = route_b[:j] + segment_a + route_b[j + length_b:]
+                    if not (self._feasible(candidate_a) and self._feasible(candidate_b)):
+                        continue
+                    self.routes[a] = candidate_a
+                    self.routes[b] = candidate_b
+                    self._refresh_route(a)
+                    self._refresh_route(b)
+                    self.move_counts['cross_exchange'] += 1
+                    return delta
+        return 0.0
+
+    # ===== 実行 =====
+
+    def improve(self, routes: List[List[int]],
+                optimization_log: Optional[List[str]] = None,
+                should_stop: Optional[Callable[[], bool]] = None,
+                progress: Optional[Callable[[int, List[List[int]]], None]] = None) -> List[List[int]]:
+        """
+        改善が無くなるか時間予算に達するまで局所探索を繰り返す
+
+        Args:
+            routes: 車両順のルート（ゲストノード番号のリスト）
+            should_stop: True を返したら探索を打ち切る（外部からの停止要求）
+            progress: パスごとに (完了パス数, 現在のルート) で呼ばれる
+
+        Returns:
+            改善後の車両順ルート
+        """
+        problem = self.problem
+        started = time.perf_counter()
+        deadline = started + self.time_limit_ms / 1000
+
+        num_nodes = problem.num_guests + 1
+        self.routes = [list(route) for route in routes]
+        self.route_of = [0] * num_nodes
+        self.index_of = [0] * num_nodes
+        self.limit = [0.0] * num_nodes
+        self.loads = [0] * problem.num_vehicles
+        for r in range(problem.num_vehicles):
+            self._refresh_route(r)
+
+        initial_distance = sum(problem.route_distance(route) for route in self.routes)
+        saved = 0.0
+        passes = 0
+        improved = True
+        self.stop_reason = None
+        while improved:
+            if time.perf_counter() >= deadline:
+                self.stop_reason = 'time_limit'
+                break
+            if self.max_iterations is not None and passes >= self.max_iterations:
+                self.stop_reason = 'iterations'
+                break
+            improved = False
+            passes += 1
+            for u in range(1, num_nodes):
+                delta = (self._try_two_opt(u) or
+                         self._try_or_opt(u) or
+                         self._try_cross_exchange(u))
+                if delta < 0:
+                    saved -= delta
+                    improved = True
+                if time.perf_counter() >= deadline:
+                    break
+                if should_stop is not None and should_stop():
+                    self.stop_reason = 'stopped'
+                    improved = False
+                    break
+            if progress is not None:
+                progress(passes, self.routes)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if optimization_log is not None:
+            optimization_log.append(
+                f"[LOCAL] 局所探索: 2-opt {self.move_counts['two_opt']}回, "
+                f"Or-opt {self.move_counts['or_opt']}回, "
+                f"cross-exchange {self.move_counts['cross_exchange']}回 ({passes}パス)"
+            )
+            optimization_log.append(
+                f"[LOCAL] 距離 {initial_distance:.1f}km → {initial_distance - saved:.1f}km "
+                f"(削減 {saved:.1f}km, 処理時間 {elapsed_ms:.0f}ms)"
+            )
+        return self.routes
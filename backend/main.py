@@ -18,13 +18,22 @@ import logging
 import json
 import os
 import sys
+import threading
+import time
+import uuid
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
-from fastapi import FastAPI, HTTPException, Query
+from typing import Callable, Dict, List, Any, Optional
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 import uvicorn
 
+from result_cache import OptimizationResultCache, SingleFlight, is_cacheable_result, request_cache_key
+from solve_admission import SolveAdmission, SolveRejected
+from tour_models import serialize_routes, serialize_routes_compact
+from ttl_cache import RefreshingTTLCache
+
 # Windows文字エンコーディング対応
 if sys.platform == "win32":
     import codecs
@@ -33,7 +42,10 @@ if sys.platform == "win32":
 
 # 高度オプティマイザーをインポート
 try:
-    from enhanced_optimizer import EnhancedTourOptimizer
+    from enhanced_optimizer import EnhancedTourOptimizer, run_optimization_in_worker
+    from distance_matrix import SharedDistanceMatrix, build_distance_matrix
+    from tour_plans import TourPlanStore
+    from optimization_jobs import JobConflict, JobStore, OptimizationJobQueue
     OPTIMIZER_AVAILABLE = True
     print("[OK] EnhancedTourOptimizer 動的時間決定版インポート成功")
 except ImportError as e:
@@ -75,11 +87,36 @@ app.add_middleware(
 # グローバルオプティマイザーインスタンス
 if OPTIMIZER_AVAILABLE:
     tour_optimizer = EnhancedTourOptimizer()
+    plan_store = TourPlanStore(max_plans=50)  # 🆕 当日変更用の計画（メモリ保持）
+    # 🆕 非同期最適化ジョブ（SQLite 保存、完了後7日間保持）
+    # （実行関数はエンドポイント定義部にあるため呼び出し時に参照する）
+    job_queue = OptimizationJobQueue(JobStore(), lambda *args: execute_optimization_job(*args),
+                                     workers=1, retention_days=7)
     logger.info("[OK] EnhancedTourOptimizer 動的時間決定版初期化完了")
 else:
     tour_optimizer = None
+    plan_store = None
+    job_queue = None
     logger.warning("[WARNING] EnhancedTourOptimizer 使用不可 - フォールバックモード")
 
+# 🆕 車両別ルート最適化ワーカーの事前起動・停止
+@app.on_event("startup")
+async def start_route_workers():
+    if tour_optimizer:
+        await asyncio.get_running_loop().run_in_executor(None, tour_optimizer.route_executor.start)
+    if job_queue:
+        job_queue.start()
+    weather_service.cache.start(interval_seconds=60)
+
+@app.on_event("shutdown")
+async def stop_route_workers():
+    await weather_service.cache.stop()
+    if job_queue:
+        await job_queue.stop()
+    if tour_optimizer:
+        tour_optimizer.route_executor.shutdown()
+    solve_admission.shutdown()
+
 # ===== 強化版気象サービス =====
 
 class EnhancedWeatherService:
@@ -87,8 +124,13 @@ class EnhancedWeatherService:
     
     def __init__(self):
         self.ishigaki_coords = {"lat": 24.3336, "lng": 124.1543, "name": "石垣島"}
-        self.cache = {}
         self.cache_duration = 1800  # 30分キャッシュ
+        # 🆕 日付別キャッシュ（上限64日分、期限5分前から裏で更新し、期限切れ後5分間は古い値を返しつつ更新）
+        self.cache = RefreshingTTLCache(
+            max_entries=64, ttl_seconds=self.cache_duration,
+            refresh_ahead_seconds=300, stale_seconds=300
+        )
+        self.fetches = self.cache.flights  # 🆕 同じ日付の同時取得は1回にまとめる
     
     async def get_enhanced_weather_data(self, date: str = None) -> Dict[str, Any]:
         """
@@ -96,21 +138,15 @@ class EnhancedWeatherService:
         """
         target_date = date or datetime.now().strftime("%Y-%m-%d")
         
-        # キャッシュチェック
+        # キャッシュチェック（期限間近の値は返しつつ裏で更新）
         cache_key = f"weather_{target_date}"
-        if cache_key in self.cache:
-            cached_data, cache_time = self.cache[cache_key]
-            if (datetime.now() - cache_time).seconds < self.cache_duration:
-                return cached_data
         
-        try:
+        async def fetch() -> Dict[str, Any]:
             # 実際の気象データ取得（将来的にAPIを統合）
-            weather_data = await self._fetch_real_weather_data(target_date)
-            
-            # キャッシュに保存
-            self.cache[cache_key] = (weather_data, datetime.now())
-            
-            return weather_data
+            return await self._fetch_real_weather_data(target_date)
+        
+        try:
+            return await self.cache.get(cache_key, fetch)
             
         except Exception as e:
             logger.warning(f"気象データ取得エラー: {e}, フォールバックデータを使用")
@@ -360,6 +396,16 @@ class EnhancedWeatherService:
 # グローバル気象サービスインスタンス
 weather_service = EnhancedWeatherService()
 
+# 🆕 最適化結果キャッシュ（保持期限は気象キャッシュと同じ）
+result_cache = OptimizationResultCache(max_entries=128, ttl_seconds=weather_service.cache_duration)
+# 🆕 実行中の同一リクエストは1回の最適化にまとめる
+optimization_flights = SingleFlight()
+# 🆕 求解は同時実行数固定のスレッドプールで実行（待ち行列・クライアント別上限付き）
+solve_admission = SolveAdmission(max_queue=8, max_per_client=2)
+# 🆕 クライアント切断の確認間隔（秒）と、切断で中止した処理の件数
+CLIENT_DISCONNECT_POLL_SECONDS = 0.25
+client_disconnects = {"optimize": 0, "optimize_stream": 0, "optimize_batch": 0, "compare": 0, "compare_stream": 0}
+
 # ===== データモデル =====
 
 class Guest(BaseModel):
@@ -372,6 +418,16 @@ class Guest(BaseModel):
     preferred_pickup_start: str = "08:30"
     preferred_pickup_end: str = "09:00"
 
+class GuestUpdate(BaseModel):
+    """🆕 計画中ゲストの変更（指定した項目のみ更新）"""
+    name: Optional[str] = None
+    hotel_name: Optional[str] = None
+    pickup_lat: Optional[float] = None
+    pickup_lng: Optional[float] = None
+    num_people: Optional[int] = None
+    preferred_pickup_start: Optional[str] = None
+    preferred_pickup_end: Optional[str] = None
+
 class Vehicle(BaseModel):
     id: Optional[str] = None
     name: str
@@ -393,13 +449,61 @@ class TourRequest(BaseModel):
     activity_location: Optional[ActivityLocation] = None
     algorithm: Optional[str] = "nearest_neighbor"
     include_weather_optimization: Optional[bool] = True  # 🆕 気象最適化フラグ
+    algorithm_parameters: Optional[Dict[str, Any]] = None  # 🆕 アルゴリズム別パラメータ（例: population_size, generations）
+    max_solve_ms: Optional[int] = None  # 🆕 求解時間の上限（超過時は暫定最良解を返す）
+    max_iterations: Optional[int] = None  # 🆕 探索系エンジンの反復回数上限
+    verbose_timing: Optional[bool] = False  # 🆕 停車ごとの到着時間分析（arrival_analysis）を含める
+    response_detail: Optional[str] = None  # 🆕 compact / standard / verbose（未指定は verbose_timing に従う）
+
+class BatchOptimizeRequest(BaseModel):
+    """🆕 複数ツアーの一括最適化"""
+    tours: List[TourRequest]
+
+# ===== 共通データ変換 =====
+
+def guest_to_dict(guest: Guest, default_id: str) -> Dict[str, Any]:
+    """ゲストモデルをオプティマイザー入力の辞書に変換"""
+    return {
+        'id': guest.id or default_id,
+        'name': guest.name,
+        'hotel_name': guest.hotel_name,
+        'pickup_lat': guest.pickup_lat,
+        'pickup_lng': guest.pickup_lng,
+        'num_people': guest.num_people,
+        'preferred_pickup_start': guest.preferred_pickup_start,
+        'preferred_pickup_end': guest.preferred_pickup_end
+    }
+
+def build_optimizer_inputs(tour_request: TourRequest):
+    """リクエストモデルをオプティマイザー入力（地点・ゲスト・車両の辞書）に変換"""
+    # アクティビティ地点のデフォルト設定
+    activity_location = {
+        'lat': tour_request.activity_location.lat if tour_request.activity_location else 24.4167,
+        'lng': tour_request.activity_location.lng if tour_request.activity_location else 124.1556,
+        'name': tour_request.activity_location.name if tour_request.activity_location else "川平湾"
+    }
+    
+    guests_data = [guest_to_dict(guest, f"guest_{i}") for i, guest in enumerate(tour_request.guests)]
+    
+    vehicles_data = [
+        {
+            'id': vehicle.id or f"vehicle_{i}",
+            'name': vehicle.name,
+            'capacity': vehicle.capacity,
+            'driver': vehicle.driver,
+            'location': vehicle.location
+        }
+        for i, vehicle in enumerate(tour_request.vehicles)
+    ]
+    
+    return activity_location, guests_data, vehicles_data
 
 # ===== APIエンドポイント =====
 
 @app.get("/")
 async def root():
     optimizer_status = "動的時間決定AI搭載" if OPTIMIZER_AVAILABLE else "フォールバック"
-    available_algorithms = ["genetic", "simulated_annealing", "nearest_neighbor"] if OPTIMIZER_AVAILABLE else ["fallback"]
+    available_algorithms = ["genetic", "simulated_annealing", "insertion", "savings", "nearest_neighbor"] if OPTIMIZER_AVAILABLE else ["fallback"]
     
     return {
         "message": f"石垣島ツアー最適化API（{optimizer_status}版）",
@@ -417,15 +521,95 @@ async def root():
         "encoding": "UTF-8"
     }
 
-@app.post("/api/ishigaki/optimize")
-async def optimize_tour_routes(tour_request: TourRequest):
+def optimization_cache_key(tour_request: TourRequest, algorithm: str,
+                           weather_data: Optional[Dict[str, Any]],
+                           activity_location: Dict[str, Any],
+                           guests_data: List[Dict[str, Any]],
+                           vehicles_data: List[Dict[str, Any]]) -> str:
+    """最適化結果キャッシュのキー（同一内容のリクエスト・同一気象スナップショットで一致）"""
+    return request_cache_key(
+        guests=guests_data,
+        vehicles=vehicles_data,
+        activity_location=activity_location,
+        start_time=tour_request.start_time,
+        algorithm=algorithm,
+        weather=weather_data,
+        algorithm_parameters=tour_request.algorithm_parameters,
+        max_solve_ms=tour_request.max_solve_ms,
+        max_iterations=tour_request.max_iterations,
+        verbose_timing=wants_verbose_timing(tour_request)
+    )
+
+RESPONSE_DETAILS = ("compact", "standard", "verbose")
+
+def resolve_response_detail(tour_request: TourRequest) -> str:
     """
-    ツアールート最適化（動的時間決定版）
+    レスポンスの詳細度を検証（無効な場合は 400）
+
+    - compact: 停車ごとの気象影響・目的地を上位に1回だけ載せ、最適化ログを省く
+    - standard: 従来の形式
+    - verbose: standard + 停車ごと・目的地の到着時間分析
     """
-    optimization_start_time = datetime.now()
+    if tour_request.response_detail is None:
+        return "verbose" if tour_request.verbose_timing else "standard"
+    if tour_request.response_detail not in RESPONSE_DETAILS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"無効なresponse_detail: {tour_request.response_detail}. 利用可能: {list(RESPONSE_DETAILS)}"
+        )
+    return tour_request.response_detail
+
+def wants_verbose_timing(tour_request: TourRequest) -> bool:
+    """到着時間分析を計算するか（compact・standard は計算しない）"""
+    return resolve_response_detail(tour_request) == "verbose"
+
+def client_id_of(request: Request) -> str:
+    """クライアント別同時実行上限の単位（接続元アドレス）"""
+    return request.client.host if request.client else "unknown"
+
+def submit_solve(request: Request, fn, *args) -> asyncio.Future:
+    """求解をスレッドプールへ投入（受付拒否は Retry-After 付きの 429 / 503）"""
+    try:
+        return solve_admission.submit(client_id_of(request), fn, *args)
+    except SolveRejected as e:
+        logger.warning(f"[ADMISSION] 受付拒否({e.reason}): {client_id_of(request)}, Retry-After {e.retry_after}秒")
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def submit_solve_group(request: Request, calls) -> List[asyncio.Future]:
+    """一括最適化の求解をまとめて受付（1件として判定し、拒否は Retry-After 付きの 429 / 503）"""
+    try:
+        return solve_admission.submit_group(client_id_of(request), calls)
+    except SolveRejected as e:
+        logger.warning(f"[ADMISSION] 一括最適化の受付拒否({e.reason}): {client_id_of(request)}, Retry-After {e.retry_after}秒")
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def record_client_disconnect(endpoint: str) -> None:
+    client_disconnects[endpoint] += 1
+    logger.info(f"[DISCONNECT] クライアント切断のため処理を中止: {endpoint}")
+
+async def cancel_on_disconnect(request: Request, awaitable, endpoint: str):
+    """
+    クライアントが切断したら処理を取り消す（通常レスポンスの最適化・比較用）
     
-    # アルゴリズム検証
-    valid_algorithms = ["genetic", "simulated_annealing", "nearest_neighbor"] if OPTIMIZER_AVAILABLE else ["fallback"]
+    取り消しは求解側へ停止要求として伝わる。切断後のレスポンスは届かないため 499 を返す
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=CLIENT_DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                record_client_disconnect(endpoint)
+                raise HTTPException(status_code=499, detail="クライアント切断のため処理を中止しました")
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+def resolve_algorithm(tour_request: TourRequest) -> str:
+    """リクエストのアルゴリズム名を検証（無効な場合は 400）"""
+    valid_algorithms = ["genetic", "simulated_annealing", "insertion", "savings", "nearest_neighbor", "race"] if OPTIMIZER_AVAILABLE else ["fallback"]
     algorithm = tour_request.algorithm or "nearest_neighbor"
     
     if algorithm not in valid_algorithms:
@@ -433,6 +617,74 @@ async def optimize_tour_routes(tour_request: TourRequest):
             status_code=400, 
             detail=f"無効なアルゴリズム: {algorithm}. 利用可能: {valid_algorithms}"
         )
+    return algorithm
+
+def build_optimization_response(tour_request: TourRequest, optimization_result: Dict[str, Any],
+                                weather_data: Optional[Dict[str, Any]],
+                                optimization_start_time: datetime,
+                                cache_hit: bool = False,
+                                coalesced: bool = False) -> Dict[str, Any]:
+    """オプティマイザーの結果を API レスポンス形式に変換（通常・ストリーミング共通）"""
+    optimization_end_time = datetime.now()
+    optimization_duration = (optimization_end_time - optimization_start_time).total_seconds()
+    
+    logger.info(f"[SUCCESS] 動的時間決定{tour_request.algorithm or 'nearest_neighbor'}最適化完了: {optimization_duration:.2f}秒")
+    logger.info(f"[RESULT] 効率: {optimization_result['efficiency_score']:.1f}%")
+    logger.info(f"[RESULT] 距離: {optimization_result['total_distance']}km")
+    
+    response_detail = resolve_response_detail(tour_request)
+    compact = serialize_routes_compact(optimization_result['routes']) if response_detail == "compact" else None
+    response = {
+        "success": True,
+        "response_detail": response_detail,
+        "routes": compact.pop('routes') if compact else serialize_routes(optimization_result['routes']),
+        "total_distance": optimization_result['total_distance'],
+        "total_time": optimization_result['total_time'],
+        "efficiency_score": optimization_result['efficiency_score'],
+        "optimization_time": round(optimization_duration, 2),
+        "algorithm_used": optimization_result['algorithm_used'],
+        "optimization_log": optimization_result['optimization_log'],
+        "unassigned_guests": optimization_result.get('unassigned_guests', []),
+        "solution_quality": optimization_result.get('solution_quality'),
+        "solve_status": optimization_result.get('solve_status'),
+        "cache_hit": cache_hit,
+        "coalesced": coalesced,  # 🆕 実行中の同一リクエストの結果を共有したか
+        "timestamp": optimization_end_time.isoformat(),
+        "api_version": "2.5.0",
+        # 🆕 気象統合情報
+        "weather_integration": {
+            "enabled": tour_request.include_weather_optimization,
+            "data_used": weather_data is not None,
+            "summary": optimization_result.get('weather_summary', {})
+        }
+    }
+    
+    # 🆕 race モードの各エンジン結果
+    if 'race_summary' in optimization_result:
+        response["race_summary"] = optimization_result['race_summary']
+    
+    # 気象データも含める（オプション）
+    if weather_data and tour_request.include_weather_optimization:
+        response["weather_conditions"] = weather_data
+    
+    # 🆕 compact: 共通の気象影響・目的地を上位へまとめ、ログと気象条件の重複を省く
+    if compact:
+        response.update(compact)
+        del response["optimization_log"]
+        response.pop("weather_conditions", None)
+    
+    return response
+
+@app.post("/api/ishigaki/optimize")
+async def optimize_tour_routes(tour_request: TourRequest, request: Request):
+    """
+    ツアールート最適化（動的時間決定版）
+    """
+    optimization_start_time = datetime.now()
+    
+    # アルゴリズム・レスポンス詳細度検証
+    algorithm = resolve_algorithm(tour_request)
+    resolve_response_detail(tour_request)
     
     logger.info(f"[REQUEST] 動的時間決定最適化要求受信: {tour_request.date} - {tour_request.activity_type}")
     logger.info(f"[REQUEST] アルゴリズム: {algorithm}")
@@ -463,82 +715,60 @@ async def optimize_tour_routes(tour_request: TourRequest):
         if OPTIMIZER_AVAILABLE and tour_optimizer and algorithm != "fallback":
             logger.info(f"[AI] 動的時間決定{algorithm}アルゴリズムで実行")
             
-            # アクティビティ地点のデフォルト設定
-            activity_location = {
-                'lat': tour_request.activity_location.lat if tour_request.activity_location else 24.4167,
-                'lng': tour_request.activity_location.lng if tour_request.activity_location else 124.1556,
-                'name': tour_request.activity_location.name if tour_request.activity_location else "川平湾"
-            }
-            
-            # ゲストデータ変換
-            guests_data = []
-            for guest in tour_request.guests:
-                guest_dict = {
-                    'id': guest.id or f"guest_{len(guests_data)}",
-                    'name': guest.name,
-                    'hotel_name': guest.hotel_name,
-                    'pickup_lat': guest.pickup_lat,
-                    'pickup_lng': guest.pickup_lng,
-                    'num_people': guest.num_people,
-                    'preferred_pickup_start': guest.preferred_pickup_start,
-                    'preferred_pickup_end': guest.preferred_pickup_end
-                }
-                guests_data.append(guest_dict)
-            
-            # 車両データ変換
-            vehicles_data = []
-            for vehicle in tour_request.vehicles:
-                vehicle_dict = {
-                    'id': vehicle.id or f"vehicle_{len(vehicles_data)}",
-                    'name': vehicle.name,
-                    'capacity': vehicle.capacity,
-                    'driver': vehicle.driver,
-                    'location': vehicle.location
-                }
-                vehicles_data.append(vehicle_dict)
+            activity_location, guests_data, vehicles_data = build_optimizer_inputs(tour_request)
             
-            # 🆕 動的時間決定最適化実行
-            optimization_result = await tour_optimizer.optimize_multi_vehicle_routes(
-                guests=guests_data,
-                vehicles=vehicles_data,
-                activity_location=activity_location,
-                activity_start_time=tour_request.start_time,
-                algorithm=algorithm,
-                weather_data=weather_data  # 🆕 気象データを渡す
+            # 🆕 同一リクエスト・同一気象ならキャッシュ済み結果を返す
+            cache_key = optimization_cache_key(
+                tour_request, algorithm, weather_data, activity_location, guests_data, vehicles_data
             )
+            optimization_result = result_cache.get(cache_key)
+            if optimization_result is not None:
+                logger.info(f"[CACHE] 最適化結果キャッシュヒット: {cache_key[:12]}")
+                return build_optimization_response(
+                    tour_request, optimization_result, weather_data, optimization_start_time, cache_hit=True
+                )
             
-            optimization_end_time = datetime.now()
-            optimization_duration = (optimization_end_time - optimization_start_time).total_seconds()
+            stop_requested = threading.Event()
             
-            logger.info(f"[SUCCESS] 動的時間決定{algorithm}最適化完了: {optimization_duration:.2f}秒")
-            logger.info(f"[RESULT] 効率: {optimization_result['efficiency_score']:.1f}%")
-            logger.info(f"[RESULT] 距離: {optimization_result['total_distance']}km")
+            def solve() -> Dict[str, Any]:
+                # 🆕 動的時間決定最適化実行（求解スレッドのイベントループで実行し、APIをブロックしない）
+                return asyncio.run(tour_optimizer.optimize_multi_vehicle_routes(
+                    guests=guests_data,
+                    vehicles=vehicles_data,
+                    activity_location=activity_location,
+                    activity_start_time=tour_request.start_time,
+                    algorithm=algorithm,
+                    weather_data=weather_data,  # 🆕 気象データを渡す
+                    algorithm_parameters=tour_request.algorithm_parameters,
+                    max_solve_ms=tour_request.max_solve_ms,
+                    max_iterations=tour_request.max_iterations,
+                    should_stop=stop_requested.is_set,
+                    verbose_timing=wants_verbose_timing(tour_request)
+                ))
             
-            # レスポンス構築
-            response = {
-                "success": True,
-                "routes": optimization_result['routes'],
-                "total_distance": optimization_result['total_distance'],
-                "total_time": optimization_result['total_time'],
-                "efficiency_score": optimization_result['efficiency_score'],
-                "optimization_time": round(optimization_duration, 2),
-                "algorithm_used": optimization_result['algorithm_used'],
-                "optimization_log": optimization_result['optimization_log'],
-                "timestamp": optimization_end_time.isoformat(),
-                "api_version": "2.5.0",
-                # 🆕 気象統合情報
-                "weather_integration": {
-                    "enabled": tour_request.include_weather_optimization,
-                    "data_used": weather_data is not None,
-                    "summary": optimization_result.get('weather_summary', {})
-                }
-            }
+            async def solve_and_cache() -> Dict[str, Any]:
+                try:
+                    result = await submit_solve(request, solve)
+                except asyncio.CancelledError:
+                    # 結果を待つクライアントが全て切断した: 探索を打ち切って実行枠を空ける
+                    stop_requested.set()
+                    raise
+                if is_cacheable_result(result):
+                    result_cache.put(cache_key, result)
+                return result
             
-            # 気象データも含める（オプション）
-            if weather_data and tour_request.include_weather_optimization:
-                response["weather_conditions"] = weather_data
+            # 🆕 同じキーの最適化が実行中ならその結果を待つ（切断したら待つのをやめる）
+            optimization_result, coalesced = await cancel_on_disconnect(
+                request, optimization_flights.run(cache_key, solve_and_cache), "optimize"
+            )
+            if coalesced:
+                logger.info(f"[CACHE] 実行中の同一リクエストの結果を共有: {cache_key[:12]}")
             
-            return response
+            # レスポンス構築
+            return build_optimization_response(
+                tour_request, optimization_result, weather_data, optimization_start_time,
+                coalesced=coalesced
+            )
             
         else:
             # フォールバック最適化
@@ -547,10 +777,289 @@ async def optimize_tour_routes(tour_request: TourRequest):
             
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"[ERROR] 最適化処理エラー: {e}")
         raise HTTPException(status_code=500, detail=f"最適化処理エラー: {str(e)}")
 
+# 🆕 ストリーミング最適化の実行中ラン（run_id → 停止要求）
+active_optimization_runs: Dict[str, threading.Event] = {}
+
+@app.post("/api/ishigaki/optimize/stream")
+async def optimize_tour_routes_stream(tour_request: TourRequest, request: Request):
+    """
+    🆕 ツアールート最適化（途中経過を順次配信）
+    
+    NDJSON 形式で1行ずつ返す:
+        {"type": "started", "run_id": ...}                      ← 開始時
+        {"type": "progress", "stage": ..., "incumbent": {...}}  ← 暫定解の更新（距離・効率スコア等）
+        {"type": "log", "lines": [...]}                         ← 追加された最適化ログ
+        {"type": "result", ...}                                 ← 完了時（/optimize と同じ内容）
+        {"type": "error", "detail": ...}                        ← 失敗時
+    
+    POST /api/ishigaki/optimize/runs/{run_id}/accept で探索を打ち切り、その時点の暫定解を result として受け取れる。
+    クライアントが切断した場合も探索を停止する。race モードは各エンジンの完了時にのみ結果を返す。
+    """
+    if not OPTIMIZER_AVAILABLE:
+        raise HTTPException(status_code=503, detail="AI最適化機能が利用できません")
+    
+    optimization_start_time = datetime.now()
+    algorithm = resolve_algorithm(tour_request)
+    resolve_response_detail(tour_request)
+    if not tour_request.guests:
+        raise HTTPException(status_code=400, detail="ゲスト情報が必要です")
+    if not tour_request.vehicles:
+        raise HTTPException(status_code=400, detail="車両情報が必要です")
+    
+    logger.info(f"[REQUEST] 最適化要求受信（ストリーミング）: {tour_request.date} - {algorithm}, ゲスト{len(tour_request.guests)}組")
+    
+    weather_data = await get_comparison_weather(tour_request)
+    activity_location, guests_data, vehicles_data = build_optimizer_inputs(tour_request)
+    cache_key = optimization_cache_key(
+        tour_request, algorithm, weather_data, activity_location, guests_data, vehicles_data
+    )
+    
+    def line(message: Dict[str, Any]) -> str:
+        return json.dumps(message, ensure_ascii=False) + "\n"
+    
+    # 🆕 キャッシュ済みなら探索せずに結果だけ返す
+    cached_result = result_cache.get(cache_key)
+    if cached_result is not None:
+        logger.info(f"[CACHE] 最適化結果キャッシュヒット（ストリーミング）: {cache_key[:12]}")
+        
+        async def cached_stream():
+            yield line({"type": "started", "run_id": None, "algorithm": algorithm, "cache_hit": True})
+            response = build_optimization_response(
+                tour_request, cached_result, weather_data, optimization_start_time, cache_hit=True
+            )
+            yield line({"type": "result", "run_id": None, **response})
+        
+        return StreamingResponse(cached_stream(), media_type="application/x-ndjson")
+    
+    run_id = uuid.uuid4().hex[:12]
+    stop_requested = threading.Event()
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    
+    def emit(event: Dict[str, Any]) -> None:
+        # 探索スレッドから呼ばれるためイベントループへ受け渡す
+        loop.call_soon_threadsafe(events.put_nowait, event)
+    
+    def solve() -> Dict[str, Any]:
+        # 探索は同期処理のため、求解スレッドのイベントループで実行しAPIをブロックしない
+        return asyncio.run(tour_optimizer.optimize_multi_vehicle_routes(
+            guests=guests_data,
+            vehicles=vehicles_data,
+            activity_location=activity_location,
+            activity_start_time=tour_request.start_time,
+            algorithm=algorithm,
+            weather_data=weather_data,
+            algorithm_parameters=tour_request.algorithm_parameters,
+            max_solve_ms=tour_request.max_solve_ms,
+            max_iterations=tour_request.max_iterations,
+            should_stop=stop_requested.is_set,
+            progress=emit,
+            verbose_timing=wants_verbose_timing(tour_request)
+        ))
+    
+    # 🆕 受付できない場合はストリーム開始前に 429 / 503 を返す
+    solver = submit_solve(request, solve)
+    active_optimization_runs[run_id] = stop_requested
+    
+    async def stream():
+        finished = False
+        try:
+            yield line({"type": "started", "run_id": run_id, "algorithm": algorithm})
+            while not solver.done() or not events.empty():
+                next_event = asyncio.ensure_future(events.get())
+                await asyncio.wait({next_event, solver}, return_when=asyncio.FIRST_COMPLETED)
+                if next_event.done():
+                    yield line(next_event.result())
+                else:
+                    next_event.cancel()
+            
+            optimization_result = solver.result()
+            if is_cacheable_result(optimization_result):
+                result_cache.put(cache_key, optimization_result)
+            response = build_optimization_response(
+                tour_request, optimization_result, weather_data, optimization_start_time
+            )
+            finished = True
+            yield line({"type": "result", "run_id": run_id, **response})
+        except Exception as e:
+            logger.error(f"[ERROR] ストリーミング最適化エラー: {e}")
+            finished = True
+            yield line({"type": "error", "run_id": run_id, "detail": str(e)})
+        finally:
+            # 正常終了・切断のいずれでも探索を止めてラン登録を解除（待ち行列中なら取り下げ）
+            if not finished:
+                record_client_disconnect("optimize_stream")
+            stop_requested.set()
+            solver.cancel()
+            active_optimization_runs.pop(run_id, None)
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.post("/api/ishigaki/optimize/runs/{run_id}/accept")
+async def accept_optimization_run(run_id: str):
+    """🆕 実行中のストリーミング最適化を打ち切り、現在の暫定解で確定する"""
+    stop_requested = active_optimization_runs.get(run_id)
+    if stop_requested is None:
+        raise HTTPException(status_code=404, detail=f"実行中の最適化が見つかりません: {run_id}")
+    stop_requested.set()
+    logger.info(f"[STREAM] 暫定解で確定要求: {run_id}")
+    return {"success": True, "run_id": run_id, "timestamp": datetime.now().isoformat()}
+
+# 🆕 一括最適化で1回に受け付けるツアー数の上限
+MAX_BATCH_TOURS = 20
+
+@app.post("/api/ishigaki/optimize/batch")
+async def optimize_tour_batch(batch: BatchOptimizeRequest, request: Request):
+    """
+    🆕 複数ツアーの一括最適化（完了したツアーから順次配信）
+    
+    - 気象データは日付ごとに1回だけ取得する
+    - 距離行列は全ツアーの地点（重複は1点）で1回だけ計算し、ツアーごとに切り出す
+    - 各ツアーは /optimize と同じ受付制御（求解スレッドプール・待ち行列）を通して解く。
+      受付はバッチ全体を1件として判定し、拒否時はストリーム開始前に 429 / 503 を返す
+    
+    NDJSON 形式で1行ずつ返す:
+        {"type": "started", "total": ..., "distance_matrix": {...}}  ← 開始時
+        {"type": "result", "index": ..., ...}                        ← 各ツアー完了時（/optimize と同じ内容）
+        {"type": "error", "index": ..., "detail": ...}               ← ツアー単位の失敗
+        {"type": "summary", ...}                                     ← 全ツアー完了後
+    index はリクエストの tours の添字。クライアントが切断した場合は残りのツアーの探索を停止する。
+    """
+    if not OPTIMIZER_AVAILABLE:
+        raise HTTPException(status_code=503, detail="AI最適化機能が利用できません")
+    
+    tours = batch.tours
+    if not tours:
+        raise HTTPException(status_code=400, detail="ツアー情報が必要です")
+    if len(tours) > MAX_BATCH_TOURS:
+        raise HTTPException(status_code=400, detail=f"一括最適化は{MAX_BATCH_TOURS}ツアーまでです")
+    for index, tour_request in enumerate(tours):
+        try:
+            resolve_algorithm(tour_request)
+            resolve_response_detail(tour_request)
+        except HTTPException as e:
+            raise HTTPException(status_code=400, detail=f"tours[{index}]: {e.detail}")
+        if not tour_request.guests:
+            raise HTTPException(status_code=400, detail=f"tours[{index}]: ゲスト情報が必要です")
+        if not tour_request.vehicles:
+            raise HTTPException(status_code=400, detail=f"tours[{index}]: 車両情報が必要です")
+    
+    batch_start_time = datetime.now()
+    logger.info(f"[BATCH] 一括最適化要求受信: {len(tours)}ツアー, ゲスト計{sum(len(t.guests) for t in tours)}組")
+    
+    # 気象データは日付ごとに1回
+    weather_dates = sorted({t.date for t in tours if t.include_weather_optimization})
+    weather_by_date = dict(zip(weather_dates, await asyncio.gather(*[get_current_weather(d) for d in weather_dates])))
+    
+    # 全ツアーの地点で距離行列を1回だけ計算
+    inputs = [build_optimizer_inputs(tour_request) for tour_request in tours]
+    shared_matrix = SharedDistanceMatrix([(location, vehicles, guests) for location, guests, vehicles in inputs])
+    logger.info(f"[BATCH] 共有距離行列: {shared_matrix.size}地点（延べ{shared_matrix.requested_points}地点）")
+    
+    stop_requested = threading.Event()
+    
+    def weather_of(tour_request: TourRequest) -> Optional[Dict[str, Any]]:
+        return weather_by_date.get(tour_request.date) if tour_request.include_weather_optimization else None
+    
+    def solve(index: int):
+        # /optimize と同じく求解スレッドのイベントループで実行（距離行列は共有行列から切り出す）
+        tour_request = tours[index]
+        optimization_start_time = datetime.now()
+        activity_location, guests_data, vehicles_data = inputs[index]
+        return optimization_start_time, asyncio.run(tour_optimizer.optimize_multi_vehicle_routes(
+            guests=guests_data,
+            vehicles=vehicles_data,
+            activity_location=activity_location,
+            activity_start_time=tour_request.start_time,
+            algorithm=resolve_algorithm(tour_request),
+            weather_data=weather_of(tour_request),
+            algorithm_parameters=tour_request.algorithm_parameters,
+            distance_matrix=shared_matrix.for_tour(activity_location, vehicles_data, guests_data),
+            max_solve_ms=tour_request.max_solve_ms,
+            max_iterations=tour_request.max_iterations,
+            should_stop=stop_requested.is_set,
+            verbose_timing=wants_verbose_timing(tour_request)
+        ))
+    
+    # キャッシュに無いツアーだけを受付制御へまとめて投入（拒否時はストリーム開始前に 429 / 503）
+    cache_keys = [
+        optimization_cache_key(tour_request, resolve_algorithm(tour_request), weather_of(tour_request),
+                               *inputs[index])
+        for index, tour_request in enumerate(tours)
+    ]
+    cached = [result_cache.get(cache_key) for cache_key in cache_keys]
+    misses = [index for index, result in enumerate(cached) if result is None]
+    solvers = dict(zip(misses, submit_solve_group(request, [(solve, (index,)) for index in misses])))
+    
+    async def run(index: int):
+        tour_request = tours[index]
+        try:
+            if index in solvers:
+                optimization_start_time, optimization_result = await solvers[index]
+                if is_cacheable_result(optimization_result):
+                    result_cache.put(cache_keys[index], optimization_result)
+            else:
+                optimization_start_time, optimization_result = datetime.now(), cached[index]
+            return index, build_optimization_response(
+                tour_request, optimization_result, weather_of(tour_request), optimization_start_time,
+                cache_hit=index not in solvers
+            ), None
+        except Exception as e:
+            logger.error(f"[BATCH] tours[{index}] エラー: {e}")
+            return index, None, str(e)
+    
+    def line(message: Dict[str, Any]) -> str:
+        return json.dumps(message, ensure_ascii=False) + "\n"
+    
+    async def stream():
+        tasks = [asyncio.ensure_future(run(index)) for index in range(len(tours))]
+        completed = 0
+        failed = 0
+        total_distance = 0.0
+        try:
+            yield line({
+                "type": "started",
+                "total": len(tours),
+                "weather_dates": weather_dates,
+                "distance_matrix": {"points": shared_matrix.size, "requested_points": shared_matrix.requested_points}
+            })
+            for finished in asyncio.as_completed(tasks):
+                index, response, error = await finished
+                if error is None:
+                    completed += 1
+                    total_distance += response["total_distance"]
+                    yield line({"type": "result", "index": index, **response})
+                else:
+                    failed += 1
+                    yield line({"type": "error", "index": index, "detail": error})
+            
+            batch_duration = (datetime.now() - batch_start_time).total_seconds()
+            logger.info(f"[BATCH] 一括最適化完了: {completed}/{len(tours)}ツアー, {batch_duration:.2f}秒")
+            yield line({
+                "type": "summary",
+                "total": len(tours),
+                "completed": completed,
+                "failed": failed,
+                "total_distance": round(total_distance, 1),
+                "optimization_time": round(batch_duration, 2),
+                "timestamp": datetime.now().isoformat()
+            })
+        finally:
+            # 切断時は実行中のツアーへ停止要求を送り、待機中のツアーは待ち行列から外す
+            if any(not task.done() for task in tasks):
+                record_client_disconnect("optimize_batch")
+                stop_requested.set()
+                for solver in solvers.values():
+                    solver.cancel()
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @app.get("/api/ishigaki/environmental")
 async def get_environmental_data(date: str = Query(None, description="対象日付 (YYYY-MM-DD)")):
     """強化版環境データ取得"""
@@ -599,9 +1108,10 @@ async def get_available_algorithms():
                 "name": "genetic",
                 "display_name": "遺伝的アルゴリズム",
                 "description": "進化的計算による高精度最適化（気象対応）",
-                "processing_time": "1-3秒",
+                "processing_time": "max_solve_ms以内（未指定時は世代数で終了）",
                 "recommended_for": "複雑な制約条件・高精度要求",
                 "weather_integration": True,
+                "anytime": True,
                 "parameters": {
                     "population_size": 40,
                     "generations": 75,
@@ -612,12 +1122,54 @@ async def get_available_algorithms():
                 "name": "simulated_annealing", 
                 "display_name": "シミュレーテッドアニーリング",
                 "description": "焼きなまし法による動的時間最適化",
-                "processing_time": "0.5-1秒",
+                "processing_time": "max_solve_ms と time_limit_ms の短い方以内",
                 "recommended_for": "バランス重視・気象適応",
                 "weather_integration": True,
+                "anytime": True,
                 "parameters": {
                     "initial_temperature": 200,
                     "cooling_rate": 0.95,
+                    "time_limit_ms": 1000,
+                    "dynamic_timing": True
+                }
+            },
+            {
+                "name": "insertion",
+                "display_name": "時間枠付き挿入法",
+                "description": "希望時間帯を守るregret挿入によるルート構築（VRPTW）",
+                "processing_time": "0.1-0.5秒",
+                "recommended_for": "希望時間帯の厳守・ゲスト数が多い日",
+                "weather_integration": True,
+                "anytime": False,
+                "parameters": {
+                    "strategy": "regret",
+                    "regret_k": 2,
+                    "dynamic_timing": True
+                }
+            },
+            {
+                "name": "savings",
+                "display_name": "節約法（Clarke-Wright）",
+                "description": "アクティビティ地点基準の節約値によるルート連結（車両定員考慮）",
+                "processing_time": "0.1秒",
+                "recommended_for": "50組以上の日・メタヒューリスティクスの初期解",
+                "weather_integration": True,
+                "anytime": False,
+                "parameters": {
+                    "dynamic_timing": True
+                }
+            },
+            {
+                "name": "race",
+                "display_name": "同時実行（自動選択）",
+                "description": "最近傍法+局所探索・SA・GAを並列実行し、締切内の最良解を採用",
+                "processing_time": "2秒（max_solve_msで指定）",
+                "recommended_for": "翌日計画の作成・アルゴリズム選択に迷う日",
+                "weather_integration": True,
+                "anytime": True,
+                "parameters": {
+                    "max_solve_ms": 2000,
+                    "target_efficiency_score": None,
                     "dynamic_timing": True
                 }
             },
@@ -628,6 +1180,7 @@ async def get_available_algorithms():
                 "processing_time": "0.1秒",
                 "recommended_for": "高速処理・基本最適化",
                 "weather_integration": True,
+                "anytime": True,
                 "parameters": {
                     "dynamic_timing": True
                 }
@@ -650,105 +1203,126 @@ async def get_available_algorithms():
         "algorithms": algorithms,
         "default_algorithm": "nearest_neighbor",
         "optimizer_available": OPTIMIZER_AVAILABLE,
-        "features": ["dynamic_timing", "weather_integration"],
+        "features": ["dynamic_timing", "weather_integration", "solve_budget"],
+        # 🆕 リクエスト単位の求解予算（anytime=True のエンジンは締切時点の暫定最良解を返す）
+        "solve_budget": {
+            "max_solve_ms": "求解時間の上限（ms）。超過時は solve_status.cut_short=true",
+            "max_iterations": "探索系エンジン（GA世代・SA評価回数・局所探索パス）の反復上限",
+            "constructive_stages": "挿入法・節約法・割当の構築処理は打ち切らず完了まで実行"
+        },
         "timestamp": datetime.now().isoformat()
     }
 
-@app.post("/api/ishigaki/compare")
-async def compare_algorithms(tour_request: TourRequest):
-    """アルゴリズム比較実行（気象対応版）"""
-    if not OPTIMIZER_AVAILABLE:
-        raise HTTPException(status_code=503, detail="AI最適化機能が利用できません")
+# 🆕 比較対象アルゴリズム（表示名）
+COMPARISON_ALGORITHMS = {
+    "genetic": "遺伝的アルゴリズム（智能時間決定）",
+    "simulated_annealing": "シミュレーテッドアニーリング（動的時間）",
+    "insertion": "時間枠付き挿入法（VRPTW）",
+    "savings": "節約法（Clarke-Wright）",
+    "nearest_neighbor": "最近傍法（気象対応）"
+}
+
+async def get_current_weather(date: str) -> Optional[Dict[str, Any]]:
+    """最適化に使う指定日の気象条件（取得失敗時は None = デフォルト値）"""
+    try:
+        weather_response = await weather_service.get_enhanced_weather_data(date)
+        return weather_response.get('current_conditions', {})
+    except Exception as e:
+        logger.warning(f"気象データ取得失敗: {e}")
+        return None
+
+async def get_comparison_weather(tour_request: TourRequest) -> Optional[Dict[str, Any]]:
+    """比較用気象データ取得"""
+    if not tour_request.include_weather_optimization:
+        return None
+    return await get_current_weather(tour_request.date)
+
+def run_algorithm_comparison(request: Request, tour_request: TourRequest,
+                             weather_data: Optional[Dict[str, Any]]):
+    """
+    全アルゴリズムを受付制御経由でワーカープロセスへ投入し、完了順に (アルゴリズム, 結果) を返す非同期イテレータを作る
     
-    logger.info(f"[COMPARE] アルゴリズム比較開始: {tour_request.date}")
+    🆕 比較全体を solve_admission で1件として受付する（拒否時はこの呼び出しで 429 / 503）
+    リクエスト変換と距離行列構築は1回だけ行い、各アルゴリズムで共有する
+    途中で取り消された場合（クライアント切断）は待ち行列から取り下げ、実行中のアルゴリズムへ停止要求を送る
+    """
+    activity_location, guests_data, vehicles_data = build_optimizer_inputs(tour_request)
+    distance_matrix = build_distance_matrix(activity_location, vehicles_data, guests_data)
+    executor = tour_optimizer.route_executor
+    stop_requested = threading.Event()
+    running_slots: List[Optional[int]] = []
+    slots_lock = threading.Lock()
     
-    # 気象データ取得
-    weather_data = None
-    if tour_request.include_weather_optimization:
+    def solve(algorithm: str) -> Dict[str, Any]:
+        # 実行枠を得たスレッドからワーカープロセスへ投入（停止番号は求解ごとに確保・返却）
+        slot = executor.open_cancel_slot()
+        with slots_lock:
+            running_slots.append(slot)
+            if stop_requested.is_set():
+                executor.cancel(slot)
         try:
-            weather_response = await weather_service.get_enhanced_weather_data(tour_request.date)
-            weather_data = weather_response.get('current_conditions', {})
-        except Exception as e:
-            logger.warning(f"比較用気象データ取得失敗: {e}")
+            return asyncio.run(executor.run(
+                run_optimization_in_worker,
+                guests_data, vehicles_data, activity_location, tour_request.start_time,
+                algorithm, weather_data, tour_request.algorithm_parameters, distance_matrix,
+                slot, tour_request.max_solve_ms, tour_request.max_iterations
+            ))
+        finally:
+            with slots_lock:
+                running_slots.remove(slot)
+            executor.release_cancel_slot(slot)
     
-    algorithms = ["genetic", "simulated_annealing", "nearest_neighbor"]
-    results = {}
+    def stop() -> None:
+        with slots_lock:
+            stop_requested.set()
+            for slot in running_slots:
+                executor.cancel(slot)
     
-    for algorithm in algorithms:
+    solvers = dict(zip(
+        COMPARISON_ALGORITHMS,
+        submit_solve_group(request, [(solve, (algorithm,)) for algorithm in COMPARISON_ALGORITHMS])
+    ))
+    
+    async def run(algorithm: str):
         try:
-            start_time = datetime.now()
-            
-            # 共通データ準備
-            activity_location = {
-                'lat': tour_request.activity_location.lat if tour_request.activity_location else 24.4167,
-                'lng': tour_request.activity_location.lng if tour_request.activity_location else 124.1556,
-                'name': tour_request.activity_location.name if tour_request.activity_location else "川平湾"
-            }
-            
-            guests_data = [
-                {
-                    'id': guest.id or f"guest_{i}",
-                    'name': guest.name,
-                    'hotel_name': guest.hotel_name,
-                    'pickup_lat': guest.pickup_lat,
-                    'pickup_lng': guest.pickup_lng,
-                    'num_people': guest.num_people,
-                    'preferred_pickup_start': guest.preferred_pickup_start,
-                    'preferred_pickup_end': guest.preferred_pickup_end
-                }
-                for i, guest in enumerate(tour_request.guests)
-            ]
-            
-            vehicles_data = [
-                {
-                    'id': vehicle.id or f"vehicle_{i}",
-                    'name': vehicle.name,
-                    'capacity': vehicle.capacity,
-                    'driver': vehicle.driver,
-                    'location': vehicle.location
-                }
-                for i, vehicle in enumerate(tour_request.vehicles)
-            ]
-            
-            # 動的時間決定最適化実行
-            result = await tour_optimizer.optimize_multi_vehicle_routes(
-                guests=guests_data,
-                vehicles=vehicles_data,
-                activity_location=activity_location,
-                activity_start_time=tour_request.start_time,
-                algorithm=algorithm,
-                weather_data=weather_data
-            )
-            
-            end_time = datetime.now()
-            
-            results[algorithm] = {
+            result = await solvers[algorithm]
+            return algorithm, {
                 "efficiency_score": result["efficiency_score"],
                 "total_distance": result["total_distance"],
                 "total_time": result["total_time"],
                 "optimization_time": result["optimization_time"],
                 "routes_count": len(result["routes"]),
-                "algorithm_display": {
-                    "nearest_neighbor": "最近傍法（気象対応）",
-                    "simulated_annealing": "シミュレーテッドアニーリング（動的時間）",
-                    "genetic": "遺伝的アルゴリズム（智能時間決定）"
-                }[algorithm],
+                "unassigned_count": len(result.get("unassigned_guests", [])),
+                "cut_short": result["solve_status"]["cut_short"],
+                "algorithm_display": COMPARISON_ALGORITHMS[algorithm],
                 "weather_integration": weather_data is not None,
                 "timing_optimization": True
             }
-            
         except Exception as e:
             logger.error(f"[COMPARE] {algorithm} エラー: {e}")
-            results[algorithm] = {
+            return algorithm, {
                 "error": str(e),
-                "algorithm_display": {
-                    "nearest_neighbor": "最近傍法（気象対応）",
-                    "simulated_annealing": "シミュレーテッドアニーリング（動的時間）", 
-                    "genetic": "遺伝的アルゴリズム（智能時間決定）"
-                }[algorithm]
+                "algorithm_display": COMPARISON_ALGORITHMS[algorithm]
             }
     
-    # 最良アルゴリズム特定
+    async def results():
+        tasks = [asyncio.ensure_future(run(algorithm)) for algorithm in COMPARISON_ALGORITHMS]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            if not all(task.done() for task in tasks):
+                stop()
+            for solver in solvers.values():
+                solver.cancel()
+            for task in tasks:
+                task.cancel()
+    
+    return results()
+
+def summarize_comparison(results: Dict[str, Dict], weather_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """比較結果（アルゴリズム定義順に整列）から最良アルゴリズムを特定"""
+    results = {algorithm: results[algorithm] for algorithm in COMPARISON_ALGORITHMS if algorithm in results}
     best_algorithm = None
     best_efficiency = 0
     
@@ -769,6 +1343,293 @@ async def compare_algorithms(tour_request: TourRequest):
         "timestamp": datetime.now().isoformat()
     }
 
+@app.post("/api/ishigaki/compare")
+async def compare_algorithms(tour_request: TourRequest, request: Request):
+    """アルゴリズム比較実行（気象対応版・並列実行、クライアント切断で中止）"""
+    if not OPTIMIZER_AVAILABLE:
+        raise HTTPException(status_code=503, detail="AI最適化機能が利用できません")
+    
+    logger.info(f"[COMPARE] アルゴリズム比較開始: {tour_request.date}")
+    
+    weather_data = await get_comparison_weather(tour_request)
+    comparison = run_algorithm_comparison(request, tour_request, weather_data)
+    
+    async def collect() -> Dict[str, Dict]:
+        results = {}
+        try:
+            async for algorithm, result in comparison:
+                results[algorithm] = result
+        finally:
+            await comparison.aclose()
+        return results
+    
+    results = await cancel_on_disconnect(request, collect(), "compare")
+    return summarize_comparison(results, weather_data)
+
+@app.post("/api/ishigaki/compare/stream")
+async def compare_algorithms_stream(tour_request: TourRequest, request: Request):
+    """
+    🆕 アルゴリズム比較（完了したアルゴリズムから順次配信）
+    
+    NDJSON 形式で1行ずつ返す:
+        {"type": "result", "algorithm": ..., "result": {...}}  ← 各アルゴリズム完了時
+        {"type": "summary", ...}                              ← 全完了後（/compare と同じ内容）
+    """
+    if not OPTIMIZER_AVAILABLE:
+        raise HTTPException(status_code=503, detail="AI最適化機能が利用できません")
+    
+    logger.info(f"[COMPARE] アルゴリズム比較開始（ストリーミング）: {tour_request.date}")
+    
+    weather_data = await get_comparison_weather(tour_request)
+    
+    # 🆕 受付できない場合はストリーム開始前に 429 / 503 を返す
+    comparison = run_algorithm_comparison(request, tour_request, weather_data)
+    
+    async def stream():
+        results = {}
+        try:
+            async for algorithm, result in comparison:
+                results[algorithm] = result
+                yield json.dumps({
+                    "type": "result",
+                    "algorithm": algorithm,
+                    "result": result,
+                    "completed": len(results),
+                    "total": len(COMPARISON_ALGORITHMS)
+                }, ensure_ascii=False) + "\n"
+        finally:
+            # 🆕 切断時は残りのアルゴリズムを停止
+            if len(results) < len(COMPARISON_ALGORITHMS):
+                record_client_disconnect("compare_stream")
+            await comparison.aclose()
+        
+        summary = summarize_comparison(results, weather_data)
+        yield json.dumps({"type": "summary", **summary}, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+# ===== 🆕 計画の当日変更（ゲスト追加・キャンセル・変更） =====
+
+def get_plan_or_404(plan_id: str):
+    if not OPTIMIZER_AVAILABLE:
+        raise HTTPException(status_code=503, detail="AI最適化機能が利用できません")
+    plan = plan_store.get(plan_id)
+    if plan is None:
+        raise HTTPException(status_code=404, detail=f"計画が見つかりません: {plan_id}")
+    return plan
+
+def plan_response(result: Dict[str, Any], started: float) -> Dict[str, Any]:
+    """計画操作の結果に処理時間を付けて返す"""
+    return {
+        "success": True,
+        **result,
+        "routes": serialize_routes(result['routes']),
+        "update_time_ms": round((time.perf_counter() - started) * 1000, 1),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/api/ishigaki/plans")
+async def create_tour_plan(tour_request: TourRequest, request: Request):
+    """
+    計画を作成（通常の最適化を実行し、ルートと距離行列を保持）
+    
+    以降のゲスト追加・キャンセル・変更は /plans/{plan_id}/guests で全体再計算なしに反映する
+    """
+    if not OPTIMIZER_AVAILABLE:
+        raise HTTPException(status_code=503, detail="AI最適化機能が利用できません")
+    algorithm = resolve_algorithm(tour_request)
+    if not tour_request.guests:
+        raise HTTPException(status_code=400, detail="ゲスト情報が必要です")
+    if not tour_request.vehicles:
+        raise HTTPException(status_code=400, detail="車両情報が必要です")
+    
+    started = time.perf_counter()
+    weather_data = await get_comparison_weather(tour_request)
+    activity_location, guests_data, vehicles_data = build_optimizer_inputs(tour_request)
+    
+    def solve():
+        return asyncio.run(tour_optimizer.create_plan(
+            uuid.uuid4().hex[:12], guests_data, vehicles_data, activity_location,
+            tour_request.start_time, algorithm, weather_data, tour_request.algorithm_parameters,
+            tour_request.max_solve_ms, tour_request.max_iterations
+        ))
+    
+    try:
+        plan, _ = await submit_solve(request, solve)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # 求解スレッドのイベントループで作られたロックを、API側のループで使うものに作り直す
+    plan.lock = asyncio.Lock()
+    plan_store.add(plan)
+    logger.info(f"[PLAN] 計画作成: {plan.plan_id} ({len(guests_data)}組, {algorithm})")
+    return plan_response(tour_optimizer.plan_result(plan), started)
+
+@app.get("/api/ishigaki/plans/{plan_id}")
+async def get_tour_plan(plan_id: str):
+    """計画の現在のルート"""
+    started = time.perf_counter()
+    plan = get_plan_or_404(plan_id)
+    return plan_response(tour_optimizer.plan_result(plan), started)
+
+@app.delete("/api/ishigaki/plans/{plan_id}")
+async def delete_tour_plan(plan_id: str):
+    """計画を破棄"""
+    get_plan_or_404(plan_id)
+    plan_store.remove(plan_id)
+    return {"success": True, "plan_id": plan_id, "timestamp": datetime.now().isoformat()}
+
+@app.post("/api/ishigaki/plans/{plan_id}/guests")
+async def add_plan_guest(plan_id: str, guest: Guest):
+    """ゲスト追加（空き定員のある車両へ最安挿入 + 挿入先ルートの局所修正）"""
+    started = time.perf_counter()
+    plan = get_plan_or_404(plan_id)
+    async with plan.lock:
+        guest_data = guest_to_dict(guest, f"guest_{uuid.uuid4().hex[:8]}")
+        if guest_data['id'] in plan.guests:
+            raise HTTPException(status_code=409, detail=f"ゲストIDが重複しています: {guest_data['id']}")
+        result = await tour_optimizer.add_plan_guest(plan, guest_data)
+    logger.info(f"[PLAN] ゲスト追加: {plan_id} {guest_data['id']} ({(time.perf_counter() - started) * 1000:.1f}ms)")
+    return plan_response(result, started)
+
+@app.put("/api/ishigaki/plans/{plan_id}/guests/{guest_id}")
+async def update_plan_guest(plan_id: str, guest_id: str, update: GuestUpdate):
+    """ゲスト変更（人数・地点・希望時間の変更は再配置、名前等のみなら表示のみ更新）"""
+    started = time.perf_counter()
+    plan = get_plan_or_404(plan_id)
+    async with plan.lock:
+        if guest_id not in plan.guests:
+            raise HTTPException(status_code=404, detail=f"ゲストが見つかりません: {guest_id}")
+        changes = update.model_dump(exclude_none=True)
+        result = await tour_optimizer.update_plan_guest(plan, guest_id, changes)
+    logger.info(f"[PLAN] ゲスト変更: {plan_id} {guest_id} ({(time.perf_counter() - started) * 1000:.1f}ms)")
+    return plan_response(result, started)
+
+@app.delete("/api/ishigaki/plans/{plan_id}/guests/{guest_id}")
+async def remove_plan_guest(plan_id: str, guest_id: str):
+    """ゲストキャンセル（停車を除去してルートを詰め、空いた定員で未割当ゲストを救済）"""
+    started = time.perf_counter()
+    plan = get_plan_or_404(plan_id)
+    async with plan.lock:
+        if guest_id not in plan.guests:
+            raise HTTPException(status_code=404, detail=f"ゲストが見つかりません: {guest_id}")
+        result = await tour_optimizer.remove_plan_guest(plan, guest_id)
+    logger.info(f"[PLAN] キャンセル: {plan_id} {guest_id} ({(time.perf_counter() - started) * 1000:.1f}ms)")
+    return plan_response(result, started)
+
+# ===== 🆕 非同期最適化ジョブ（複数日・全車両の大規模計算） =====
+
+# ジョブの求解を受付制御で数えるときのクライアントID（ジョブワーカー数 ≦ クライアント上限）
+JOB_CLIENT_ID = "jobs"
+
+async def execute_optimization_job(request_data: Dict[str, Any],
+                                   should_stop: Callable[[], bool]) -> Dict[str, Any]:
+    """ジョブ1件を実行し、/optimize と同じ形式の結果を返す（最適化エンジン・結果キャッシュは共通）"""
+    optimization_start_time = datetime.now()
+    tour_request = TourRequest(**request_data)
+    algorithm = resolve_algorithm(tour_request)
+    weather_data = await get_comparison_weather(tour_request)
+    activity_location, guests_data, vehicles_data = build_optimizer_inputs(tour_request)
+    
+    cache_key = optimization_cache_key(
+        tour_request, algorithm, weather_data, activity_location, guests_data, vehicles_data
+    )
+    optimization_result = result_cache.get(cache_key)
+    if optimization_result is not None:
+        return build_optimization_response(
+            tour_request, optimization_result, weather_data, optimization_start_time, cache_hit=True
+        )
+    
+    def solve() -> Dict[str, Any]:
+        # 求解スレッドのイベントループで実行（取り消しは should_stop で暫定解に切り上げる）
+        return asyncio.run(tour_optimizer.optimize_multi_vehicle_routes(
+            guests=guests_data,
+            vehicles=vehicles_data,
+            activity_location=activity_location,
+            activity_start_time=tour_request.start_time,
+            algorithm=algorithm,
+            weather_data=weather_data,
+            algorithm_parameters=tour_request.algorithm_parameters,
+            max_solve_ms=tour_request.max_solve_ms,
+            max_iterations=tour_request.max_iterations,
+            should_stop=should_stop,
+            verbose_timing=wants_verbose_timing(tour_request)
+        ))
+    
+    # /optimize と同じ受付制御の求解スレッドプールで実行（待ち行列が満杯なら空くまで待つ）
+    while True:
+        try:
+            solver = solve_admission.submit(JOB_CLIENT_ID, solve)
+            break
+        except SolveRejected as e:
+            if should_stop():
+                raise RuntimeError("受付待ちの間に取り消されました")
+            logger.info(f"[JOBS] 求解の受付待ち({e.reason}): {e.retry_after}秒後に再試行")
+            await asyncio.sleep(e.retry_after)
+    optimization_result = await solver
+    if is_cacheable_result(optimization_result):
+        result_cache.put(cache_key, optimization_result)
+    return build_optimization_response(tour_request, optimization_result, weather_data, optimization_start_time)
+
+def get_job_or_404(job_id: str):
+    if not OPTIMIZER_AVAILABLE:
+        raise HTTPException(status_code=503, detail="AI最適化機能が利用できません")
+    job = job_queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"ジョブが見つかりません: {job_id}")
+    return job
+
+@app.post("/api/ishigaki/jobs", status_code=202)
+async def create_optimization_job(tour_request: TourRequest, response: Response,
+                                  priority: str = Query("interactive", description="優先度 (interactive / batch)"),
+                                  idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    """
+    最適化ジョブを登録（202 とジョブIDを即座に返し、結果は GET /jobs/{job_id} で取得）
+    
+    同じ Idempotency-Key の再送は既存のジョブを返す（200）。内容が異なる場合は 409
+    """
+    if not OPTIMIZER_AVAILABLE:
+        raise HTTPException(status_code=503, detail="AI最適化機能が利用できません")
+    resolve_algorithm(tour_request)
+    resolve_response_detail(tour_request)
+    if not tour_request.guests:
+        raise HTTPException(status_code=400, detail="ゲスト情報が必要です")
+    if not tour_request.vehicles:
+        raise HTTPException(status_code=400, detail="車両情報が必要です")
+    
+    try:
+        job, created = job_queue.submit(tour_request.model_dump(), priority, idempotency_key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not created:
+        response.status_code = 200
+        logger.info(f"[JOBS] 冪等キー一致のため既存ジョブを返却: {job.job_id}")
+    return {
+        "success": True,
+        "job": job.summary(),
+        "idempotent_replay": not created,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/api/ishigaki/jobs/{job_id}")
+async def get_optimization_job(job_id: str):
+    """ジョブの状態（完了していれば最適化結果を含む）"""
+    job = get_job_or_404(job_id)
+    return {"success": True, "job": job.summary(include_result=True), "timestamp": datetime.now().isoformat()}
+
+@app.delete("/api/ishigaki/jobs/{job_id}")
+async def cancel_optimization_job(job_id: str):
+    """ジョブの取り消し（待機中は取り下げ、実行中は停止要求。完了済みは 409）"""
+    get_job_or_404(job_id)
+    try:
+        job = job_queue.cancel(job_id)
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"ジョブが見つかりません: {job_id}")
+    return {"success": True, "job": job.summary(), "timestamp": datetime.now().isoformat()}
+
 @app.get("/api/ishigaki/statistics")
 async def get_statistics():
     """統計データ取得"""
@@ -790,6 +1651,15 @@ async def get_statistics():
         return {
             "success": True,
             "statistics": stats,
+            "result_cache": result_cache.stats(),  # 🆕 最適化結果キャッシュのヒット率等
+            "weather_cache": weather_service.cache.stats(),  # 🆕 気象キャッシュのヒット率・経過時間・更新件数
+            "single_flight": {  # 🆕 同時実行の集約
+                "optimize": optimization_flights.stats(),
+                "weather": weather_service.fetches.stats()
+            },
+            "solve_admission": solve_admission.stats(),  # 🆕 求解の実行数・待ち行列・待ち時間・拒否件数・取り消し件数
+            "client_disconnects": dict(client_disconnects),  # 🆕 クライアント切断で中止した処理
+            "optimization_jobs": job_queue.stats() if job_queue else None,  # 🆕 非同期ジョブの件数
             "system_info": {
                 "optimizer_available": OPTIMIZER_AVAILABLE,
                 "version": "2.5.0",
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+optimization_jobs.py - 非同期最適化ジョブ（複数日・全車両の大規模計算用）
+石垣島ツアー最適化システム
+
+- ジョブは SQLite（tour_data.db）に保存し、サーバー再起動後も結果を参照できる
+  （再起動時に待機中・実行中だったジョブは待ち行列へ戻して再実行する）
+- 優先度クラス: interactive（画面からの依頼）は batch（夜間一括計算）より先に実行する
+- 冪等キー（Idempotency-Key）が同じ再送は新しいジョブを作らず、既存のジョブを返す
+  （同じキーで内容の異なる依頼は衝突として扱う）
+- 実行は同時実行数固定のワーカーで行い、実行中のジョブは停止要求で打ち切る
+- 完了したジョブは保持期間を過ぎたら削除する
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import sqlite3
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from database import DB_PATH
+from result_cache import request_cache_key
+
+logger = logging.getLogger(__name__)
+
+# 優先度クラス（値が小さいほど先に実行）
+PRIORITIES = {'interactive': 0, 'batch': 1}
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+
+class JobConflict(Exception):
+    """同じ冪等キーで内容の異なる依頼、または完了済みジョブの取り消し"""
+
+
+@dataclass
+class OptimizationJob:
+    """最適化ジョブ"""
+    job_id: str
+    priority: str
+    status: str                      # queued / running / succeeded / failed / cancelled
+    request: Dict[str, Any]
+    request_hash: str
+    idempotency_key: Optional[str]
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    def summary(self, include_result: bool = False) -> Dict[str, Any]:
+        summary = {
+            'job_id': self.job_id,
+            'priority': self.priority,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error
+        }
+        if include_result:
+            summary['result'] = self.result
+        return summary
+
+
+class JobStore:
+    """ジョブの SQLite 保存（操作ごとに接続を開く）"""
+
+    COLUMNS = ('job_id', 'priority', 'status', 'request', 'request_hash', 'idempotency_key',
+               'created_at', 'started_at', 'finished_at', 'result', 'error')
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS optimization_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    priority TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    request TEXT NOT NULL,
+                    request_hash TEXT NOT NULL,
+                    idempotency_key TEXT UNIQUE,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT,
+                    result TEXT,
+                    error TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_optimization_jobs_status ON optimization_jobs (status)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _job(self, row: Optional[sqlite3.Row]) -> Optional[OptimizationJob]:
+        if row is None:
+            return None
+        values = dict(row)
+        values['request'] = json.loads(values['request'])
+        values['result'] = json.loads(values['result']) if values['result'] is not None else None
+        return OptimizationJob(**values)
+
+    def insert(self, job: OptimizationJob) -> None:
+        """保存（同じ冪等キーが既にあれば sqlite3.IntegrityError）"""
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT INTO optimization_jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                (job.job_id, job.priority, job.status, json.dumps(job.request, ensure_ascii=False),
+                 job.request_hash, job.idempotency_key, job.created_at, job.started_at, job.finished_at,
+                 None, job.error)
+            )
+
+    def update(self, job: OptimizationJob) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE optimization_jobs SET status = ?, started_at = ?, finished_at = ?, result = ?, error = ? "
+                "WHERE job_id = ?",
+                (job.status, job.started_at, job.finished_at,
+                 json.dumps(job.result, ensure_ascii=False) if job.result is not None else None,
+                 job.error, job.job_id)
+            )
+
+    def get(self, job_id: str) -> Optional[OptimizationJob]:
+        with self._connect() as conn:
+            return self._job(conn.execute("SELECT * FROM optimization_jobs WHERE job_id = ?", (job_id,)).fetchone())
+
+    def find_by_idempotency_key(self, key: str) -> Optional[OptimizationJob]:
+        with self._connect() as conn:
+            return self._job(conn.execute(
+                "SELECT * FROM optimization_jobs WHERE idempotency_key = ?", (key,)
+            ).fetchone())
+
+    def pending(self) -> List[OptimizationJob]:
+        """未完了のジョブ（作成順）"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM optimization_jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def purge(self, retention_days: float) -> int:
+        """保持期間を過ぎた完了済みジョブを削除"""
+        cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"DELETE FROM optimization_jobs WHERE status IN ({', '.join('?' * len(FINISHED_STATUSES))}) "
+                "AND finished_at < ?",
+                (*FINISHED_STATUSES, cutoff)
+            )
+            return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM optimization_jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+class OptimizationJobQueue:
+    """
+    優先度付きのジョブ実行
+
+    execute(依頼内容, 停止要求の確認関数) が API レスポンス形式の結果を返す
+    """
+
+    def __init__(self, store: JobStore,
+                 execute: Callable[[Dict[str, Any], Callable[[], bool]], Awaitable[Dict[str, Any]]],
+                 workers: int = 1, retention_days: float = 7):
+        self.store = store
+        self.execute = execute
+        self.workers = max(1, int(workers))
+        self.retention_days = retention_days
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, threading.Event] = {}
+
+    def start(self) -> None:
+        """ワーカーを起動し、前回の未完了ジョブを待ち行列へ戻す（イベントループ上で呼ぶ）"""
+        if self._queue is not None:
+            return
+        self._queue = asyncio.PriorityQueue()
+        purged = self.store.purge(self.retention_days)
+        restored = self.store.pending()
+        for job in restored:
+            if job.status == 'running':
+                job.status, job.started_at = 'queued', None
+                self.store.update(job)
+            self._enqueue(job)
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        logger.info(f"[JOBS] ジョブワーカー起動: {self.workers}並列, 再開{len(restored)}件, 期限切れ削除{purged}件")
+
+    async def stop(self) -> None:
+        for stop_requested in self._running.values():
+            stop_requested.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def _enqueue(self, job: OptimizationJob) -> None:
+        self._queue.put_nowait((PRIORITIES[job.priority], next(self._sequence), job.job_id))
+
+    def submit(self, request: Dict[str, Any], priority: str = 'interactive',
+               idempotency_key: Optional[str] = None) -> Tuple[OptimizationJob, bool]:
+        """
+        ジョブを登録
+
+        Returns:
+            (ジョブ, 新規作成したか)。冪等キーが一致する既存ジョブがあれば作成せずに返す
+
+        Raises:
+            ValueError: 不明な優先度
+            JobConflict: 同じ冪等キーで内容の異なる依頼
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"無効な優先度: {priority}. 利用可能: {list(PRIORITIES)}")
+        request_hash = request_cache_key(request=request, priority=priority)
+        if idempotency_key is not None:
+            existing = self.store.find_by_idempotency_key(idempotency_key)
+            if existing is not None:
+                if existing.request_hash != request_hash:
+                    raise JobConflict(f"冪等キー {idempotency_key} は別の内容のジョブで使用済みです")
+                return existing, False
+        job = OptimizationJob(
+            job_id=uuid.uuid4().hex[:12],
+            priority=priority,
+            status='queued',
+            request=request,
+            request_hash=request_hash,
+            idempotency_key=idempotency_key,
+            created_at=datetime.now().isoformat()
+        )
+        self.store.insert(job)
+        self._enqueue(job)
+        self.store.purge(self.retention_days)
+        logger.info(f"[JOBS] ジョブ登録: {job.job_id} ({priority})")
+        return job, True
+
+    def cancel(self, job_id: str) -> Optional[OptimizationJob]:
+        """
+        待機中のジョブは取り下げ、実行中のジョブは停止要求を送る
+
+        Raises:
+            JobConflict: 完了済みのジョブ
+        """
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        if job.status in FINISHED_STATUSES:
+            raise JobConflict(f"ジョブは既に終了しています: {job.status}")
+        job.status, job.finished_at = 'cancelled', datetime.now().isoformat()
+        self.store.update(job)
+        stop_requested = self._running.get(job_id)
+        if stop_requested is not None:
+            stop_requested.set()
+        logger.info(f"[JOBS] ジョブ取り消し: {job_id}")
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self.store.get(job_id)
+            # 待機中に取り消された（または保持期間で削除された）ジョブは飛ばす
+            if job is None or job.status != 'queued':
+                continue
+            job.status, job.started_at = 'running', datetime.now().isoformat()
+            self.store.update(job)
+            stop_requested = threading.Event()
+            self._running[job_id] = stop_requested
+            try:
+                result = await self.execute(job.request, stop_requested.is_set)
+                job.status, job.result = 'succeeded', result
+            except asyncio.CancelledError:
+                # サーバー停止: 次回起動時に再実行する
+                job.status, job.started_at = 'queued', None
+                self.store.update(job)
+                raise
+            except Exception as e:
+                logger.error(f"[JOBS] ジョブ失敗: {job_id}: {e}")
+                job.status, job.error = 'failed', str(e)
+            finally:
+                self._running.pop(job_id, None)
+            if stop_requested.is_set():
+                # 実行中に取り消された場合は暫定解を保存しない
+                job.status, job.result = 'cancelled', None
+            job.finished_at = datetime.now().isoformat()
+            self.store.update(job)
+            logger.info(f"[JOBS] ジョブ終了: {job_id} ({job.status})")
+
+    def stats(self) -> Dict[str, Any]:
+        counts = self.store.counts()
+        return {
+            'workers': self.workers,
+            'running': len(self._running),
+            'queue_depth': counts.get('queued', 0),
+            'retention_days': self.retention_days,
+            'jobs': counts
+        }
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+optimization_progress.py - 最適化の途中経過通知
+石垣島ツアー最適化システム
+
+- 探索系エンジン（GA / SA / 局所探索）の progress フックから暫定最良解を受け取り、
+  距離・評価値・効率スコアをイベントとして通知する
+- optimization_log に追加された行を、前回通知以降の差分として同じイベントで送る
+- 通知は最小間隔で間引き、エンジンの探索速度を落とさない（暫定解の生成に手間がかかる
+  エンジンは関数で渡し、通知するときだけ生成する）
+"""
+
+import time
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from routing_problem import RoutingProblem
+
+# 暫定最良ルート、または通知するときだけ呼ぶルート生成関数（GA の染色体復号など）
+Routes = Union[List[List[int]], Callable[[], List[List[int]]]]
+
+
+class ProgressReporter:
+    """途中経過イベントの生成（emit に辞書を渡す）"""
+
+    def __init__(self,
+                 emit: Callable[[Dict[str, Any]], None],
+                 optimization_log: List[str],
+                 efficiency: Callable[[List[float], List[int]], float],
+                 min_interval_ms: float = 100.0):
+        """
+        Args:
+            emit: イベント（辞書）を受け取る関数。別スレッドから呼ばれる前提で実装すること
+            efficiency: 使用車両ごとのルート距離・乗車人数から効率スコアを計算する関数
+        """
+        self.emit = emit
+        self.optimization_log = optimization_log
+        self.efficiency = efficiency
+        self.min_interval = min_interval_ms / 1000
+        self.started = time.perf_counter()
+        self._sent_lines = 0
+        self._last_emit = 0.0
+        self._best_cost: Optional[float] = None
+
+    def _new_log_lines(self) -> List[str]:
+        lines = self.optimization_log[self._sent_lines:]
+        self._sent_lines += len(lines)
+        return lines
+
+    def _elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    def log(self) -> None:
+        """未送信のログ行だけを通知"""
+        lines = self._new_log_lines()
+        if lines:
+            self.emit({'type': 'log', 'lines': lines, 'elapsed_ms': self._elapsed_ms()})
+
+    def stage(self, name: str, problem: RoutingProblem,
+              total: Optional[int] = None) -> Callable[[int, Routes], None]:
+        """
+        エンジンの progress 引数に渡すコールバックを作る
+
+        Args:
+            total: 反復数の上限が分かる場合（GA の世代数など）
+        """
+        self.log()
+
+        def report(iteration: int, routes: Routes) -> None:
+            now = time.perf_counter()
+            if now - self._last_emit < self.min_interval:
+                return
+            self._last_emit = now
+            self.incumbent(name, problem, routes() if callable(routes) else routes, iteration, total)
+
+        return report
+
+    def incumbent(self, stage: str, problem: RoutingProblem, routes: List[List[int]],
+                  iteration: Optional[int] = None, total: Optional[int] = None) -> None:
+        """暫定解を評価して通知（間引きなし）"""
+        cost = problem.evaluate(routes)
+        used = [r for r, route in enumerate(routes) if route]
+        distances = problem.route_distances(routes).tolist()
+        loads = problem.route_loads(routes).tolist()
+        improved = self._best_cost is None or cost.cost < self._best_cost
+        if improved:
+            self._best_cost = cost.cost
+        self.emit({
+            'type': 'progress',
+            'stage': stage,
+            'iteration': iteration,
+            'total': total,
+            'incumbent': {
+                'distance_km': round(cost.distance, 2),
+                'lateness_minutes': round(cost.lateness_minutes, 1),
+                'overflow_people': cost.overflow_people,
+                'cost': round(cost.cost, 2),
+                'efficiency_score': round(self.efficiency([distances[r] for r in used], [loads[r] for r in used]), 1)
+            },
+            'improved': improved,
+            'log': self._new_log_lines(),
+            'elapsed_ms': self._elapsed_ms()
+        })
@@ -1,6 +1,17 @@
 import math
-from datetime import datetime, timedelta
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
+
+from distance_matrix import DistanceMatrix, build_distance_matrix
+from routing_problem import time_to_minutes
+from spatial_index import nearest_neighbor_order
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def minutes_to_time(minutes: int) -> str:
+    """分（日をまたぐ場合は24時間で折り返し）を 'HH:MM' に変換"""
+    minutes %= MINUTES_PER_DAY
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
 
 class TourOptimizer:
     """ツアールート最適化クラス"""
@@ -54,17 +65,22 @@ class TourOptimizer:
                 'estimated_duration': '0分'
             }
         
+        # 距離行列はリクエストごとに1回だけ構築し、各ヘルパーはインデックスで参照する
+        distance_matrix = build_distance_matrix(activity_location, guests=guests)
+        
         # 最近傍法でルートを最適化
-        optimized_order = self._optimize_pickup_order(guests, activity_location)
+        order = self._optimize_pickup_order(guests, activity_location, distance_matrix)
+        optimized_order = [guests[position] for position in order]
+        stops = [distance_matrix.guest_offset + position for position in order]
         
         # ピックアップ時間を計算
         route_with_times = self._calculate_pickup_times(
-            optimized_order, activity_location, activity_start_time
+            optimized_order, activity_location, activity_start_time, distance_matrix, stops
         )
         
         # 総距離を計算
         total_distance = self._calculate_total_distance(
-            route_with_times, activity_location
+            route_with_times, activity_location, distance_matrix, stops
         )
         
         # 推定所要時間
@@ -84,81 +100,75 @@ class TourOptimizer:
         }
     
     def _optimize_pickup_order(self, guests: List[Dict], 
-                              activity_location: Dict) -> List[Dict]:
+                              activity_location: Dict,
+                              distance_matrix: Optional[DistanceMatrix] = None) -> List[int]:
         """
         最近傍法による順序最適化
-        """
-        remaining = guests.copy()
-        route = []
-        current_location = activity_location
-        
-        while remaining:
-            # 現在地から最も近いゲストを選択
-            nearest_guest = None
-            min_distance = float('inf')
-            
-            for guest in remaining:
-                distance = self.calculate_distance(
-                    current_location['lat'], current_location['lng'],
-                    guest['pickup_lat'], guest['pickup_lng']
-                )
-                if distance < min_distance:
-                    min_distance = distance
-                    nearest_guest = guest
-            
-            if nearest_guest:
-                route.append(nearest_guest)
-                remaining.remove(nearest_guest)
-                current_location = {
-                    'lat': nearest_guest['pickup_lat'],
-                    'lng': nearest_guest['pickup_lng']
-                }
         
+        距離は事前計算した距離行列から参照する（ゲストは行列内の並び順で対応）
+        最近傍の探索は空間インデックスで近傍セルに限定する
+        
+        Returns:
+            ピックアップ順に並べた guests 内の位置
+        """
+        if distance_matrix is None:
+            distance_matrix = build_distance_matrix(activity_location, guests=guests)
+        
+        offset = distance_matrix.guest_offset
+        depot_row = distance_matrix.row(DistanceMatrix.DEPOT)
+        
+        # グリッド空間インデックスで現在地から最も近いゲストを順に選択・削除
+        order = nearest_neighbor_order(
+            distance_matrix.lats[offset:].tolist(),
+            distance_matrix.lngs[offset:].tolist(),
+            activity_location['lat'], activity_location['lng'],
+            lambda prev, i: (depot_row if prev is None else distance_matrix.row(offset + prev))[offset + i]
+        )
         # 遠い順に並べ替え（最初にピックアップ）
-        route.reverse()
+        order.reverse()
         
-        return route
+        return order
+    
+    def _leg_distances(self, distance_matrix: DistanceMatrix, stops: List[int]) -> List[float]:
+        """区間距離（各ゲスト → 次のゲスト、最後のゲスト → アクティビティ地点）を行列から一括参照"""
+        stops = stops + [DistanceMatrix.DEPOT]
+        return distance_matrix.km[stops[:-1], stops[1:]].tolist()
     
     def _calculate_pickup_times(self, route: List[Dict], 
                                activity_location: Dict, 
-                               activity_start_time: str) -> List[Dict]:
+                               activity_start_time: str,
+                               distance_matrix: DistanceMatrix,
+                               stops: List[int]) -> List[Dict]:
         """
         各ゲストのピックアップ時間を計算
+        
+        時刻は整数の分で計算し、文字列への変換は結果の格納時だけ行う
+        stops は route の各ゲストの行列インデックス
         """
-        activity_time = datetime.strptime(activity_start_time, '%H:%M')
-        current_time = activity_time
+        if not route:
+            return route
+        
+        leg_distances = self._leg_distances(distance_matrix, stops)
+        
+        current_minutes = time_to_minutes(activity_start_time)
         
         # 逆順で計算（アクティビティ地点から逆算）
-        for i in range(len(route)-1, -1, -1):
+        for i in range(len(route) - 1, -1, -1):
             guest = route[i].copy()
             
-            # 次の地点への移動時間を計算
-            if i < len(route) - 1:
-                next_location = route[i+1]
-                distance = self.calculate_distance(
-                    guest['pickup_lat'], guest['pickup_lng'],
-                    next_location['pickup_lat'], next_location['pickup_lng']
-                )
-            else:
-                # 最後のゲストからアクティビティ地点
-                distance = self.calculate_distance(
-                    guest['pickup_lat'], guest['pickup_lng'],
-                    activity_location['lat'], activity_location['lng']
-                )
-            
             # 移動時間（分）
-            travel_minutes = int(distance / self.average_speed_kmh * 60)
+            travel_minutes = int(leg_distances[i] / self.average_speed_kmh * 60)
             travel_minutes += self.buffer_time_minutes
             
             # ピックアップ時間を設定
-            current_time = current_time - timedelta(minutes=travel_minutes)
-            guest['pickup_time'] = current_time.strftime('%H:%M')
+            current_minutes -= travel_minutes
+            guest['pickup_time'] = minutes_to_time(current_minutes)
             
             # 希望時間との適合性をチェック
-            guest['time_compliance'] = self._check_time_compliance(
-                guest['pickup_time'],
-                guest['preferred_pickup_start'],
-                guest['preferred_pickup_end']
+            guest['time_compliance'] = self._compliance_for_minutes(
+                current_minutes % MINUTES_PER_DAY,
+                time_to_minutes(guest['preferred_pickup_start']),
+                time_to_minutes(guest['preferred_pickup_end'])
             )
             
             route[i] = guest
@@ -171,18 +181,19 @@ class TourOptimizer:
         """
         希望時間との適合性をチェック
         """
-        pickup = datetime.strptime(pickup_time, '%H:%M')
-        start = datetime.strptime(preferred_start, '%H:%M')
-        end = datetime.strptime(preferred_end, '%H:%M')
-        
+        return self._compliance_for_minutes(
+            time_to_minutes(pickup_time),
+            time_to_minutes(preferred_start),
+            time_to_minutes(preferred_end)
+        )
+    
+    def _compliance_for_minutes(self, pickup: int, start: int, end: int) -> str:
+        """希望時間との適合性（時刻はすべて分）"""
         if start <= pickup <= end:
             return 'optimal'
         
         # 差分を計算
-        if pickup < start:
-            diff = (start - pickup).seconds // 60
-        else:
-            diff = (pickup - end).seconds // 60
+        diff = start - pickup if pickup < start else pickup - end
         
         if diff <= 15:
             return 'acceptable'
@@ -190,34 +201,19 @@ class TourOptimizer:
             return 'warning'
     
     def _calculate_total_distance(self, route: List[Dict], 
-                                 activity_location: Dict) -> float:
+                                 activity_location: Dict,
+                                 distance_matrix: DistanceMatrix,
+                                 stops: List[int]) -> float:
         """
-        総移動距離を計算
+        総移動距離を計算（ゲスト間の距離 + 最後のゲストからアクティビティ地点）
         """
         if not route:
             return 0
         
-        total = 0
-        
-        # ゲスト間の距離
-        for i in range(len(route) - 1):
-            total += self.calculate_distance(
-                route[i]['pickup_lat'], route[i]['pickup_lng'],
-                route[i+1]['pickup_lat'], route[i+1]['pickup_lng']
-            )
-        
-        # 最後のゲストからアクティビティ地点
-        total += self.calculate_distance(
-            route[-1]['pickup_lat'], route[-1]['pickup_lng'],
-            activity_location['lat'], activity_location['lng']
-        )
-        
-        return total
+        return sum(self._leg_distances(distance_matrix, stops))
     
     def _time_difference_minutes(self, time1: str, time2: str) -> int:
         """
         2つの時刻の差を分で返す
         """
-        t1 = datetime.strptime(time1, '%H:%M')
-        t2 = datetime.strptime(time2, '%H:%M')
-        return int((t2 - t1).seconds / 60)
\ No newline at end of file
+        return (time_to_minutes(time2) - time_to_minutes(time1)) % MINUTES_PER_DAY
\ No newline at end of file
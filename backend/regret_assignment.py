@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+regret_assignment.py - regret-k によるゲスト→車両割当
+石垣島ツアー最適化システム
+
+- 全ゲスト×全車両のコストを距離行列から一度だけ計算
+  （コスト = 車両出発地または既に割り当てたゲストまでの最短距離）
+- 割当順は regret（2番目以降に良い車両との差）の大きい順に優先度付きキューで決定
+- 車両の乗車人数は累積値で保持し、定員チェックは O(1)
+- 割り当てたゲストの近くにいる未割当ゲストのコストだけ列更新し、
+  regret が変わったゲストをキューに積み直す（古いエントリは版番号で破棄）
+- どの車両にも定員内で乗れないゲストは割当失敗として明示的に返す
+"""
+
+import heapq
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import numpy as np
+
+from distance_matrix import DistanceMatrix
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AssignmentResult:
+    """割当結果"""
+    assignments: Dict[str, List[Dict]]
+    unassigned: List[Dict] = field(default_factory=list)
+    overbooked: List[Dict] = field(default_factory=list)
+
+
+class RegretAssigner:
+    """優先度付きキューと累積乗車人数による regret-k 割当"""
+
+    def __init__(self, distance_matrix: DistanceMatrix, regret_k: int = 2,
+                 allow_overbooking: bool = False):
+        self.distance_matrix = distance_matrix
+        self.regret_k = max(2, int(regret_k))
+        self.allow_overbooking = allow_overbooking
+
+    def _regret(self, costs: np.ndarray) -> np.ndarray:
+        """コスト行（複数ゲスト分）から regret を一括計算（乗れる車両が1台なら inf）"""
+        k = min(self.regret_k, costs.shape[1])
+        smallest = np.sort(np.partition(costs, k - 1, axis=1)[:, :k], axis=1)
+        with np.errstate(invalid='ignore'):
+            regret = (smallest[:, 1:] - smallest[:, :1]).sum(axis=1)
+        return np.where(np.isinf(smallest[:, 0]), -np.inf, np.nan_to_num(regret, nan=-np.inf))
+
+    def assign(self, guests: List[Dict], vehicles: List[Dict]) -> AssignmentResult:
+        matrix = self.distance_matrix
+        assignments = {vehicle['id']: [] for vehicle in vehicles}
+        if not guests or not vehicles:
+            return AssignmentResult(assignments, unassigned=list(guests))
+
+        guest_index = np.asarray([matrix.guest(g) for g in guests], dtype=np.int64)
+        vehicle_index = np.asarray([matrix.vehicle(v) for v in vehicles], dtype=np.int64)
+        demand = np.asarray([g['num_people'] for g in guests], dtype=np.int64)
+        remaining = np.asarray([v['capacity'] for v in vehicles], dtype=np.int64)
+
+        # 全ペアのコストを一括計算（定員に収まらない組は inf）
+        distance = matrix.km[np.ix_(guest_index, vehicle_index)].copy()
+        cost = np.where(demand[:, None] <= remaining[None, :], distance, np.inf)
+
+        assigned = np.zeros(len(guests), dtype=bool)
+        version = np.zeros(len(guests), dtype=np.int64)
+        regret = self._regret(cost)
+        best_cost = cost.min(axis=1)
+        heap = [(-regret[g], best_cost[g], g, 0) for g in range(len(guests)) if np.isfinite(best_cost[g])]
+        heapq.heapify(heap)
+
+        while heap:
+            _, _, g, entry_version = heapq.heappop(heap)
+            if assigned[g] or entry_version != version[g]:
+                continue
+            v = int(np.argmin(cost[g]))
+            if not np.isfinite(cost[g, v]):
+                continue
+
+            assigned[g] = True
+            remaining[v] -= demand[g]
+            assignments[vehicles[v]['id']].append(guests[g])
+
+            # 列 v の更新: 新しく乗ったゲストへの距離と残り定員を反映
+            open_guests = np.flatnonzero(~assigned)
+            if not len(open_guests):
+                break
+            new_column = np.minimum(distance[open_guests, v], matrix.km[guest_index[g], guest_index[open_guests]])
+            distance[open_guests, v] = new_column
+            new_column = np.where(demand[open_guests] <= remaining[v], new_column, np.inf)
+            changed = open_guests[new_column != cost[open_guests, v]]
+            cost[open_guests, v] = new_column
+            if not len(changed):
+                continue
+
+            # regret が変わったゲストだけ積み直す
+            version[changed] += 1
+            changed_regret = self._regret(cost[changed])
+            changed_best = cost[changed].min(axis=1)
+            for h, r, c in zip(changed.tolist(), changed_regret.tolist(), changed_best.tolist()):
+                if np.isfinite(c):
+                    heapq.heappush(heap, (-r, c, h, int(version[h])))
+
+        result = AssignmentResult(assignments)
+        for g in np.flatnonzero(~assigned).tolist():
+            guest = guests[g]
+            if self.allow_overbooking:
+                # 明示的に許可された場合のみ、超過人数が最小の車両へ配置
+                overflow = demand[g] - remaining
+                v = int(np.argmin(np.where(overflow > 0, overflow, 0)))
+                remaining[v] -= demand[g]
+                assignments[vehicles[v]['id']].append(guest)
+                result.overbooked.append(guest)
+            else:
+                result.unassigned.append(guest)
+        return result
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+result_cache.py - 最適化結果のキャッシュ
+石垣島ツアー最適化システム
+
+- リクエスト内容（ゲスト・車両・地点・開始時刻・アルゴリズム・気象スナップショット等）を
+  正規化した JSON の SHA-256 をキーにする（キー順・数値表現の揺れを吸収）
+- 件数上限付きの LRU。保持期限は気象キャッシュと同じ期間にし、
+  気象データが更新された後の古い結果を返さない
+- 外部からの停止で打ち切られた結果（暫定解）はキャッシュしない
+- ヒット・ミス・破棄件数を統計として公開する
+- 同じキーの処理が実行中なら新たに始めず、その完了を待って結果を共有する（single-flight）
+  待っている呼び出しが全て取り消されたら処理も取り消す
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from solve_budget import CANCELLED
+
+# 緯度経度などの浮動小数は約0.1mの精度で比較
+FLOAT_PRECISION = 6
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, float):
+        return round(value, FLOAT_PRECISION)
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def request_cache_key(**parts: Any) -> str:
+    """
+    リクエスト構成要素から正規化キーを生成
+
+    ゲスト・車両の並び順は結果（既定ID・車両割当）に影響するため保持する
+    """
+    canonical = json.dumps(_normalize(parts), sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def is_cacheable_result(optimization_result: Dict[str, Any]) -> bool:
+    """外部からの停止（暫定解での確定・切断）で打ち切られた結果はキャッシュしない"""
+    stages = (optimization_result.get('solve_status') or {}).get('stages', {})
+    return CANCELLED not in stages.values()
+
+
+class OptimizationResultCache:
+    """件数上限・保持期限付き LRU キャッシュ"""
+
+    def __init__(self, max_entries: int = 128, ttl_seconds: float = 1800):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self._entries: 'OrderedDict[str, Tuple[Dict, float]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """キャッシュ済み結果（呼び出し側で変更しても影響しない複製）"""
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[1] >= self.ttl_seconds:
+            del self._entries[key]
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(entry[0])
+
+    def put(self, key: str, result: Dict) -> None:
+        self._entries[key] = (copy.deepcopy(result), time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups * 100, 1) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+
+class SingleFlight:
+    """
+    同一キーの同時実行をまとめる
+
+    最初の呼び出しで処理を開始し、実行中に来た同じキーの呼び出しは
+    その結果（例外を含む）を受け取る。一部の呼び出しが取り消されても処理は続け、
+    待っている呼び出しが全て取り消された時点で処理を取り消す（クライアント切断時の求解停止）。
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, 'asyncio.Task'] = {}
+        self._callers: Dict[str, int] = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Returns:
+            (結果, 他の呼び出しの結果を共有したか)。共有した結果は呼び出しごとの複製
+        """
+        task = self._inflight.get(key)
+        coalesced = task is not None
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            self._callers[key] = 0
+            task.add_done_callback(lambda _: self._forget(key, task))
+            self.executions += 1
+        self._callers[key] += 1
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled() or self._inflight.get(key) is not task:
+                raise
+            self._callers[key] -= 1
+            if self._callers[key] == 0:
+                # 誰も結果を待っていない処理は取り消す
+                self._forget(key, task)
+                task.cancel()
+                self.abandoned += 1
+            raise
+        if self._inflight.get(key) is task:
+            self._callers[key] -= 1
+        if coalesced:
+            self.coalesced += 1
+            return copy.deepcopy(result), True
+        return result, False
+
+    def _forget(self, key: str, task: 'asyncio.Task') -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            del self._callers[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'in_flight': len(self._inflight),
+            'executions': self.executions,
+            'coalesced': self.coalesced,
+            'abandoned': self.abandoned
+        }
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+route_workers.py - 車両別ルート最適化のプロセスプール実行
+石垣島ツアー最適化システム
+
+配車後の各車両ルートは互いに独立なため、車両ごとの
+- 最近傍法による巡回順の構築（空間インデックス使用）
+- ルート内局所探索（2-opt / Or-opt）
+を ProcessPoolExecutor で並列実行し、イベントループをブロックしない。
+
+- ワーカーは起動時に事前生成し、NumPy・ソルバーモジュールを読み込み済みにする
+- 各タスクには全体行列ではなく、その車両の停車分だけの部分行列を渡す
+- 結果は車両順に回収する
+- 小規模な問題やプール不使用時は同一プロセスで順次実行する
+- ワーカーが異常終了したプールは停止して手放し、次の実行時に作り直す
+
+アルゴリズム比較など、任意の重い処理も run() で同じプールに投入できる。
+実行中の処理は共有メモリ上のキャンセルフラグで協調的に停止できる
+（プール起動時にワーカーへ渡すため、タスクごとの受け渡しは番号のみ）。
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional
+
+from local_search import LocalSearchOptimizer
+from routing_problem import DEPOT, RoutingProblem
+from spatial_index import nearest_neighbor_order
+
+logger = logging.getLogger(__name__)
+
+# 同時に停止要求を管理できる処理グループ数
+CANCEL_SLOTS = 64
+
+# キャンセルフラグ（ワーカーではプール初期化時、親プロセスでは生成時に設定）
+_cancel_flags = None
+
+
+def _init_worker(cancel_flags) -> None:
+    global _cancel_flags
+    _cancel_flags = cancel_flags
+
+
+def cancellation_check(slot: Optional[int]) -> Optional[Callable[[], bool]]:
+    """キャンセル番号から停止要求の確認関数を作る（ワーカー・親プロセス共通）"""
+    flags = _cancel_flags
+    if flags is None or slot is None:
+        return None
+    return lambda: flags[slot] != 0
+
+
+def nearest_neighbor_route(problem: RoutingProblem, route: List[int]) -> List[int]:
+    """
+    ルート上のゲストを最近傍法で並べ替える
+
+    空間インデックスでアクティビティ地点から近い順に辿り、遠い順に並べ替える。
+    希望開始時刻順の方が評価値（距離 + 遅延ペナルティ）が良い場合はそちらを返す。
+    """
+    time_order = sorted(route, key=lambda node: problem.tw_start_list[node])
+    if len(route) < 3:
+        return time_order
+
+    dist = problem.dist_rows
+    lats = problem.distance_matrix.lats
+    lngs = problem.distance_matrix.lngs
+    order = nearest_neighbor_order(
+        [lats[problem.matrix_index[node]] for node in route],
+        [lngs[problem.matrix_index[node]] for node in route],
+        problem.activity_location['lat'], problem.activity_location['lng'],
+        lambda prev, i: dist[DEPOT if prev is None else route[prev]][route[i]]
+    )
+    nearest_order = [route[i] for i in reversed(order)]
+
+    def route_cost(candidate: List[int]) -> float:
+        return (problem.route_distance(candidate) +
+                problem.lateness_weight * problem.route_lateness(candidate))
+
+    return nearest_order if route_cost(nearest_order) < route_cost(time_order) else time_order
+
+
+def solve_vehicle_route(problem: RoutingProblem,
+                        local_search_parameters: Optional[Dict[str, Any]] = None) -> List[int]:
+    """
+    1台分の部分問題を解く（ワーカープロセスで実行）
+
+    Returns:
+        部分問題のノード番号（1..k）の巡回順
+    """
+    route = nearest_neighbor_route(problem, list(range(1, problem.num_guests + 1)))
+    parameters = dict(local_search_parameters or {})
+    if len(route) >= 3 and parameters.pop('enabled', True):
+        route = LocalSearchOptimizer(problem, **parameters).improve([route])[0]
+    return route
+
+
+def _warm_up(_: int = 0) -> int:
+    """ワーカーの事前起動（モジュール読み込み済みであることの確認）"""
+    return os.getpid()
+
+
+class VehicleRouteExecutor:
+    """車両別ルート最適化（およびアルゴリズム比較）のプロセスプール"""
+
+    def __init__(self, max_workers: Optional[int] = None, min_guests_for_pool: int = 40):
+        self.max_workers = max_workers or max(1, min(4, (os.cpu_count() or 1)))
+        self.min_guests_for_pool = min_guests_for_pool
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._cancel_flags = None
+        self._free_slots: List[int] = []
+        self._slots_lock = threading.Lock()  # 比較の求解スレッドからも確保・返却する
+        self._restart_pending = False
+
+    def _ensure_cancel_flags(self) -> None:
+        if self._cancel_flags is None:
+            self._cancel_flags = multiprocessing.RawArray('b', CANCEL_SLOTS)
+            self._free_slots = list(range(CANCEL_SLOTS))
+            # スレッド実行時も同じフラグを参照できるよう親プロセス側にも設定
+            _init_worker(self._cancel_flags)
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        self._ensure_cancel_flags()
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_init_worker,
+            initargs=(self._cancel_flags,)
+        )
+
+    def start(self) -> None:
+        """ワーカーを事前生成してモジュールを読み込ませる"""
+        if self._pool is not None:
+            return
+        self._restart_pending = False
+        try:
+            self._pool = self._new_pool()
+            pids = set(self._pool.map(_warm_up, range(self.max_workers)))
+            logger.info(f"[POOL] 車両別ルート最適化ワーカー起動: {len(pids)}プロセス")
+        except (OSError, BrokenProcessPool) as e:
+            logger.warning(f"[POOL] ワーカー起動失敗、同一プロセスで実行します: {e}")
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _discard_broken_pool(self, pool: ProcessPoolExecutor, error: Exception, fallback: str) -> None:
+        """異常終了したプールを停止して手放す（次の実行時に作り直す）"""
+        logger.warning(f"[POOL] ワーカー異常終了、{fallback}で再実行します: {error}")
+        if self._pool is pool:
+            self._pool = None
+            self._restart_pending = True
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _restart_if_broken(self) -> None:
+        """異常終了で手放したプールを作り直す（ワーカーは最初の投入時に起動）"""
+        if self._restart_pending and self._pool is None:
+            self._restart_pending = False
+            try:
+                self._pool = self._new_pool()
+                logger.info("[POOL] 車両別ルート最適化ワーカー再作成")
+            except OSError as e:
+                logger.warning(f"[POOL] ワーカー再作成失敗、同一プロセスで実行します: {e}")
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+            logger.info("[POOL] 車両別ルート最適化ワーカー停止")
+
+    # ===== 協調的キャンセル =====
+
+    def open_cancel_slot(self) -> Optional[int]:
+        """停止要求用の番号を確保（空きが無い場合は None = 停止要求なし）"""
+        with self._slots_lock:
+            self._ensure_cancel_flags()
+            if not self._free_slots:
+                return None
+            slot = self._free_slots.pop()
+            self._cancel_flags[slot] = 0
+            return slot
+
+    def cancel(self, slot: Optional[int]) -> None:
+        """番号を共有する実行中の処理へ停止を要求"""
+        if slot is not None:
+            self._cancel_flags[slot] = 1
+
+    def release_cancel_slot(self, slot: Optional[int]) -> None:
+        """処理が全て終了した後に番号を返却"""
+        if slot is not None:
+            with self._slots_lock:
+                self._cancel_flags[slot] = 0
+                self._free_slots.append(slot)
+
+    def release_cancel_slot_when_done(self, pending, slot: Optional[int]) -> None:
+        """
+        停止要求を送った処理（Future）が全て終了した時点で番号を返却
+
+        完了コールバックで返却するため、呼び出し側のイベントループが先に終了しても
+        （asyncio.run の終了時に残りが取り消された場合も）番号を取りこぼさない
+        """
+        remaining = set(pending)
+        if not remaining:
+            self.release_cancel_slot(slot)
+            return
+
+        def finished(future) -> None:
+            remaining.discard(future)
+            if not remaining:
+                self.release_cancel_slot(slot)
+
+        for future in list(remaining):
+            future.add_done_callback(finished)
+
+    async def run(self, fn, *args):
+        """
+        任意の処理をワーカープロセスで実行（プール不使用時はスレッドで実行）
+
+        fn と引数はプロセス間で受け渡せる（pickle 可能な）ものに限る
+        """
+        self._restart_if_broken()
+        pool = self._pool
+        if pool is not None:
+            try:
+                return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+            except BrokenProcessPool as e:
+                self._discard_broken_pool(pool, e, "スレッド")
+        return await asyncio.to_thread(fn, *args)
+
+    async def optimize_routes(self, problem: RoutingProblem, routes: List[List[int]],
+                              local_search_parameters: Optional[Dict[str, Any]] = None,
+                              optimization_log: Optional[List[str]] = None) -> List[List[int]]:
+        """
+        各車両のルートを並列に最適化し、車両順に回収する
+
+        Args:
+            routes: 車両順のルート（全体問題のノード番号）
+
+        Returns:
+            車両順の最適化後ルート（全体問題のノード番号）
+        """
+        subproblems = [problem.vehicle_subproblem(v, route) if route else None
+                       for v, route in enumerate(routes)]
+        self._restart_if_broken()
+        pool = self._pool
+        use_pool = pool is not None and problem.num_guests >= self.min_guests_for_pool
+
+        sub_routes = None
+        if use_pool:
+            loop = asyncio.get_running_loop()
+            try:
+                sub_routes = await asyncio.gather(*[
+                    loop.run_in_executor(pool, solve_vehicle_route, sub, local_search_parameters)
+                    if sub is not None else _empty_route()
+                    for sub in subproblems
+                ])
+            except BrokenProcessPool as e:
+                self._discard_broken_pool(pool, e, "同一プロセス")
+                use_pool = False
+
+        if sub_routes is None:
+            sub_routes = [solve_vehicle_route(sub, local_search_parameters) if sub is not None else []
+                          for sub in subproblems]
+
+        if optimization_log is not None:
+            mode = f"プロセスプール({self.max_workers}並列)" if use_pool else "同一プロセス"
+            optimization_log.append(
+                f"[POOL] 車両別ルート最適化: {sum(1 for r in routes if r)}台, {mode}"
+            )
+        # 部分問題のノード番号 1..k を全体問題のノード番号へ戻す
+        return [[route[node - 1] for node in sub_route]
+                for route, sub_route in zip(routes, sub_routes)]
+
+
+async def _empty_route() -> List[int]:
+    return []
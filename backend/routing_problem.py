@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+routing_problem.py - ソルバー共通の問題インスタンス
+石垣島ツアー最適化システム
+
+各最適化エンジン（遺伝的アルゴリズム等）が共有する配列表現:
+- ノード0 = デポ（アクティビティ地点）、ノード1..G = ゲスト（guests の順）
+- 距離・移動時間行列、座標、乗車人数、希望時間帯（分）、車両定員
+- ルートはゲストノード番号のリスト、解は車両順のルートのリスト
+- 時刻文字列の解析と辞書の参照は構築時の1回だけ（レスポンス用の辞書は呼び出し側で最後に作る）
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from distance_matrix import DistanceMatrix, build_distance_matrix
+
+DEPOT = 0
+
+
+def time_to_minutes(time_str: str, default: int = 9 * 60) -> int:
+    """'HH:MM' を分に変換（不正値はデフォルト）"""
+    try:
+        hour, minute = map(int, time_str.split(':'))
+        return hour * 60 + minute
+    except (AttributeError, ValueError):
+        return default
+
+
+@dataclass
+class SolutionCost:
+    """解の評価値"""
+    distance: float
+    lateness_minutes: float
+    overflow_people: int
+    cost: float
+
+
+class RoutingProblem:
+    """
+    車両ルーティング問題インスタンス（時間枠・定員付き）
+
+    時間モデル:
+        最初の停車 = max(希望開始, デポ出発可能時刻 + 移動時間)
+        以降の停車 = max(前停車 + 乗車時間 + 移動時間, 希望開始)
+        希望終了を過ぎた分を遅延としてペナルティ計上
+    """
+
+    def __init__(self,
+                 guests: List[Dict],
+                 vehicles: List[Dict],
+                 activity_location: Dict,
+                 distance_matrix: Optional[DistanceMatrix] = None,
+                 average_speed_kmh: float = 30,
+                 delay_factor: float = 1.0,
+                 margin_minutes: float = 15,
+                 service_minutes: int = 5,
+                 depot_open_minutes: int = 6 * 60,
+                 lateness_weight: float = 0.5,
+                 overflow_weight: float = 100.0):
+        if distance_matrix is None:
+            distance_matrix = build_distance_matrix(activity_location, vehicles, guests)
+
+        self.guests = guests
+        self.vehicles = vehicles
+        self.activity_location = activity_location
+        self.distance_matrix = distance_matrix
+        self.average_speed_kmh = average_speed_kmh
+        self.delay_factor = delay_factor
+        self.margin_minutes = margin_minutes
+        self.service_minutes = service_minutes
+        self.depot_open_minutes = depot_open_minutes
+        self.lateness_weight = lateness_weight
+        self.overflow_weight = overflow_weight
+
+        # 行列インデックス（デポ + ゲスト）で部分行列を切り出す
+        offset = distance_matrix.guest_offset
+        matrix_index = [DistanceMatrix.DEPOT] + [
+            distance_matrix.guest_index.get(g.get('id'), offset + i) for i, g in enumerate(guests)
+        ]
+        self.matrix_index = np.asarray(matrix_index, dtype=np.int64)
+
+        self.lats = distance_matrix.lats[self.matrix_index]
+        self.lngs = distance_matrix.lngs[self.matrix_index]
+        self.dist = distance_matrix.km[np.ix_(self.matrix_index, self.matrix_index)]
+        self.travel = self.dist / average_speed_kmh * 60 * delay_factor + margin_minutes
+        np.fill_diagonal(self.travel, 0.0)
+
+        self.demand = np.asarray([0] + [g['num_people'] for g in guests], dtype=np.int64)
+        self.tw_start = np.asarray(
+            [depot_open_minutes] +
+            [time_to_minutes(g.get('preferred_pickup_start', '08:30')) for g in guests],
+            dtype=np.float64
+        )
+        self.tw_end = np.asarray(
+            [24 * 60] +
+            [time_to_minutes(g.get('preferred_pickup_end', '09:00')) for g in guests],
+            dtype=np.float64
+        )
+        self.capacity = np.asarray([v['capacity'] for v in vehicles], dtype=np.int64)
+        self.node_of = {g['id']: node for node, g in enumerate(guests, start=1) if g.get('id') is not None}
+
+        # スカラー評価用のリスト表現
+        self.dist_rows = self.dist.tolist()
+        self.travel_rows = self.travel.tolist()
+        self.demand_list = self.demand.tolist()
+        self.tw_start_list = self.tw_start.tolist()
+        self.tw_end_list = self.tw_end.tolist()
+        self.capacity_list = self.capacity.tolist()
+
+    @property
+    def num_guests(self) -> int:
+        return len(self.guests)
+
+    @property
+    def num_vehicles(self) -> int:
+        return len(self.vehicles)
+
+    def route_distance(self, route: List[int]) -> float:
+        """ルート距離（デポ発着）"""
+        if not route:
+            return 0.0
+        dist = self.dist_rows
+        total = dist[DEPOT][route[0]] + dist[route[-1]][DEPOT]
+        for a, b in zip(route, route[1:]):
+            total += dist[a][b]
+        return total
+
+    def route_start_times(self, route: List[int]) -> List[float]:
+        """各停車のピックアップ開始時刻（分）"""
+        travel = self.travel_rows
+        tw_start = self.tw_start_list
+        starts = []
+        prev = DEPOT
+        t = float(self.depot_open_minutes)
+        for node in route:
+            t = max(t + travel[prev][node], tw_start[node])
+            starts.append(t)
+            t += self.service_minutes
+            prev = node
+        return starts
+
+    def _depot_separated(self, routes: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+        """デポ区切りで連結したノード列と、各ルートの先頭区間の位置"""
+        sequence = [DEPOT]
+        starts = []
+        for route in routes:
+            starts.append(len(sequence) - 1)
+            sequence.extend(route)
+            sequence.append(DEPOT)
+        return np.asarray(sequence, dtype=np.int64), np.asarray(starts, dtype=np.int64)
+
+    def route_distances(self, routes: List[List[int]]) -> np.ndarray:
+        """全ルートの距離（デポ発着）を1回の配列参照でまとめて計算"""
+        if not routes:
+            return np.zeros(0)
+        sequence, starts = self._depot_separated(routes)
+        return np.add.reduceat(self.dist[sequence[:-1], sequence[1:]], starts)
+
+    def route_loads(self, routes: List[List[int]]) -> np.ndarray:
+        """全ルートの乗車人数（デポの需要は0）"""
+        if not routes:
+            return np.zeros(0, dtype=np.int64)
+        sequence, starts = self._depot_separated(routes)
+        return np.add.reduceat(self.demand[sequence[:-1]], starts)
+
+    def route_lateness(self, route: List[int]) -> float:
+        """ルートの希望時間超過（分）の合計"""
+        tw_end = self.tw_end_list
+        return sum(max(0.0, t - tw_end[node])
+                   for node, t in zip(route, self.route_start_times(route)))
+
+    def route_load(self, route: List[int]) -> int:
+        demand = self.demand_list
+        return sum(demand[node] for node in route)
+
+    def evaluate(self, routes: List[List[int]]) -> SolutionCost:
+        """解（車両順のルートリスト）の評価"""
+        distance = 0.0
+        lateness = 0.0
+        overflow = 0
+        for vehicle_position, route in enumerate(routes):
+            distance += self.route_distance(route)
+            lateness += self.route_lateness(route)
+            overflow += max(0, self.route_load(route) - self.capacity_list[vehicle_position])
+        cost = distance + self.lateness_weight * lateness + self.overflow_weight * overflow
+        return SolutionCost(distance, lateness, overflow, cost)
+
+    def from_assignments(self, assignments: Dict[str, List[Dict]]) -> List[List[int]]:
+        """車両ID → ゲストリストの配車結果をノード番号の解に変換"""
+        return [[self.node_of[g['id']] for g in assignments.get(vehicle['id'], [])]
+                for vehicle in self.vehicles]
+
+    def vehicle_subproblem(self, vehicle_position: int, route: List[int]) -> 'RoutingProblem':
+        """
+        1台分の部分問題（ルート上のゲストのみ、ノード番号は route の順に 1..k）
+
+        距離は部分行列を切り出して共有し、時間モデルの設定は引き継ぐ
+        """
+        vehicle = self.vehicles[vehicle_position]
+        guests = [self.guests[node - 1] for node in route]
+        return RoutingProblem(
+            guests, [vehicle], self.activity_location,
+            self.distance_matrix.subset([vehicle], guests),
+            average_speed_kmh=self.average_speed_kmh,
+            delay_factor=self.delay_factor,
+            margin_minutes=self.margin_minutes,
+            service_minutes=self.service_minutes,
+            depot_open_minutes=self.depot_open_minutes,
+            lateness_weight=self.lateness_weight,
+            overflow_weight=self.overflow_weight
+        )
+
+    def guest_subproblem(self, nodes: List[int]) -> 'RoutingProblem':
+        """
+        指定ゲストだけの部分問題（全車両、ノード番号は nodes の順に 1..k）
+
+        距離行列は共有し（ゲストIDで参照）、時間モデルの設定は引き継ぐ
+        """
+        return RoutingProblem(
+            [self.guests[node - 1] for node in nodes], self.vehicles, self.activity_location,
+            self.distance_matrix,
+            average_speed_kmh=self.average_speed_kmh,
+            delay_factor=self.delay_factor,
+            margin_minutes=self.margin_minutes,
+            service_minutes=self.service_minutes,
+            depot_open_minutes=self.depot_open_minutes,
+            lateness_weight=self.lateness_weight,
+            overflow_weight=self.overflow_weight
+        )
+
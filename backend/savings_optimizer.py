@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+savings_optimizer.py - Clarke-Wright 節約法による初期解構築
+石垣島ツアー最適化システム
+
+- デポ（アクティビティ地点）発着の往復ルートから開始
+- 節約値 s(i,j) = d(0,i) + d(0,j) - d(i,j) を距離行列から一括計算し一度だけ整列
+- 端点同士の連結を、最大車両定員と時間枠（各停車を現状より遅らせない）
+  の範囲で節約値の大きい順に実施
+- 最後に各ルートを定員の合う車両へ割り当てる（Vehicle.capacity を尊重、
+  乗り切らないゲストは未割当として残す）
+"""
+
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from routing_problem import DEPOT, RoutingProblem
+
+logger = logging.getLogger(__name__)
+
+
+class SavingsRouteBuilder:
+    """Clarke-Wright 節約法"""
+
+    def __init__(self, problem: RoutingProblem):
+        self.problem = problem
+        self.unassigned: List[int] = []
+
+    def _savings_list(self) -> List[tuple]:
+        """正の節約値を持つゲスト対を節約値の降順で返す"""
+        dist = self.problem.dist
+        num_guests = self.problem.num_guests
+        i, j = np.triu_indices(num_guests, k=1)
+        i = i + 1
+        j = j + 1
+        savings = dist[DEPOT, i] + dist[DEPOT, j] - dist[i, j]
+        order = np.argsort(-savings, kind='stable')
+        order = order[savings[order] > 0]
+        return list(zip(i[order].tolist(), j[order].tolist()))
+
+    def _within_windows(self, route: List[int]) -> bool:
+        """各停車が希望終了時刻（既に超過している場合は現状）を超えないか"""
+        problem = self.problem
+        tw_end = problem.tw_end_list
+        limit = self.limit
+        for node, start in zip(route, problem.route_start_times(route)):
+            if start > max(tw_end[node], limit[node]):
+                return False
+        return True
+
+    def build(self, optimization_log: Optional[List[str]] = None) -> List[List[int]]:
+        """
+        節約法でルートを構築し車両に割り当てる
+
+        Returns:
+            車両順のルート（ゲストノード番号のリスト）
+            定員内に乗せられなかったゲストはルートに含めず self.unassigned に記録
+        """
+        problem = self.problem
+        num_guests = problem.num_guests
+        demand = problem.demand_list
+        max_capacity = max(problem.capacity_list) if problem.capacity_list else 0
+
+        # 初期解: ゲストごとの往復ルート
+        routes: Dict[int, List[int]] = {node: [node] for node in range(1, num_guests + 1)}
+        route_of = list(range(num_guests + 1))
+        loads = {node: demand[node] for node in routes}
+        # 単独往復でも希望終了に間に合わないゲストは、その到着時刻を許容上限とする
+        self.limit = [0.0] + [problem.route_start_times([node])[0] for node in range(1, num_guests + 1)]
+
+        merges = 0
+        for i, j in self._savings_list():
+            ri, rj = route_of[i], route_of[j]
+            if ri == rj or loads[ri] + loads[rj] > max_capacity:
+                continue
+            route_i, route_j = routes[ri], routes[rj]
+
+            # 端点同士のみ連結可能（向きは時間枠で判定）
+            candidates = []
+            if route_i[-1] == i and route_j[0] == j:
+                candidates.append(route_i + route_j)
+            if route_j[-1] == j and route_i[0] == i:
+                candidates.append(route_j + route_i)
+            if route_i[0] == i and route_j[0] == j:
+                candidates.append(route_i[::-1] + route_j)
+            if route_i[-1] == i and route_j[-1] == j:
+                candidates.append(route_i + route_j[::-1])
+
+            merged = next((c for c in candidates if self._within_windows(c)), None)
+            if merged is None:
+                continue
+
+            routes[ri] = merged
+            loads[ri] += loads.pop(rj)
+            del routes[rj]
+            for node in route_j:
+                route_of[node] = ri
+            merges += 1
+
+        vehicle_routes = self._assign_to_vehicles(list(routes.values()), optimization_log)
+        if optimization_log is not None:
+            optimization_log.append(
+                f"[SAVINGS] 節約法: 連結{merges}回, {len(routes)}ルート構築"
+            )
+        return vehicle_routes
+
+    def _assign_to_vehicles(self, routes: List[List[int]],
+                            optimization_log: Optional[List[str]]) -> List[List[int]]:
+        """
+        積載の大きいルートから、収まる最小定員の車両へ割り当てる。
+        車両が足りない場合は定員に余裕のある車両のルートへ末尾連結し（ルートごと
+        入らなければゲスト単位で）、どの車両にも乗れないゲストは unassigned に残す。
+        """
+        problem = self.problem
+        capacity = problem.capacity_list
+        demand = problem.demand_list
+        dist = problem.dist_rows
+        vehicle_routes: List[List[int]] = [[] for _ in range(problem.num_vehicles)]
+        loads = [0] * problem.num_vehicles
+
+        routes = sorted(routes, key=problem.route_load, reverse=True)
+        leftovers = []
+        for route in routes:
+            load = problem.route_load(route)
+            free = [v for v in range(problem.num_vehicles)
+                    if not vehicle_routes[v] and capacity[v] >= load]
+            if free:
+                v = min(free, key=lambda k: capacity[k])
+                vehicle_routes[v] = list(route)
+                loads[v] = load
+            else:
+                leftovers.append(route)
+
+        def append(segment: List[int], load: int) -> bool:
+            # 定員内に収まる車両の中で連結距離が最短のもの
+            fits = [k for k in range(problem.num_vehicles) if loads[k] + load <= capacity[k]]
+            if not fits:
+                return False
+            v = min(fits, key=lambda k: dist[vehicle_routes[k][-1] if vehicle_routes[k] else DEPOT][segment[0]])
+            vehicle_routes[v].extend(segment)
+            loads[v] += load
+            return True
+
+        self.unassigned = []
+        for route in leftovers:
+            if append(route, problem.route_load(route)):
+                continue
+            for node in route:
+                if not append([node], demand[node]):
+                    self.unassigned.append(node)
+
+        if self.unassigned and optimization_log is not None:
+            optimization_log.append(
+                f"[SAVINGS] 車両不足のため未割当: {len(self.unassigned)}組 "
+                f"({sum(demand[node] for node in self.unassigned)}名)"
+            )
+        return vehicle_routes
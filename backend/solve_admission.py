@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+solve_admission.py - 最適化処理の受付制御
+石垣島ツアー最適化システム
+
+- 求解（CPU処理）は同時実行数を固定したスレッドプールで実行し、
+  イベントループ（状態確認・気象取得などの軽いAPI）を止めない
+- 同時実行数を超えた要求は上限付きの待ち行列に入れ、到着順に実行する
+- 待ち行列が満杯なら 503、同じクライアントの実行中・待機中の要求が上限に達していれば
+  429 として即座に断り、Retry-After（秒）を直近の求解時間から見積もる
+- 待ち行列の長さ・待ち時間・拒否件数・取り消し件数を統計として公開する
+- 待機中に取り消された要求は即座に待ち行列から外す。実行中の取り消しは求解側の
+  停止要求で打ち切り、スレッドが終わった時点で実行枠を次の要求へ渡す
+- 一括最適化は複数の求解をまとめて1件として受け付け（クライアント上限・待ち行列満杯の
+  判定は1回）、各求解はそれぞれ実行枠を待って到着順に実行する
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+# 待ち時間統計に使う直近の件数
+WAIT_SAMPLES = 200
+# 求解時間の移動平均の重み（新しい値）
+SOLVE_TIME_WEIGHT = 0.2
+
+
+class SolveRejected(Exception):
+    """受付拒否（status_code: 429 = クライアント上限, 503 = 待ち行列満杯）"""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class SolveAdmission:
+    """同時実行数・待ち行列・クライアント別上限付きの求解実行"""
+
+    def __init__(self, max_concurrent: Optional[int] = None, max_queue: int = 8,
+                 max_per_client: int = 2):
+        self.max_concurrent = max_concurrent or max(1, min(4, (os.cpu_count() or 1)))
+        self.max_queue = max(0, int(max_queue))
+        self.max_per_client = max(1, int(max_per_client))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._running = 0
+        self._waiters: Deque['asyncio.Future'] = deque()
+        self._clients: Dict[str, int] = {}
+        self._waits_ms: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self._solve_seconds: Optional[float] = None
+        self.admitted = 0
+        self.completed = 0
+        self.rejected = {'queue_full': 0, 'client_limit': 0}
+        self.cancelled = {'queued': 0, 'running': 0}
+        self.peak_queue_depth = 0
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    # ===== 受付 =====
+
+    def _retry_after(self, ahead: int) -> int:
+        """前にある要求がはけるまでの見積もり（秒、1〜60）"""
+        solve_seconds = self._solve_seconds if self._solve_seconds is not None else 1.0
+        return max(1, min(60, math.ceil(solve_seconds * (ahead + 1) / self.max_concurrent)))
+
+    def _admit(self, client_id: str) -> None:
+        if self._clients.get(client_id, 0) >= self.max_per_client:
+            self.rejected['client_limit'] += 1
+            raise SolveRejected(
+                429, 'client_limit', self._retry_after(0),
+                f"同時に実行できる最適化は{self.max_per_client}件までです"
+            )
+        if self._running >= self.max_concurrent and len(self._waiters) >= self.max_queue:
+            self.rejected['queue_full'] += 1
+            raise SolveRejected(
+                503, 'queue_full', self._retry_after(len(self._waiters)),
+                f"最適化の待ち行列が満杯です（{self.max_queue}件）"
+            )
+        self._clients[client_id] = self._clients.get(client_id, 0) + 1
+        self.admitted += 1
+
+    def _leave(self, client_id: str) -> None:
+        remaining = self._clients[client_id] - 1
+        if remaining:
+            self._clients[client_id] = remaining
+        else:
+            del self._clients[client_id]
+
+    async def _acquire(self) -> None:
+        """実行枠を確保（空きが無ければ到着順に待つ）"""
+        started = time.perf_counter()
+        if self._running < self.max_concurrent and not self._waiters:
+            self._running += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self.peak_queue_depth = max(self.peak_queue_depth, len(self._waiters))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # 枠を譲られた直後に取り消された場合は次の待機者へ渡す
+                    self._release()
+                elif waiter in self._waiters:
+                    # 取り消し済みの待機者は _release() が先に読み飛ばしている場合がある
+                    self._waiters.remove(waiter)
+                self.cancelled['queued'] += 1
+                raise
+        self._waits_ms.append((time.perf_counter() - started) * 1000)
+
+    def _release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # 実行枠をそのまま引き継ぐ
+                return
+        self._running -= 1
+
+    def submit(self, client_id: str, fn: Callable[..., Any], *args) -> 'asyncio.Future':
+        """
+        受付後、実行枠が空くまで待ってから fn をスレッドプールで実行する
+
+        受付の可否はこの呼び出しで即座に判定する（待ち行列に入った後の待機は返した Future 側）。
+        待機中・実行中に Future を取り消しても、実行済みのスレッドが終わるまで枠は解放しない
+
+        Raises:
+            SolveRejected: 待ち行列満杯・クライアント上限
+        """
+        self._admit(client_id)
+        return asyncio.ensure_future(self._run(lambda: self._leave(client_id), fn, *args))
+
+    def submit_group(self, client_id: str,
+                     calls: Sequence[Tuple[Callable[..., Any], tuple]]) -> List['asyncio.Future']:
+        """
+        複数の求解（一括最適化の各ツアー）をまとめて受付し、それぞれ実行枠を待って実行する
+
+        クライアント上限・待ち行列満杯の判定はまとめて1件として行い、クライアントの
+        実行中件数は全件が終わるまで1件として数える（受付・完了の件数は求解ごと）
+
+        Raises:
+            SolveRejected: 待ち行列満杯・クライアント上限
+        """
+        if not calls:
+            return []
+        self._admit(client_id)
+        self.admitted += len(calls) - 1
+        remaining = [len(calls)]
+
+        def leave() -> None:
+            remaining[0] -= 1
+            if not remaining[0]:
+                self._leave(client_id)
+
+        return [asyncio.ensure_future(self._run(leave, fn, *args)) for fn, args in calls]
+
+    async def _run(self, leave: Callable[[], None], fn: Callable[..., Any], *args) -> Any:
+        try:
+            await self._acquire()
+        except BaseException:
+            leave()
+            raise
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix='solve')
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        future.add_done_callback(lambda f: self._finish(leave, f, started))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            self.cancelled['running'] += 1
+            raise
+
+    def _finish(self, leave: Callable[[], None], future: 'asyncio.Future', started: float) -> None:
+        if not future.cancelled() and future.exception() is None:
+            elapsed = time.perf_counter() - started
+            self._solve_seconds = elapsed if self._solve_seconds is None else (
+                (1 - SOLVE_TIME_WEIGHT) * self._solve_seconds + SOLVE_TIME_WEIGHT * elapsed
+            )
+        self.completed += 1
+        self._release()
+        leave()
+
+    def stats(self) -> Dict[str, Any]:
+        waits = list(self._waits_ms)
+        return {
+            'max_concurrent': self.max_concurrent,
+            'max_queue': self.max_queue,
+            'max_per_client': self.max_per_client,
+            'running': self._running,
+            'queue_depth': len(self._waiters),
+            'peak_queue_depth': self.peak_queue_depth,
+            'admitted': self.admitted,
+            'completed': self.completed,
+            'rejected': dict(self.rejected),
+            'cancelled': dict(self.cancelled),
+            'queue_wait_ms': {
+                'samples': len(waits),
+                'average': round(sum(waits) / len(waits), 1) if waits else 0.0,
+                'max': round(max(waits), 1) if waits else 0.0,
+                'last': round(waits[-1], 1) if waits else 0.0
+            },
+            'average_solve_ms': round(self._solve_seconds * 1000, 1) if self._solve_seconds is not None else None
+        }
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+solve_budget.py - リクエスト単位の求解予算（時間・反復回数）
+石垣島ツアー最適化システム
+
+- 全エンジンが共有する締切（max_solve_ms）と反復上限（max_iterations）
+- 探索系エンジン（GA / SA / 局所探索）は should_stop を世代・温度・停車ごとに確認し、
+  締切に達した時点の暫定最良解を返す
+- 各ステージの終了理由を記録し、打ち切りがあったかを結果に含める
+"""
+
+import time
+from typing import Any, Callable, Dict, Optional
+
+# ステージ終了理由
+COMPLETED = 'completed'
+TIME_BUDGET = 'time_budget'
+MAX_ITERATIONS = 'max_iterations'
+CANCELLED = 'cancelled'
+SKIPPED = 'skipped'
+
+
+def validate_budget(max_solve_ms: Optional[int], max_iterations: Optional[int]) -> None:
+    """求解予算の値を検証（未指定は制限なし、指定する場合は正の値）"""
+    if max_solve_ms is not None and max_solve_ms <= 0:
+        raise ValueError(f"max_solve_ms は正の値を指定してください: {max_solve_ms}")
+    if max_iterations is not None and max_iterations <= 0:
+        raise ValueError(f"max_iterations は正の値を指定してください: {max_iterations}")
+
+
+class SolveBudget:
+    """締切・反復上限・外部停止要求をまとめた求解予算"""
+
+    def __init__(self,
+                 max_solve_ms: Optional[int] = None,
+                 max_iterations: Optional[int] = None,
+                 cancel_check: Optional[Callable[[], bool]] = None):
+        validate_budget(max_solve_ms, max_iterations)
+        self.max_solve_ms = max_solve_ms
+        self.max_iterations = max_iterations
+        self.started = time.perf_counter()
+        self.deadline = self.started + max_solve_ms / 1000 if max_solve_ms is not None else None
+        self._cancel_check = cancel_check
+        self.stages: Dict[str, str] = {}
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    def cancelled(self) -> bool:
+        return self._cancel_check is not None and self._cancel_check()
+
+    def should_stop(self) -> bool:
+        """探索ループから呼ぶ停止判定（締切到達または外部停止要求）"""
+        return self.expired() or self.cancelled()
+
+    def remaining_ms(self, default: float) -> float:
+        """残り時間（ms）。締切なしなら default をそのまま返す"""
+        if self.deadline is None:
+            return default
+        return max(0.0, min(default, (self.deadline - time.perf_counter()) * 1000))
+
+    def record(self, stage: str, stop_reason: Optional[str]) -> None:
+        """
+        ステージの終了理由を記録
+
+        Args:
+            stop_reason: エンジンの停止理由（None / 'time_limit' = 通常終了,
+                         'iterations' = 反復上限, 'stopped' = should_stop による中断）
+        """
+        if stop_reason == 'stopped':
+            reason = TIME_BUDGET if self.expired() else CANCELLED
+        elif stop_reason == 'iterations':
+            reason = MAX_ITERATIONS
+        else:
+            reason = COMPLETED
+        self.stages[stage] = reason
+
+    def skip(self, stage: str) -> None:
+        """締切到達済みで実行しなかったステージを記録"""
+        self.stages[stage] = SKIPPED
+
+    @property
+    def cut_short(self) -> bool:
+        return any(reason != COMPLETED for reason in self.stages.values())
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'cut_short': self.cut_short,
+            'max_solve_ms': self.max_solve_ms,
+            'max_iterations': self.max_iterations,
+            'elapsed_ms': round((time.perf_counter() - self.started) * 1000, 1),
+            'stages': dict(self.stages)
+        }
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+spatial_index.py - ピックアップ地点の空間インデックス（グリッド）
+石垣島ツアー最適化システム
+
+- 緯度経度を正距円筒図法で km 座標に変換し、一様グリッドのセルに登録
+- 最近傍検索はクエリ地点のセルから同心リング状に探索し、
+  リングまでの最短距離が暫定最良を超えた時点で打ち切り
+- 削除は O(1)（セル内の集合から除去）
+  → 最近傍法の構築全体が O(n²) から概ね O(n log n) 相当に
+"""
+
+import math
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+KM_PER_DEG_LAT = 110.574
+KM_PER_DEG_LNG_EQUATOR = 111.320
+
+# 射影距離とハバーサイン距離の差を吸収する打ち切り余裕
+PRUNE_TOLERANCE = 1.01
+
+
+class GridSpatialIndex:
+    """削除対応の一様グリッド最近傍インデックス"""
+
+    def __init__(self, lats: List[float], lngs: List[float],
+                 cell_km: Optional[float] = None,
+                 points_per_cell: float = 2.0):
+        count = len(lats)
+        self._ref_lat = sum(lats) / count if count else 0.0
+        self._km_per_deg_lng = KM_PER_DEG_LNG_EQUATOR * math.cos(math.radians(self._ref_lat))
+
+        self._xy = [self._project(lat, lng) for lat, lng in zip(lats, lngs)]
+
+        if cell_km is None:
+            if count:
+                xs = [x for x, _ in self._xy]
+                ys = [y for _, y in self._xy]
+                area = max(max(xs) - min(xs), 1e-3) * max(max(ys) - min(ys), 1e-3)
+                cell_km = math.sqrt(area * points_per_cell / count)
+            else:
+                cell_km = 1.0
+        self.cell_km = max(cell_km, 1e-3)
+
+        self._cells: Dict[Tuple[int, int], Set[int]] = {}
+        self._cell_of: List[Tuple[int, int]] = []
+        for i, (x, y) in enumerate(self._xy):
+            cell = self._cell(x, y)
+            self._cell_of.append(cell)
+            self._cells.setdefault(cell, set()).add(i)
+        self._active = count
+
+        if self._cells:
+            self._min_cell = (min(c[0] for c in self._cells), min(c[1] for c in self._cells))
+            self._max_cell = (max(c[0] for c in self._cells), max(c[1] for c in self._cells))
+
+    def _project(self, lat: float, lng: float) -> Tuple[float, float]:
+        return lng * self._km_per_deg_lng, lat * KM_PER_DEG_LAT
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return int(math.floor(x / self.cell_km)), int(math.floor(y / self.cell_km))
+
+    def __len__(self) -> int:
+        return self._active
+
+    def remove(self, i: int) -> None:
+        """地点 i を削除"""
+        cell = self._cell_of[i]
+        bucket = self._cells.get(cell)
+        if bucket and i in bucket:
+            bucket.remove(i)
+            if not bucket:
+                del self._cells[cell]
+            self._active -= 1
+
+    def nearest(self, lat: float, lng: float,
+                distance: Optional[Callable[[int], float]] = None) -> Optional[int]:
+        """
+        クエリ地点に最も近い未削除の地点番号
+
+        Args:
+            distance: 候補 i までの実距離（km）を返す関数。省略時は射影距離
+        """
+        if not self._active:
+            return None
+        qx, qy = self._project(lat, lng)
+        if distance is None:
+            xy = self._xy
+            distance = lambda i: math.hypot(xy[i][0] - qx, xy[i][1] - qy)
+
+        cx, cy = self._cell(qx, qy)
+        (min_x, min_y), (max_x, max_y) = self._min_cell, self._max_cell
+        # 探索リングの上限（全セルを覆えば必ず見つかる）
+        max_ring = max(abs(cx - min_x), abs(cx - max_x), abs(cy - min_y), abs(cy - max_y))
+        # クエリが登録範囲の外（出発地など）なら、範囲に届くリングから始める
+        first_ring = max(min_x - cx, cx - max_x, min_y - cy, cy - max_y, 0)
+
+        best, best_distance = None, math.inf
+        cells = self._cells
+        for ring in range(first_ring, max_ring + 1):
+            # リング上のセルまでの最短距離が暫定最良より遠ければ打ち切り
+            if best is not None and (ring - 1) * self.cell_km > best_distance * PRUNE_TOLERANCE:
+                break
+            for cell in self._ring_cells(cx, cy, ring, self._min_cell, self._max_cell):
+                bucket = cells.get(cell)
+                if not bucket:
+                    continue
+                for i in bucket:
+                    d = distance(i)
+                    if d < best_distance or (d == best_distance and best is not None and i < best):
+                        best, best_distance = i, d
+        return best
+
+    @staticmethod
+    def _ring_cells(cx: int, cy: int, ring: int,
+                    min_cell: Tuple[int, int], max_cell: Tuple[int, int]):
+        """リング上のセルのうち登録範囲（min_cell〜max_cell）と重なるもの"""
+        if ring == 0:
+            yield cx, cy
+            return
+        (min_x, min_y), (max_x, max_y) = min_cell, max_cell
+        x_range = range(max(cx - ring, min_x), min(cx + ring, max_x) + 1)
+        for y in (cy - ring, cy + ring):
+            if min_y <= y <= max_y:
+                for x in x_range:
+                    yield x, y
+        for x in (cx - ring, cx + ring):
+            if min_x <= x <= max_x:
+                for y in range(max(cy - ring + 1, min_y), min(cy + ring - 1, max_y) + 1):
+                    yield x, y
+
+
+def nearest_neighbor_order(lats: List[float], lngs: List[float],
+                           start_lat: float, start_lng: float,
+                           distance_from: Optional[Callable[[Optional[int], int], float]] = None) -> List[int]:
+    """
+    空間インデックスを使った最近傍法の巡回順
+
+    Args:
+        distance_from: (直前の地点番号 or None=出発地, 候補番号) → 実距離（km）
+
+    Returns:
+        地点番号の巡回順
+    """
+    index = GridSpatialIndex(lats, lngs)
+    order: List[int] = []
+    current: Optional[int] = None
+    lat, lng = start_lat, start_lng
+    while len(index):
+        if distance_from is None:
+            nearest = index.nearest(lat, lng)
+        else:
+            nearest = index.nearest(lat, lng, lambda i, c=current: distance_from(c, i))
+        index.remove(nearest)
+        order.append(nearest)
+        current = nearest
+        lat, lng = lats[nearest], lngs[nearest]
+    return order
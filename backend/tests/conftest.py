@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""テスト共通設定: backend 直下のモジュールをそのまま import できるようにする"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+エンジン単体テスト用の問題インスタンスと解の検証
+乱数の種を固定した小規模な石垣島周辺のゲスト配置を作る
+"""
+
+import random
+from typing import Iterable, List, Tuple
+
+from routing_problem import RoutingProblem
+
+ACTIVITY_LOCATION = {'name': '川平湾', 'lat': 24.4567, 'lng': 124.1456}
+
+
+def random_problem(seed: int, num_guests: int = 30, num_vehicles: int = 4,
+                   capacity: int = 12) -> RoutingProblem:
+    rng = random.Random(seed)
+    guests = []
+    for i in range(num_guests):
+        start = 7 * 60 + rng.randrange(0, 120, 15)
+        guests.append({
+            'id': f'guest_{i}',
+            'name': f'ゲスト{i}',
+            'pickup_lat': 24.33 + rng.random() * 0.15,
+            'pickup_lng': 124.10 + rng.random() * 0.10,
+            'num_people': rng.randint(1, 4),
+            'preferred_pickup_start': f'{start // 60:02d}:{start % 60:02d}',
+            'preferred_pickup_end': f'{(start + 60) // 60:02d}:{(start + 60) % 60:02d}'
+        })
+    vehicles = [
+        {'id': f'vehicle_{j}', 'name': f'車両{j}', 'capacity': capacity,
+         'location': {'lat': 24.34, 'lng': 124.15}}
+        for j in range(num_vehicles)
+    ]
+    return RoutingProblem(guests, vehicles, ACTIVITY_LOCATION)
+
+
+def seated_start(problem: RoutingProblem, seed: int) -> Tuple[RoutingProblem, List[List[int]]]:
+    """
+    ゲストを無作為な順に定員まで詰めた初期解
+
+    改善エンジンは全ゲストを含む初期解を前提とするため、乗り切らないゲストを
+    除いた部分問題（本番と同じ guest_subproblem）とその上の初期解を返す
+    """
+    nodes = list(range(1, problem.num_guests + 1))
+    random.Random(seed).shuffle(nodes)
+    routes: List[List[int]] = [[] for _ in range(problem.num_vehicles)]
+    for node in nodes:
+        for r, route in enumerate(routes):
+            if problem.route_load(route) + problem.demand_list[node] <= problem.capacity_list[r]:
+                route.append(node)
+                break
+    kept = sorted(node for route in routes for node in route)
+    renumber = {node: k for k, node in enumerate(kept, start=1)}
+    return (problem.guest_subproblem(kept),
+            [[renumber[node] for node in route] for route in routes])
+
+
+def assert_valid_routes(problem: RoutingProblem, routes: List[List[int]],
+                        unassigned: Iterable[int] = ()) -> None:
+    """各ゲストが1回だけ配置されるか未割当であり、全車両が定員内であること"""
+    unassigned = list(unassigned)
+    assert len(routes) == problem.num_vehicles
+    placed = [node for route in routes for node in route]
+    assert len(placed) == len(set(placed))
+    assert not set(placed) & set(unassigned)
+    assert sorted(placed + unassigned) == list(range(1, problem.num_guests + 1))
+    for r, route in enumerate(routes):
+        assert problem.route_load(route) <= problem.capacity_list[r]
+
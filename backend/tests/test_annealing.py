@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+シミュレーテッドアニーリング（SimulatedAnnealingOptimizer）のテスト
+最良解が各ゲストを1回だけ配置して定員を守り、距離が初期解より悪化しないこと、
+同じ乱数の種で同じ解になることを確認する
+"""
+
+import pytest
+
+from annealing_optimizer import SimulatedAnnealingOptimizer
+from routing_cases import assert_valid_routes, random_problem, seated_start
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_solve_keeps_guests_and_capacity_and_never_lengthens(seed):
+    problem, initial = seated_start(random_problem(seed), seed)
+
+    routes = SimulatedAnnealingOptimizer(problem, time_limit_ms=2000, seed=seed).solve(initial)
+
+    assert_valid_routes(problem, routes)
+    assert problem.route_distances(routes).sum() <= problem.route_distances(initial).sum() + 1e-9
+
+
+def test_solve_shortens_a_shuffled_start():
+    problem, initial = seated_start(random_problem(7), 7)
+
+    routes = SimulatedAnnealingOptimizer(problem, time_limit_ms=2000, seed=7).solve(initial)
+
+    assert problem.route_distances(routes).sum() < problem.route_distances(initial).sum()
+
+
+def test_same_seed_gives_the_same_routes():
+    problem, initial = seated_start(random_problem(5), 5)
+
+    def run():
+        return SimulatedAnnealingOptimizer(problem, time_limit_ms=5000, max_iterations=20000, seed=11).solve(initial)
+
+    assert run() == run()
+
+
+def test_iteration_limit_stops_with_a_valid_solution():
+    problem, initial = seated_start(random_problem(6), 6)
+    engine = SimulatedAnnealingOptimizer(problem, iterations_per_temperature=100,
+                                         time_limit_ms=5000, max_iterations=300, seed=6)
+
+    routes = engine.solve(initial)
+
+    assert engine.stop_reason == 'iterations'
+    assert engine.stats['evaluated_moves'] == 300
+    assert_valid_routes(problem, routes)
+    assert problem.route_distances(routes).sum() <= problem.route_distances(initial).sum() + 1e-9
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+定員超過の回帰テスト
+全アルゴリズムで、定員内に乗れないゲストは未割当（capacity_exceeded）として返し、
+車両に詰め込まない（overflow_people == 0）ことを確認する
+"""
+
+import asyncio
+
+import pytest
+
+from enhanced_optimizer import EnhancedTourOptimizer
+from tour_models import serialize_routes
+
+ALGORITHMS = ['genetic', 'simulated_annealing', 'insertion', 'savings', 'nearest_neighbor', 'race']
+
+ACTIVITY_LOCATION = {'name': '川平湾', 'lat': 24.4567, 'lng': 124.1456}
+
+
+def overbooked_case():
+    """3名 × 12組 = 36名 に対して 10人乗り × 2台（最大18名 = 6組しか乗れない）"""
+    guests = [
+        {
+            'id': f'guest_{i}',
+            'name': f'ゲスト{i}',
+            'hotel_name': f'ホテル{i}',
+            'pickup_lat': 24.33 + 0.01 * i,
+            'pickup_lng': 124.10 + 0.008 * (i % 5),
+            'num_people': 3,
+            'preferred_pickup_start': '08:00',
+            'preferred_pickup_end': '09:30'
+        }
+        for i in range(12)
+    ]
+    vehicles = [
+        {'id': f'vehicle_{j}', 'name': f'車両{j}', 'capacity': 10, 'driver': f'運転手{j}',
+         'location': {'lat': 24.34, 'lng': 124.15}}
+        for j in range(2)
+    ]
+    return guests, vehicles
+
+
+@pytest.fixture(scope='module')
+def optimizer():
+    optimizer = EnhancedTourOptimizer()
+    yield optimizer
+    optimizer.route_executor.shutdown()
+
+
+@pytest.mark.parametrize('algorithm', ALGORITHMS)
+def test_overbooked_guests_are_unassigned(optimizer, algorithm):
+    guests, vehicles = overbooked_case()
+    result = asyncio.run(optimizer.optimize_multi_vehicle_routes(
+        guests, vehicles, ACTIVITY_LOCATION, '10:00', algorithm=algorithm, max_solve_ms=2000
+    ))
+
+    assert result['solution_quality']['overflow_people'] == 0
+    routes = serialize_routes(result['routes'])
+    for route in routes:
+        assert route['passenger_count'] <= route['capacity']
+
+    routed = [stop['guest_id'] for route in routes for stop in route['route']]
+    unassigned = [guest['guest_id'] for guest in result['unassigned_guests']]
+    assert all(guest['reason'] == 'capacity_exceeded' for guest in result['unassigned_guests'])
+    # 各組はちょうど1回（ルート上か未割当のどちらか）
+    assert sorted(routed + unassigned) == sorted(guest['id'] for guest in guests)
+    # 1台あたり3組（9名）まで乗れるので、未割当は6組
+    assert len(unassigned) == 6
+
+
+def test_plan_cancel_refills_within_capacity(optimizer):
+    """キャンセルで空いた2席に、未割当の2名 × 2組のうち1組だけが入る"""
+    guests = [
+        {
+            'id': f'g{i}',
+            'name': f'ゲスト{i}',
+            'hotel_name': f'ホテル{i}',
+            'pickup_lat': 24.34 + 0.01 * i,
+            'pickup_lng': 124.15,
+            'num_people': 2,
+            'preferred_pickup_start': '08:00',
+            'preferred_pickup_end': '09:30'
+        }
+        for i in range(1, 5)
+    ]
+    vehicles = [{'id': 'v1', 'name': '車両1', 'capacity': 4, 'driver': '運転手',
+                 'location': {'lat': 24.34, 'lng': 124.15}}]
+
+    async def scenario():
+        plan, created = await optimizer.create_plan(
+            'capacity', guests, vehicles, ACTIVITY_LOCATION, '10:00', 'insertion'
+        )
+        assert len(created['unassigned_guests']) == 2
+        seated = plan.routes[0][0]
+        return await optimizer.remove_plan_guest(plan, seated)
+
+    result = asyncio.run(scenario())
+    assert result['solution_quality']['overflow_people'] == 0
+    routes = serialize_routes(result['routes'])
+    assert sum(route['passenger_count'] for route in routes) == 4
+    assert len(result['unassigned_guests']) == 1
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+時間枠付き挿入法（InsertionRouteBuilder）のテスト
+構築・追加挿入のどちらでも各ゲストが1回だけ配置されるか未割当になり、定員を守ることを確認する
+"""
+
+import pytest
+
+from insertion_optimizer import InsertionRouteBuilder
+from routing_cases import assert_valid_routes, random_problem
+
+
+@pytest.mark.parametrize('strategy', ['regret', 'cheapest'])
+@pytest.mark.parametrize('seed', [1, 2])
+def test_build_places_every_guest_when_seats_suffice(strategy, seed):
+    problem = random_problem(seed, capacity=40)
+
+    routes = InsertionRouteBuilder(problem, strategy=strategy).build()
+
+    assert_valid_routes(problem, routes)
+
+
+@pytest.mark.parametrize('strategy', ['regret', 'cheapest'])
+@pytest.mark.parametrize('seed', [1, 2])
+def test_build_leaves_guests_out_instead_of_overbooking(strategy, seed):
+    problem = random_problem(seed, capacity=12)
+    log = []
+
+    routes = InsertionRouteBuilder(problem, strategy=strategy).build(log)
+
+    placed = {node for route in routes for node in route}
+    omitted = [node for node in range(1, problem.num_guests + 1) if node not in placed]
+    assert omitted
+    assert_valid_routes(problem, routes, omitted)
+    assert any('未割当' in line for line in log)
+    # 外したゲストはどの車両の空き定員にも収まらない
+    spare = [capacity - problem.route_load(route) for capacity, route in zip(problem.capacity_list, routes)]
+    assert all(problem.demand_list[node] > max(spare) for node in omitted)
+
+
+@pytest.mark.parametrize('seed', [3, 4])
+def test_insert_keeps_existing_routes_and_reports_unseated(seed):
+    problem = random_problem(seed, capacity=12)
+    existing = [node for node in range(1, problem.num_guests + 1) if node % 3 == 0]
+    base = InsertionRouteBuilder(problem, strategy='cheapest')
+    base_routes, _, base_unseated = base.insert([[] for _ in range(problem.num_vehicles)], existing)
+    added = [node for node in range(1, problem.num_guests + 1) if node % 3 != 0]
+
+    routes, relaxed, unseated = InsertionRouteBuilder(problem, strategy='cheapest').insert(base_routes, added)
+
+    assert_valid_routes(problem, routes, base_unseated + unseated)
+    assert set(unseated) <= set(added)
+    assert set(relaxed) <= {node for route in routes for node in route}
+    # 既存の停車の順序は変えずに追加だけを挿入する
+    for before, after in zip(base_routes, routes):
+        assert [node for node in after if node in before] == before
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+局所探索（LocalSearchOptimizer）のテスト
+改善後も各ゲストが1回だけ配置され定員を守り、距離が初期解より悪化しないことを確認する
+"""
+
+import pytest
+
+from local_search import LocalSearchOptimizer
+from routing_cases import assert_valid_routes, random_problem, seated_start
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_improve_keeps_guests_and_capacity_and_never_lengthens(seed):
+    problem, initial = seated_start(random_problem(seed), seed)
+
+    improved = LocalSearchOptimizer(problem, time_limit_ms=2000).improve(initial)
+
+    assert_valid_routes(problem, improved)
+    assert problem.route_distances(improved).sum() <= problem.route_distances(initial).sum() + 1e-9
+
+
+def test_improve_shortens_a_shuffled_start():
+    problem, initial = seated_start(random_problem(7), 7)
+    optimizer = LocalSearchOptimizer(problem, time_limit_ms=2000)
+
+    improved = optimizer.improve(initial)
+
+    assert problem.route_distances(improved).sum() < problem.route_distances(initial).sum()
+    assert sum(optimizer.move_counts.values()) > 0
+
+
+def test_improve_stops_on_request_with_a_valid_solution():
+    problem, initial = seated_start(random_problem(4), 4)
+    optimizer = LocalSearchOptimizer(problem, time_limit_ms=2000)
+
+    improved = optimizer.improve(initial, should_stop=lambda: True)
+
+    assert optimizer.stop_reason == 'stopped'
+    assert_valid_routes(problem, improved)
+    assert problem.route_distances(improved).sum() <= problem.route_distances(initial).sum() + 1e-9
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+非同期最適化ジョブ（OptimizationJobQueue）のテスト
+一時ディレクトリの SQLite で、優先度順の実行・冪等キー・取り消し・
+再起動時の再開・保持期間による削除を確認する
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from optimization_jobs import FINISHED_STATUSES, JobConflict, JobStore, OptimizationJob, OptimizationJobQueue
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.db'))
+
+
+def stored_job(job_id: str, status: str, days_ago: float = 0, priority: str = 'batch') -> OptimizationJob:
+    at = (datetime.now() - timedelta(days=days_ago)).isoformat()
+    return OptimizationJob(
+        job_id=job_id, priority=priority, status=status, request={'name': job_id},
+        request_hash=job_id, idempotency_key=None, created_at=at,
+        started_at=at if status != 'queued' else None,
+        finished_at=at if status in FINISHED_STATUSES else None
+    )
+
+
+async def wait_finished(store: JobStore, *job_ids: str) -> None:
+    for _ in range(500):
+        if all(store.get(job_id).status in FINISHED_STATUSES for job_id in job_ids):
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError('ジョブが終了しませんでした')
+
+
+def test_interactive_jobs_run_before_batch_jobs(store):
+    async def scenario():
+        order = []
+
+        async def execute(request, should_stop):
+            order.append(request['name'])
+            return {'name': request['name']}
+
+        queue = OptimizationJobQueue(store, execute)
+        queue.start()
+        first, _ = queue.submit({'name': 'batch-1'}, 'batch')
+        second, _ = queue.submit({'name': 'batch-2'}, 'batch')
+        urgent, _ = queue.submit({'name': 'interactive'}, 'interactive')
+        await wait_finished(store, first.job_id, second.job_id, urgent.job_id)
+        await queue.stop()
+
+        assert order == ['interactive', 'batch-1', 'batch-2']
+        assert store.get(urgent.job_id).result == {'name': 'interactive'}
+        assert store.get(first.job_id).status == 'succeeded'
+
+    asyncio.run(scenario())
+
+
+def test_idempotency_key_replays_and_conflicts(store):
+    async def scenario():
+        async def execute(request, should_stop):
+            return {}
+
+        queue = OptimizationJobQueue(store, execute)
+        queue.start()
+        job, created = queue.submit({'name': 'tour'}, 'batch', idempotency_key='key-1')
+        replay, replay_created = queue.submit({'name': 'tour'}, 'batch', idempotency_key='key-1')
+        assert created and not replay_created
+        assert replay.job_id == job.job_id
+
+        with pytest.raises(JobConflict):
+            queue.submit({'name': 'other tour'}, 'batch', idempotency_key='key-1')
+        # 同じ内容でも優先度が異なれば別の依頼
+        with pytest.raises(JobConflict):
+            queue.submit({'name': 'tour'}, 'interactive', idempotency_key='key-1')
+        await wait_finished(store, job.job_id)
+        await queue.stop()
+        assert store.counts() == {'succeeded': 1}
+
+    asyncio.run(scenario())
+
+
+def test_cancel_queued_and_running_jobs(store):
+    async def scenario():
+        executed = []
+
+        async def execute(request, should_stop):
+            executed.append(request['name'])
+            while not should_stop():
+                await asyncio.sleep(0.01)
+            return {'partial': True}
+
+        queue = OptimizationJobQueue(store, execute)
+        queue.start()
+        running, _ = queue.submit({'name': 'running'})
+        await asyncio.sleep(0.05)
+        queued, _ = queue.submit({'name': 'queued'})
+        assert store.get(running.job_id).status == 'running'
+
+        assert queue.cancel(queued.job_id).status == 'cancelled'
+        assert queue.cancel(running.job_id).status == 'cancelled'
+        await wait_finished(store, running.job_id, queued.job_id)
+        while queue.stats()['running'] or not queue._queue.empty():
+            await asyncio.sleep(0.01)
+        await queue.stop()
+
+        # 待機中のジョブは実行されず、実行中のジョブの暫定解は保存しない
+        assert executed == ['running']
+        assert store.get(running.job_id).result is None
+        assert store.get(running.job_id).status == 'cancelled'
+        assert store.get(queued.job_id).started_at is None
+        with pytest.raises(JobConflict):
+            queue.cancel(running.job_id)
+        assert queue.cancel('missing') is None
+
+    asyncio.run(scenario())
+
+
+def test_start_requeues_jobs_left_running(store):
+    store.insert(stored_job('interrupted', 'running'))
+    store.insert(stored_job('waiting', 'queued'))
+
+    async def scenario():
+        executed = []
+
+        async def execute(request, should_stop):
+            executed.append(request['name'])
+            return {}
+
+        queue = OptimizationJobQueue(store, execute)
+        queue.start()
+        restored = store.get('interrupted')
+        assert (restored.status, restored.started_at) == ('queued', None)
+        await wait_finished(store, 'interrupted', 'waiting')
+        await queue.stop()
+        assert sorted(executed) == ['interrupted', 'waiting']
+
+    asyncio.run(scenario())
+
+
+def test_purge_honours_retention(store):
+    store.insert(stored_job('old-succeeded', 'succeeded', days_ago=10))
+    store.insert(stored_job('old-cancelled', 'cancelled', days_ago=8))
+    store.insert(stored_job('recent', 'failed', days_ago=6))
+    store.insert(stored_job('old-queued', 'queued', days_ago=10))
+
+    assert store.purge(retention_days=7) == 2
+    assert store.get('old-succeeded') is None
+    assert store.get('old-cancelled') is None
+    assert store.get('recent') is not None
+    # 未完了のジョブは古くても残す
+    assert store.get('old-queued') is not None
+    assert store.purge(retention_days=7) == 0
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+race モードの停止番号の回収テスト
+プロセスプールを起動しない（スレッド実行の）経路で asyncio.run を繰り返しても、
+締切後に停止要求を送ったエンジンの停止番号が全て返却されることを確認する
+"""
+
+import asyncio
+import random
+
+from enhanced_optimizer import EnhancedTourOptimizer
+from route_workers import CANCEL_SLOTS
+
+ACTIVITY_LOCATION = {'name': '川平湾', 'lat': 24.4567, 'lng': 124.1456}
+
+
+def race_case(seed: int):
+    rng = random.Random(seed)
+    guests = [
+        {
+            'id': f'guest_{i}',
+            'name': f'ゲスト{i}',
+            'hotel_name': f'ホテル{i}',
+            'pickup_lat': 24.33 + rng.random() * 0.15,
+            'pickup_lng': 124.10 + rng.random() * 0.10,
+            'num_people': rng.randint(1, 4),
+            'preferred_pickup_start': '08:00',
+            'preferred_pickup_end': '09:30'
+        }
+        for i in range(40)
+    ]
+    vehicles = [
+        {'id': f'vehicle_{j}', 'name': f'車両{j}', 'capacity': 12, 'driver': f'運転手{j}',
+         'location': {'lat': 24.34, 'lng': 124.15}}
+        for j in range(4)
+    ]
+    return guests, vehicles
+
+
+def test_race_releases_cancel_slots_under_asyncio_run():
+    optimizer = EnhancedTourOptimizer()
+    executor = optimizer.route_executor
+    assert executor._pool is None
+
+    # 番号の総数より多く実行し、取りこぼしがあれば枯渇するようにする
+    for run in range(CANCEL_SLOTS + 8):
+        guests, vehicles = race_case(run)
+        result = asyncio.run(optimizer.optimize_multi_vehicle_routes(
+            guests, vehicles, ACTIVITY_LOCATION, '10:00', algorithm='race', max_solve_ms=100,
+            algorithm_parameters={'generations': 100000}
+        ))
+        assert result['algorithm_used'] == 'race_dynamic_timing'
+        assert len(executor._free_slots) == CANCEL_SLOTS
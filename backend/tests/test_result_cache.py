@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+最適化結果キャッシュ（OptimizationResultCache）のテスト
+キーの正規化、保持期限・LRU による破棄、複製の返却、キャッシュ対象の判定を確認する
+"""
+
+import pytest
+
+import result_cache
+from result_cache import OptimizationResultCache, is_cacheable_result, request_cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """time.monotonic を手動で進める時計に置き換える"""
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_key_ignores_dict_key_order():
+    guest = {'id': 'g1', 'pickup_lat': 24.3401, 'pickup_lng': 124.1502, 'num_people': 2}
+    reordered = {'num_people': 2, 'pickup_lng': 124.1502, 'id': 'g1', 'pickup_lat': 24.3401}
+    assert (request_cache_key(guests=[guest], algorithm='genetic', start_time='10:00') ==
+            request_cache_key(start_time='10:00', algorithm='genetic', guests=[reordered]))
+    # 精度以下の浮動小数の揺れは同じキー、ゲストの並び順は別のキー
+    jittered = dict(guest, pickup_lat=24.3401 + 1e-9)
+    assert request_cache_key(guests=[guest]) == request_cache_key(guests=[jittered])
+    other = dict(guest, id='g2')
+    assert request_cache_key(guests=[guest, other]) != request_cache_key(guests=[other, guest])
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = OptimizationResultCache(max_entries=4, ttl_seconds=60)
+    cache.put('a', {'total_distance': 10.0})
+
+    clock[0] += 59
+    assert cache.get('a') == {'total_distance': 10.0}
+    clock[0] += 1
+    assert cache.get('a') is None
+    assert len(cache) == 0
+    assert cache.stats()['expirations'] == 1
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = OptimizationResultCache(max_entries=2, ttl_seconds=60)
+    cache.put('a', {'n': 1})
+    cache.put('b', {'n': 2})
+    assert cache.get('a') == {'n': 1}  # a を最近使用にする
+
+    cache.put('c', {'n': 3})
+    assert cache.get('b') is None
+    assert cache.get('a') == {'n': 1}
+    assert cache.get('c') == {'n': 3}
+    assert cache.stats()['evictions'] == 1
+
+
+def test_hit_returns_a_deep_copy(clock):
+    cache = OptimizationResultCache()
+    result = {'routes': [{'route': [{'name': 'ゲスト1'}]}], 'total_distance': 12.5}
+    cache.put('a', result)
+    # 格納後に元の辞書を変更してもキャッシュは変わらない
+    result['routes'][0]['route'].clear()
+
+    hit = cache.get('a')
+    hit['routes'][0]['route'][0]['name'] = '変更'
+    hit['total_distance'] = 0
+
+    assert cache.get('a') == {'routes': [{'route': [{'name': 'ゲスト1'}]}], 'total_distance': 12.5}
+
+
+def test_cancelled_runs_are_not_cacheable():
+    completed = {'solve_status': {'cut_short': False, 'stages': {'genetic': 'completed'}}}
+    timed_out = {'solve_status': {'cut_short': True, 'stages': {'genetic': 'time_budget'}}}
+    cancelled = {'solve_status': {'cut_short': True, 'stages': {'assignment': 'completed', 'genetic': 'cancelled'}}}
+
+    assert is_cacheable_result(completed)
+    assert is_cacheable_result(timed_out)
+    assert is_cacheable_result({'routes': []})
+    assert not is_cacheable_result(cancelled)
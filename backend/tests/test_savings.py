@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+節約法（SavingsRouteBuilder）のテスト
+各ゲストが1回だけ配置されるか unassigned に入り、全車両が定員を守ることを確認する
+"""
+
+import pytest
+
+from routing_cases import assert_valid_routes, random_problem
+from savings_optimizer import SavingsRouteBuilder
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_build_places_every_guest_when_seats_suffice(seed):
+    problem = random_problem(seed, capacity=40)
+    builder = SavingsRouteBuilder(problem)
+
+    routes = builder.build()
+
+    assert builder.unassigned == []
+    assert_valid_routes(problem, routes)
+    # 往復ルートの合計より長くならない
+    round_trips = sum(problem.route_distance([node]) for node in range(1, problem.num_guests + 1))
+    assert problem.route_distances(routes).sum() <= round_trips
+
+
+@pytest.mark.parametrize('seed,num_vehicles,capacity', [(1, 4, 12), (2, 4, 12), (3, 2, 6)])
+def test_build_reports_guests_that_do_not_fit(seed, num_vehicles, capacity):
+    problem = random_problem(seed, num_vehicles=num_vehicles, capacity=capacity)
+    builder = SavingsRouteBuilder(problem)
+    log = []
+
+    routes = builder.build(log)
+
+    assert builder.unassigned
+    assert_valid_routes(problem, routes, builder.unassigned)
+    assert any('未割当' in line for line in log)
+    # 未割当のゲストはどの車両の空き定員にも収まらない
+    spare = [capacity - problem.route_load(route) for capacity, route in zip(problem.capacity_list, routes)]
+    assert all(problem.demand_list[node] > max(spare) for node in builder.unassigned)
+
+
+def test_rebuild_resets_unassigned():
+    problem = random_problem(4, capacity=12)
+    builder = SavingsRouteBuilder(problem)
+    first = builder.build()
+    unassigned = list(builder.unassigned)
+
+    assert builder.build() == first
+    assert builder.unassigned == unassigned
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+同一キーの同時実行の集約（SingleFlight）のテスト
+同時に来た同じ処理は1回だけ実行し、一部の呼び出しの取り消しでは止めず、
+最後の呼び出しが取り消された時点で処理を取り消すことを確認する
+"""
+
+import asyncio
+
+from result_cache import SingleFlight
+
+
+async def settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_identical_calls_run_the_loader_once():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+        release = asyncio.Event()
+
+        async def loader():
+            calls.append('run')
+            await release.wait()
+            return {'routes': [{'vehicle_id': 'v1'}]}
+
+        callers = [asyncio.ensure_future(flight.run('key', loader)) for _ in range(3)]
+        await settle()
+        assert len(flight) == 1
+        release.set()
+        results = await asyncio.gather(*callers)
+
+        assert calls == ['run']
+        assert [shared for _, shared in results] == [False, True, True]
+        assert all(result == {'routes': [{'vehicle_id': 'v1'}]} for result, _ in results)
+        # 共有した結果は呼び出しごとの複製
+        assert results[1][0] is not results[0][0]
+        assert flight.stats() == {'in_flight': 0, 'executions': 1, 'coalesced': 2, 'abandoned': 0}
+
+        # 完了後の同じキーは新たに実行する
+        await flight.run('key', loader)
+        assert calls == ['run', 'run']
+
+    asyncio.run(scenario())
+
+
+def test_one_caller_cancelling_keeps_the_shared_work():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+        work_cancelled = []
+
+        async def loader():
+            try:
+                await release.wait()
+            except asyncio.CancelledError:
+                work_cancelled.append(True)
+                raise
+            return 'done'
+
+        first = asyncio.ensure_future(flight.run('key', loader))
+        second = asyncio.ensure_future(flight.run('key', loader))
+        await settle()
+
+        first.cancel()
+        await settle()
+        assert first.cancelled()
+        assert not work_cancelled
+        assert len(flight) == 1
+
+        release.set()
+        assert await second == ('done', True)
+        assert flight.stats()['abandoned'] == 0
+
+    asyncio.run(scenario())
+
+
+def test_last_caller_cancelling_cancels_the_work():
+    async def scenario():
+        flight = SingleFlight()
+        work_cancelled = []
+
+        async def loader():
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                work_cancelled.append(True)
+                raise
+
+        callers = [asyncio.ensure_future(flight.run('key', loader)) for _ in range(2)]
+        await settle()
+        for caller in callers:
+            caller.cancel()
+            await settle()
+
+        assert all(caller.cancelled() for caller in callers)
+        assert work_cancelled == [True]
+        assert len(flight) == 0
+        assert flight.stats()['abandoned'] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+求解の受付制御（SolveAdmission）のテスト
+待ち行列満杯・クライアント上限の拒否、到着順の実行枠の受け渡し、
+待機中・受け渡し直後の取り消し、一括受付、統計を確認する
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from solve_admission import SolveAdmission, SolveRejected
+
+
+async def settle() -> None:
+    """投入したタスクを待ち行列に入るところまで進める"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def blocker():
+    """set() するまで実行枠を占有する求解"""
+    gate = threading.Event()
+    return gate, gate.wait
+
+
+def test_queue_full_is_rejected_with_503():
+    async def scenario():
+        admission = SolveAdmission(max_concurrent=1, max_queue=1, max_per_client=5)
+        gate, hold = blocker()
+        running = admission.submit('a', hold)
+        await settle()
+        queued = admission.submit('b', lambda: 'queued')
+        await settle()
+
+        with pytest.raises(SolveRejected) as rejected:
+            admission.submit('c', lambda: 'rejected')
+        assert rejected.value.status_code == 503
+        assert rejected.value.reason == 'queue_full'
+        assert rejected.value.retry_after >= 1
+        assert admission.stats()['rejected'] == {'queue_full': 1, 'client_limit': 0}
+
+        gate.set()
+        assert await queued == 'queued'
+        await running
+        admission.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_client_limit_is_rejected_with_429():
+    async def scenario():
+        admission = SolveAdmission(max_concurrent=1, max_queue=8, max_per_client=1)
+        gate, hold = blocker()
+        running = admission.submit('a', hold)
+        await settle()
+
+        with pytest.raises(SolveRejected) as rejected:
+            admission.submit('a', lambda: 'rejected')
+        assert rejected.value.status_code == 429
+        assert rejected.value.reason == 'client_limit'
+        assert rejected.value.retry_after >= 1
+        other = admission.submit('b', lambda: 'other client')
+
+        gate.set()
+        await running
+        assert await other == 'other client'
+        # 終了後は同じクライアントも再び受け付ける
+        assert await admission.submit('a', lambda: 'again') == 'again'
+        admission.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_slot_is_handed_over_in_arrival_order():
+    async def scenario():
+        admission = SolveAdmission(max_concurrent=1, max_queue=8, max_per_client=8)
+        order = []
+        gate, hold = blocker()
+        first = admission.submit('a', lambda: order.append('first') or hold())
+        await settle()
+        queued = []
+        for name in ('b', 'c', 'd'):
+            queued.append(admission.submit(name, order.append, name))
+            await settle()
+        assert admission.stats()['queue_depth'] == 3
+
+        gate.set()
+        await asyncio.gather(first, *queued)
+        assert order == ['first', 'b', 'c', 'd']
+        assert admission.stats()['running'] == 0
+        admission.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_cancel_while_queued_leaves_the_queue():
+    async def scenario():
+        admission = SolveAdmission(max_concurrent=1, max_queue=8, max_per_client=1)
+        gate, hold = blocker()
+        running = admission.submit('a', hold)
+        await settle()
+        ran = []
+        withdrawn = admission.submit('b', ran.append, 'withdrawn')
+        after = admission.submit('c', ran.append, 'after')
+        await settle()
+
+        withdrawn.cancel()
+        await settle()
+        assert admission.stats()['queue_depth'] == 1
+        assert admission.stats()['cancelled']['queued'] == 1
+
+        gate.set()
+        await asyncio.gather(running, after)
+        assert ran == ['after']
+        # 取り下げたクライアントの受付件数も戻っている
+        assert await admission.submit('b', lambda: 'again') == 'again'
+        admission.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_cancel_right_after_grant_passes_the_slot_on():
+    async def scenario():
+        admission = SolveAdmission(max_concurrent=1)
+        await admission._acquire()
+        granted = asyncio.ensure_future(admission._acquire())
+        following = asyncio.ensure_future(admission._acquire())
+        await settle()
+
+        # 実行枠を譲られたが、まだ再開していない待機者を取り消す
+        admission._release()
+        granted.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await granted
+        await following
+        assert admission.stats()['running'] == 1
+        assert admission.stats()['queue_depth'] == 0
+        assert admission.stats()['cancelled']['queued'] == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_already_skipped_by_release():
+    async def scenario():
+        admission = SolveAdmission(max_concurrent=1)
+        await admission._acquire()
+        waiting = asyncio.ensure_future(admission._acquire())
+        await settle()
+
+        # 取り消された待機者を _release() が先に読み飛ばしても ValueError にならない
+        waiting.cancel()
+        admission._release()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert admission.stats()['running'] == 0
+        assert admission.stats()['queue_depth'] == 0
+        assert admission.stats()['cancelled']['queued'] == 1
+
+    asyncio.run(scenario())
+
+
+def test_group_counts_as_one_admission():
+    async def scenario():
+        admission = SolveAdmission(max_concurrent=1, max_queue=8, max_per_client=1)
+        gate, hold = blocker()
+        group = admission.submit_group('a', [(hold, ()), (lambda x: x * 2, (2,)), (lambda x: x * 3, (3,))])
+        await settle()
+
+        with pytest.raises(SolveRejected) as rejected:
+            admission.submit('a', lambda: 'rejected')
+        assert rejected.value.reason == 'client_limit'
+        assert admission.stats()['admitted'] == 3
+        assert admission.stats()['queue_depth'] == 2
+
+        gate.set()
+        assert (await asyncio.gather(*group))[1:] == [4, 9]
+        assert admission.stats()['completed'] == 3
+        assert await admission.submit('a', lambda: 'again') == 'again'
+        admission.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_stats_report_queue_depth_and_wait_times():
+    async def scenario():
+        admission = SolveAdmission(max_concurrent=1, max_queue=8, max_per_client=8)
+        gate, hold = blocker()
+        running = admission.submit('a', hold)
+        await settle()
+        queued = [admission.submit(name, lambda: None) for name in ('b', 'c')]
+        await settle()
+
+        stats = admission.stats()
+        assert stats['running'] == 1
+        assert stats['queue_depth'] == 2
+        assert stats['peak_queue_depth'] == 2
+        assert stats['average_solve_ms'] is None
+
+        await asyncio.sleep(0.05)
+        gate.set()
+        await asyncio.gather(running, *queued)
+        stats = admission.stats()
+        assert stats['queue_depth'] == 0
+        assert stats['completed'] == 3
+        assert stats['queue_wait_ms']['samples'] == 3
+        assert stats['queue_wait_ms']['max'] >= 50
+        assert stats['queue_wait_ms']['average'] > 0
+        assert stats['average_solve_ms'] is not None
+        admission.shutdown()
+
+    asyncio.run(scenario())
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+グリッド空間インデックス（GridSpatialIndex / nearest_neighbor_order）のテスト
+最近傍検索と巡回順が総当たりと一致すること、出発地が小さな集まりから遠い場合に
+空のセルを延々と探索しないこと（停滞の再発防止）を確認する
+"""
+
+import math
+import random
+
+import pytest
+
+from distance_matrix import haversine_matrix
+from spatial_index import GridSpatialIndex, nearest_neighbor_order
+
+START = (24.4567, 124.1456)  # 川平湾
+
+
+def random_points(seed: int, count: int):
+    rng = random.Random(seed)
+    return ([24.33 + rng.random() * 0.15 for _ in range(count)],
+            [124.10 + rng.random() * 0.10 for _ in range(count)])
+
+
+def brute_force_order(lats, lngs, start):
+    """総当たりの最近傍法（同距離は番号の小さい方）"""
+    km = haversine_matrix([start[0]] + lats, [start[1]] + lngs)
+    remaining = set(range(len(lats)))
+    order, current = [], -1
+    while remaining:
+        nearest = min(remaining, key=lambda i: (km[current + 1][i + 1], i))
+        remaining.remove(nearest)
+        order.append(nearest)
+        current = nearest
+    return order
+
+
+def haversine_from(lats, lngs, start):
+    km = haversine_matrix([start[0]] + lats, [start[1]] + lngs).tolist()
+    return lambda prev, i: km[0 if prev is None else prev + 1][i + 1]
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_nearest_matches_brute_force_after_removals(seed):
+    lats, lngs = random_points(seed, 60)
+    index = GridSpatialIndex(lats, lngs)
+    rng = random.Random(seed)
+    removed = set(rng.sample(range(60), 25))
+    for i in removed:
+        index.remove(i)
+    assert len(index) == 35
+
+    for _ in range(20):
+        lat, lng = 24.30 + rng.random() * 0.2, 124.08 + rng.random() * 0.14
+        x, y = index._project(lat, lng)
+        expected = min((i for i in range(60) if i not in removed),
+                       key=lambda i: (math.hypot(index._xy[i][0] - x, index._xy[i][1] - y), i))
+        assert index.nearest(lat, lng) == expected
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_nearest_neighbor_order_visits_each_point_once_like_brute_force(seed):
+    lats, lngs = random_points(seed, 50)
+
+    order = nearest_neighbor_order(lats, lngs, *START, haversine_from(lats, lngs, START))
+
+    assert sorted(order) == list(range(50))
+    assert order == brute_force_order(lats, lngs, START)
+
+
+@pytest.mark.parametrize('cluster', [
+    [(24.3401, 124.1502)],
+    [(24.3401, 124.1502), (24.34012, 124.15023)],
+    [(24.3401, 124.1502), (24.34012, 124.15023), (24.34009, 124.15019)],
+])
+def test_far_start_from_a_tiny_cluster_does_not_scan_empty_rings(cluster, monkeypatch):
+    # 数メートル四方の集まりはセルも数メートルになり、約15km先の出発地からは
+    # 数千リング × 数千セルを走査していた
+    visited = [0]
+    ring_cells = GridSpatialIndex._ring_cells
+
+    def counting_ring_cells(*args):
+        for cell in ring_cells(*args):
+            visited[0] += 1
+            yield cell
+
+    monkeypatch.setattr(GridSpatialIndex, '_ring_cells', staticmethod(counting_ring_cells))
+    lats = [lat for lat, _ in cluster]
+    lngs = [lng for _, lng in cluster]
+
+    order = nearest_neighbor_order(lats, lngs, *START, haversine_from(lats, lngs, START))
+
+    assert order == brute_force_order(lats, lngs, START)
+    assert visited[0] < 100
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+期限前更新付きキャッシュ（RefreshingTTLCache）のテスト
+time.monotonic を手動の時計に置き換え、期限前の裏更新・期限切れ後の古い値の返却・
+破棄・更新失敗時の保持・定期更新の対象を確認する
+"""
+
+import asyncio
+
+import pytest
+
+import ttl_cache
+from ttl_cache import RefreshingTTLCache
+
+TTL = 100
+REFRESH_AHEAD = 20
+STALE = 50
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ttl_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def counting_loader(*values):
+    """呼ばれるたびに values を順に返す（Exception は送出する）"""
+    calls = []
+
+    async def loader():
+        value = values[len(calls)]
+        calls.append(value)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    return loader, calls
+
+
+async def settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def new_cache() -> RefreshingTTLCache:
+    return RefreshingTTLCache(ttl_seconds=TTL, refresh_ahead_seconds=REFRESH_AHEAD, stale_seconds=STALE)
+
+
+def test_refresh_ahead_is_scheduled_before_expiry(clock):
+    async def scenario():
+        cache = new_cache()
+        loader, calls = counting_loader('v1', 'v2')
+        assert await cache.get('k', loader) == 'v1'
+
+        clock[0] += TTL - REFRESH_AHEAD - 1
+        assert await cache.get('k', loader) == 'v1'
+        await settle()
+        assert calls == ['v1']
+
+        # 期限の refresh_ahead 秒前からは古い値を返しつつ裏で取り直す
+        clock[0] += 1
+        assert await cache.get('k', loader) == 'v1'
+        await settle()
+        assert calls == ['v1', 'v2']
+        assert await cache.get('k', loader) == 'v2'
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['refreshes']) == (3, 1, 1)
+        assert stats['age_seconds']['max'] == 0.0
+
+    asyncio.run(scenario())
+
+
+def test_stale_value_is_served_while_revalidating(clock):
+    async def scenario():
+        cache = new_cache()
+        loader, calls = counting_loader('v1', 'v2')
+        await cache.get('k', loader)
+
+        clock[0] += TTL + STALE - 1
+        assert await cache.get('k', loader) == 'v1'
+        assert cache.stats()['stale_hits'] == 1
+        await settle()
+        assert await cache.get('k', loader) == 'v2'
+
+    asyncio.run(scenario())
+
+
+def test_entry_is_discarded_after_ttl_plus_stale(clock):
+    async def scenario():
+        cache = new_cache()
+        loader, calls = counting_loader('v1', 'v2')
+        await cache.get('k', loader)
+
+        # 古い値も返せない期間を過ぎたら、取得完了を待って新しい値を返す
+        clock[0] += TTL + STALE
+        assert await cache.get('k', loader) == 'v2'
+        stats = cache.stats()
+        assert (stats['expirations'], stats['misses'], stats['stale_hits']) == (1, 2, 0)
+
+    asyncio.run(scenario())
+
+
+def test_failed_refresh_keeps_the_old_value(clock):
+    async def scenario():
+        cache = new_cache()
+        loader, calls = counting_loader('v1', RuntimeError('API error'), 'v2')
+        await cache.get('k', loader)
+
+        clock[0] += TTL - REFRESH_AHEAD
+        assert await cache.get('k', loader) == 'v1'
+        await settle()
+        assert cache.stats()['refresh_failures'] == 1
+        assert cache.stats()['refreshing'] == 0
+
+        # 古い値を返し続け、次の参照で再試行する
+        assert await cache.get('k', loader) == 'v1'
+        await settle()
+        assert await cache.get('k', loader) == 'v2'
+        assert len(calls) == 3
+
+    asyncio.run(scenario())
+
+
+def test_refresh_due_only_refreshes_entries_read_since_stored(clock):
+    async def scenario():
+        cache = new_cache()
+        read_loader, read_calls = counting_loader('read-1', 'read-2')
+        idle_loader, idle_calls = counting_loader('idle-1', 'idle-2')
+        await cache.get('read', read_loader)
+        await cache.get('idle', idle_loader)
+
+        clock[0] += 10
+        await cache.get('read', read_loader)
+
+        clock[0] += TTL - REFRESH_AHEAD - 10
+        assert cache.refresh_due() == 1
+        await settle()
+        assert read_calls == ['read-1', 'read-2']
+        assert idle_calls == ['idle-1']
+        # 更新直後の値は参照されるまで再更新しない
+        assert cache.refresh_due() == 0
+
+        # 参照されない値は ttl + stale を過ぎたら破棄する
+        clock[0] += REFRESH_AHEAD + STALE
+        assert cache.refresh_due() == 0
+        assert len(cache) == 1
+        assert cache.stats()['expirations'] == 1
+        await settle()
+        assert idle_calls == ['idle-1']
+
+    asyncio.run(scenario())
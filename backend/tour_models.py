@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+tour_models.py - 最適化結果の軽量ドメインモデル
+石垣島ツアー最適化システム
+
+- ゲスト・車両・停車・車両ルートを __slots__ 付きのデータクラスで保持する
+  （停車ごとの辞書を作らず、計画・結果キャッシュに保持するルートのメモリを抑える）
+- 停車ごとの気象影響・快適性の推奨事項・目的地はリクエスト内で共有する参照として持つ
+- 時刻は整数の分で保持し、API レスポンス形式（to_dict）への変換時に 'HH:MM' にする
+- ワーカープロセスからの転送・結果キャッシュの複製は属性値のタプルで行う
+- compact 形式では停車ごとの気象影響をレスポンス上位の weather_profiles に1回だけ載せ、
+  停車からは添字で参照する（通信量の少ない端末向け）
+"""
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+
+def _format_minutes(minutes: int) -> str:
+    """分を 'HH:MM' に変換（日をまたいでも折り返さない）"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class _SlottedModel:
+    """属性値のタプルで pickle / deepcopy する（属性名を要素ごとに持たない）"""
+    __slots__ = ()
+
+    def __getstate__(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state: tuple) -> None:
+        for name, value in zip(self.__slots__, state):
+            object.__setattr__(self, name, value)
+
+
+@dataclass
+class Guest(_SlottedModel):
+    """ゲスト（ピックアップ地点・人数・希望時間帯）"""
+    __slots__ = ('id', 'name', 'hotel_name', 'pickup_lat', 'pickup_lng', 'num_people',
+                 'preferred_pickup_start', 'preferred_pickup_end')
+    id: str
+    name: str
+    hotel_name: str
+    pickup_lat: float
+    pickup_lng: float
+    num_people: int
+    preferred_pickup_start: Optional[str]
+    preferred_pickup_end: Optional[str]
+
+    @classmethod
+    def from_dict(cls, guest: Dict) -> 'Guest':
+        return cls(
+            guest['id'], guest['name'], guest['hotel_name'],
+            guest['pickup_lat'], guest['pickup_lng'], guest['num_people'],
+            guest.get('preferred_pickup_start'), guest.get('preferred_pickup_end')
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'hotel_name': self.hotel_name,
+            'pickup_lat': self.pickup_lat,
+            'pickup_lng': self.pickup_lng,
+            'num_people': self.num_people,
+            'preferred_pickup_start': self.preferred_pickup_start,
+            'preferred_pickup_end': self.preferred_pickup_end
+        }
+
+
+@dataclass
+class Vehicle(_SlottedModel):
+    """車両（定員・ドライバー）"""
+    __slots__ = ('id', 'name', 'driver', 'capacity')
+    id: str
+    name: str
+    driver: Optional[str]
+    capacity: int
+
+    @classmethod
+    def from_dict(cls, vehicle: Dict) -> 'Vehicle':
+        return cls(vehicle['id'], vehicle['name'], vehicle.get('driver'), vehicle['capacity'])
+
+
+@dataclass
+class Stop(_SlottedModel):
+    """ピックアップ1件（時刻は分）"""
+    __slots__ = ('guest', 'pickup_minutes', 'time_compliance', 'distance_from_previous',
+                 'travel_time_minutes', 'wait_minutes', 'weather_impact', 'comfort_recommendations',
+                 'arrival_analysis')
+    guest: Guest
+    pickup_minutes: int
+    time_compliance: str
+    distance_from_previous: float
+    travel_time_minutes: int
+    wait_minutes: int
+    weather_impact: Dict[str, Any]           # 同じ時間帯の停車で共有
+    comfort_recommendations: List[str]       # 同上
+    arrival_analysis: Optional[Dict[str, Any]]  # 詳細出力を要求された場合のみ
+
+    @property
+    def pickup_time(self) -> str:
+        return _format_minutes(self.pickup_minutes)
+
+    def _base_dict(self) -> Dict[str, Any]:
+        guest = self.guest
+        return {
+            'guest_id': guest.id,
+            'name': guest.name,
+            'hotel_name': guest.hotel_name,
+            'pickup_lat': guest.pickup_lat,
+            'pickup_lng': guest.pickup_lng,
+            'num_people': guest.num_people,
+            'pickup_time': self.pickup_time,
+            'time_compliance': self.time_compliance,
+            'distance_from_previous': round(self.distance_from_previous, 1),
+            'travel_time_minutes': self.travel_time_minutes,
+            'wait_minutes': self.wait_minutes
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        entry = self._base_dict()
+        entry['weather_impact'] = self.weather_impact
+        entry['comfort_recommendations'] = self.comfort_recommendations
+        if self.arrival_analysis is not None:
+            entry['arrival_analysis'] = self.arrival_analysis
+        return entry
+
+    def to_compact_dict(self, weather_profile: int) -> Dict[str, Any]:
+        """compact 形式（気象影響は weather_profiles の添字、到着時間分析は省く）"""
+        entry = self._base_dict()
+        entry['weather_profile'] = weather_profile
+        return entry
+
+
+@dataclass
+class VehicleRoute(_SlottedModel):
+    """1台分のルート（停車順・距離・時間・目的地到着）"""
+    __slots__ = ('vehicle', 'stops', 'distance_km', 'estimated_time', 'passenger_count',
+                 'efficiency_score', 'weather_impact_summary', 'final_arrival_minutes',
+                 'activity_location', 'final_arrival_analysis')
+    vehicle: Vehicle
+    stops: List[Stop]
+    distance_km: float                        # 丸める前の距離
+    estimated_time: int
+    passenger_count: int
+    efficiency_score: float
+    weather_impact_summary: Dict[str, Any]    # リクエスト内で共有
+    final_arrival_minutes: int
+    activity_location: Dict[str, Any]         # 同上
+    final_arrival_analysis: Optional[Dict[str, Any]]
+
+    @property
+    def vehicle_id(self) -> str:
+        return self.vehicle.id
+
+    @property
+    def total_distance(self) -> float:
+        return round(self.distance_km, 1)
+
+    def guest_ids(self) -> List[str]:
+        return [stop.guest.id for stop in self.stops]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """API レスポンスのルート形式"""
+        return self._as_dict([stop.to_dict() for stop in self.stops], compact=False)
+
+    def to_compact_dict(self, weather_profile: Callable[[Stop], int]) -> Dict[str, Any]:
+        """compact 形式（目的地・気象影響概要はレスポンス上位に1回だけ載せる）"""
+        return self._as_dict([stop.to_compact_dict(weather_profile(stop)) for stop in self.stops], compact=True)
+
+    def _as_dict(self, stops: List[Dict[str, Any]], compact: bool) -> Dict[str, Any]:
+        if stops:
+            final_destination = {'arrival_time': _format_minutes(self.final_arrival_minutes)}
+            if not compact:
+                final_destination['activity_location'] = self.activity_location
+                if self.final_arrival_analysis is not None:
+                    final_destination['arrival_analysis'] = self.final_arrival_analysis
+            stops[-1]['final_destination'] = final_destination
+        vehicle = self.vehicle
+        route = {
+            'vehicle_id': vehicle.id,
+            'vehicle_name': vehicle.name,
+            'driver': vehicle.driver,
+            'capacity': vehicle.capacity,
+            'route': stops,
+            'total_distance': self.total_distance,
+            'estimated_time': self.estimated_time,
+            'passenger_count': self.passenger_count,
+            'efficiency_score': self.efficiency_score
+        }
+        if not compact:
+            route['weather_impact_summary'] = self.weather_impact_summary
+        return route
+
+
+def serialize_routes(routes: List[Any]) -> List[Dict[str, Any]]:
+    """ルート（VehicleRoute または変換済みの辞書）を API レスポンス形式に変換"""
+    return [route.to_dict() if isinstance(route, VehicleRoute) else route for route in routes]
+
+
+def serialize_routes_compact(routes: List[Any]) -> Dict[str, Any]:
+    """
+    ルートを compact 形式に変換
+
+    Returns:
+        {'routes': ..., 'weather_profiles': [{'weather_impact', 'comfort_recommendations'}, ...],
+         'route_weather_impact': ..., 'activity_location': ...}
+        1回の最適化結果のルートは気象影響概要・目的地が共通のため、上位に1回だけ載せる
+    """
+    profiles: List[Dict[str, Any]] = []
+    by_identity: Dict[tuple, int] = {}
+
+    def weather_profile(stop: Stop) -> int:
+        key = (id(stop.weather_impact), id(stop.comfort_recommendations))
+        index = by_identity.get(key)
+        if index is None:
+            profile = {'weather_impact': stop.weather_impact, 'comfort_recommendations': stop.comfort_recommendations}
+            # 複製された結果（キャッシュ・別プロセス）では参照が分かれることがあるため値でも照合
+            index = next((i for i, existing in enumerate(profiles) if existing == profile), len(profiles))
+            if index == len(profiles):
+                profiles.append(profile)
+            by_identity[key] = index
+        return index
+
+    models = [route for route in routes if isinstance(route, VehicleRoute)]
+    return {
+        'routes': [route.to_compact_dict(weather_profile) if isinstance(route, VehicleRoute) else route
+                   for route in routes],
+        'weather_profiles': profiles,
+        'route_weather_impact': models[0].weather_impact_summary if models else None,
+        'activity_location': models[0].activity_location if models else None
+    }
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+tour_plans.py - 作成済み計画の保持（当日の予約変更用）
+石垣島ツアー最適化システム
+
+- 解いたルート（車両順のゲストID）・距離行列・表示用ルートをメモリ上に保持し、
+  ゲストの追加・キャンセル・変更を全体再計算なしで反映できるようにする
+- 変更の無い車両の表示用ルートは再利用し、変更のあった車両だけ再構築する
+- 保持数の上限を超えた計画は、最後に参照された時刻の古い順に破棄する
+"""
+
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from distance_matrix import DistanceMatrix
+from tour_models import VehicleRoute
+
+
+@dataclass
+class TourPlan:
+    """当日変更を受け付ける計画"""
+    plan_id: str
+    algorithm: str
+    activity_location: Dict
+    activity_start_time: str
+    weather_data: Dict
+    vehicles: List[Dict]
+    guests: Dict[str, Dict]              # ゲストID → ゲスト（未割当を含む）
+    routes: List[List[str]]              # 車両順のゲストID
+    unassigned: List[str]
+    distance_matrix: DistanceMatrix
+    rendered: Dict[str, VehicleRoute] = field(default_factory=dict)    # 車両ID → 表示用ルート
+    route_distances: Dict[str, float] = field(default_factory=dict)    # 車両ID → ルート距離（km）
+    stale_vehicles: Set[str] = field(default_factory=set)              # 順序は同じだが再表示が必要な車両
+    version: int = 1
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    updated_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    # 同じ計画への変更は1件ずつ適用する
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+    def vehicle_position(self, guest_id: str) -> Optional[int]:
+        """ゲストが乗る車両の位置（未割当なら None）"""
+        for position, route in enumerate(self.routes):
+            if guest_id in route:
+                return position
+        return None
+
+    def routed_guests(self) -> List[Dict]:
+        """ルート上のゲスト（車両順・巡回順）"""
+        return [self.guests[guest_id] for route in self.routes for guest_id in route]
+
+    def touch(self) -> None:
+        self.version += 1
+        self.updated_at = datetime.now().isoformat()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'plan_id': self.plan_id,
+            'algorithm': self.algorithm,
+            'version': self.version,
+            'guest_count': len(self.guests),
+            'unassigned_count': len(self.unassigned),
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+
+
+class TourPlanStore:
+    """件数上限付きの計画ストア（参照の古い順に破棄）"""
+
+    def __init__(self, max_plans: int = 50):
+        self.max_plans = max(1, int(max_plans))
+        self._plans: 'OrderedDict[str, TourPlan]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+    def add(self, plan: TourPlan) -> None:
+        self._plans[plan.plan_id] = plan
+        self._plans.move_to_end(plan.plan_id)
+        while len(self._plans) > self.max_plans:
+            self._plans.popitem(last=False)
+
+    def get(self, plan_id: str) -> Optional[TourPlan]:
+        plan = self._plans.get(plan_id)
+        if plan is not None:
+            self._plans.move_to_end(plan_id)
+        return plan
+
+    def remove(self, plan_id: str) -> bool:
+        return self._plans.pop(plan_id, None) is not None
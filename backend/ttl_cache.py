@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+ttl_cache.py - 期限前に裏で更新する保持期限付きキャッシュ（気象データ用）
+石垣島ツアー最適化システム
+
+- 件数上限付きの LRU。経過時間は単調時計（time.monotonic）で測る
+- 保持期限（ttl_seconds）の refresh_ahead_seconds 前からは、値をそのまま返しつつ
+  バックグラウンドで取り直す（利用側は取得完了を待たない）
+- 期限切れ後も stale_seconds の間は古い値を返して更新を始める（stale-while-revalidate）。
+  それも過ぎた値は破棄し、次の要求で取得を待つ
+- 定期更新（refresh_loop）は、前回の取得以降に参照された期限間近の値だけを取り直す
+- 取得失敗時は古い値を残す。同じキーの同時取得は1回にまとめる
+- ヒット率・古い値の返却件数・更新件数・値の経過時間を統計として公開する
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from result_cache import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+Loader = Callable[[], Awaitable[Any]]
+
+
+class _Entry:
+    __slots__ = ('value', 'loader', 'stored_at', 'last_access')
+
+    def __init__(self, value: Any, loader: Loader, stored_at: float):
+        self.value = value
+        self.loader = loader
+        self.stored_at = stored_at
+        self.last_access = stored_at
+
+
+class RefreshingTTLCache:
+    """件数上限・保持期限付きキャッシュ（期限前のバックグラウンド更新付き）"""
+
+    def __init__(self, max_entries: int = 64, ttl_seconds: float = 1800,
+                 refresh_ahead_seconds: float = 300, stale_seconds: float = 300):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self.refresh_ahead_seconds = min(refresh_ahead_seconds, ttl_seconds)
+        self.stale_seconds = stale_seconds
+        self.flights = SingleFlight()
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self._refreshing: Set[str] = set()
+        self._refresh_tasks: Set['asyncio.Task'] = set()
+        self._loop_task: Optional['asyncio.Task'] = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str, loader: Loader) -> Any:
+        """
+        キャッシュ済みの値（期限間近・期限切れ直後なら裏で更新）、無ければ loader で取得して保存
+
+        Raises:
+            loader の例外（キャッシュに値が無い場合のみ）
+        """
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = now - entry.stored_at
+            if age < self.ttl_seconds + self.stale_seconds:
+                self._entries.move_to_end(key)
+                entry.last_access = now
+                entry.loader = loader  # 更新は直近の呼び出し側の取得方法で行う
+                if age < self.ttl_seconds:
+                    self.hits += 1
+                else:
+                    self.stale_hits += 1
+                if age >= self.ttl_seconds - self.refresh_ahead_seconds:
+                    self._schedule_refresh(key, entry)
+                return entry.value
+            del self._entries[key]
+            self.expirations += 1
+
+        self.misses += 1
+        value, _ = await self.flights.run(key, lambda: self._load(key, loader))
+        return value
+
+    async def _load(self, key: str, loader: Loader) -> Any:
+        value = await loader()
+        self._store(key, value, loader)
+        return value
+
+    def _store(self, key: str, value: Any, loader: Loader) -> None:
+        self._entries[key] = _Entry(value, loader, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # ===== バックグラウンド更新 =====
+
+    def _schedule_refresh(self, key: str, entry: _Entry) -> None:
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        task = asyncio.ensure_future(self._refresh(key, entry.loader))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _refresh(self, key: str, loader: Loader) -> None:
+        try:
+            value = await loader()
+        except Exception as e:
+            # 古い値を残し、次の参照・定期更新で再試行する
+            self.refresh_failures += 1
+            logger.warning(f"[CACHE] バックグラウンド更新失敗: {key}: {e}")
+        else:
+            # 更新中に破棄された（参照されなくなった）キーは戻さない
+            if key in self._entries:
+                self._store(key, value, loader)
+                self.refreshes += 1
+        finally:
+            self._refreshing.discard(key)
+
+    def refresh_due(self) -> int:
+        """
+        期限切れの値を破棄し、前回の取得以降に参照された期限間近の値の更新を始める
+
+        Returns:
+            更新を始めた件数
+        """
+        now = time.monotonic()
+        scheduled = 0
+        for key, entry in list(self._entries.items()):
+            age = now - entry.stored_at
+            if age >= self.ttl_seconds + self.stale_seconds:
+                del self._entries[key]
+                self.expirations += 1
+            elif (age >= self.ttl_seconds - self.refresh_ahead_seconds and
+                  entry.last_access > entry.stored_at and key not in self._refreshing):
+                self._schedule_refresh(key, entry)
+                scheduled += 1
+        return scheduled
+
+    async def refresh_loop(self, interval_seconds: float = 60) -> None:
+        while True:
+            await asyncio.sleep(interval_seconds)
+            self.refresh_due()
+
+    def start(self, interval_seconds: float = 60) -> None:
+        """定期更新を開始（イベントループ上で呼ぶ）"""
+        if self._loop_task is None:
+            self._loop_task = asyncio.ensure_future(self.refresh_loop(interval_seconds))
+
+    async def stop(self) -> None:
+        tasks = list(self._refresh_tasks)
+        if self._loop_task is not None:
+            tasks.append(self._loop_task)
+            self._loop_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        ages = [now - entry.stored_at for entry in self._entries.values()]
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'refresh_ahead_seconds': self.refresh_ahead_seconds,
+            'stale_seconds': self.stale_seconds,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.stale_hits) / lookups * 100, 1) if lookups else 0.0,
+            'refreshes': self.refreshes,
+            'refresh_failures': self.refresh_failures,
+            'refreshing': len(self._refreshing),
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'age_seconds': {
+                'average': round(sum(ages) / len(ages), 1) if ages else 0.0,
+                'max': round(max(ages), 1) if ages else 0.0
+            }
+        }
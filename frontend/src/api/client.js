@@ -64,6 +64,51 @@ export const checkSystemStatus = async () => {
 
 // ===== 🤖 新機能：AI最適化API =====
 
+// リクエストデータ構築（最適化・一括比較・ストリーミングで共通）
+const buildTourRequest = (tourData) => ({
+  date: tourData.date,
+  activity_type: tourData.activityType,
+  start_time: tourData.startTime || '10:00',
+  guests: tourData.guests.map(guest => ({
+    name: guest.name,
+    hotel_name: guest.hotel_name,
+    pickup_lat: guest.pickup_lat || guest.lat,
+    pickup_lng: guest.pickup_lng || guest.lng,
+    num_people: guest.num_people || guest.people || 1,
+    preferred_pickup_start: guest.preferred_pickup_start || '09:00',
+    preferred_pickup_end: guest.preferred_pickup_end || '09:30'
+  })),
+  vehicles: tourData.vehicles.map(vehicle => ({
+    id: vehicle.id,
+    name: vehicle.name,
+    capacity: vehicle.capacity,
+    driver: vehicle.driver,
+    location: vehicle.location
+  }))
+});
+
+// NDJSON レスポンスを1行ずつ handleMessage に渡す（ストリーミング API 共通）
+const readNdjsonStream = async (response, handleMessage) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  const handleLine = (line) => {
+    if (!line.trim()) return;
+    handleMessage(JSON.parse(line));
+  };
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop();
+    lines.forEach(handleLine);
+  }
+  handleLine(buffer + decoder.decode());
+};
+
 /**
  * 🧬 アルゴリズム選択最適化（新機能）
  */
@@ -71,28 +116,7 @@ export const optimizeWithAlgorithm = async (tourData, algorithm = 'nearest_neigh
   try {
     console.log(`🧠 AI最適化開始: ${algorithm}`);
     
-    const requestData = {
-      date: tourData.date,
-      activity_type: tourData.activityType,
-      start_time: tourData.startTime || '10:00',
-      algorithm: algorithm,
-      guests: tourData.guests.map(guest => ({
-        name: guest.name,
-        hotel_name: guest.hotel_name,
-        pickup_lat: guest.pickup_lat || guest.lat,
-        pickup_lng: guest.pickup_lng || guest.lng,
-        num_people: guest.num_people || guest.people || 1,
-        preferred_pickup_start: guest.preferred_pickup_start || '09:00',
-        preferred_pickup_end: guest.preferred_pickup_end || '09:30'
-      })),
-      vehicles: tourData.vehicles.map(vehicle => ({
-        id: vehicle.id,
-        name: vehicle.name,
-        capacity: vehicle.capacity,
-        driver: vehicle.driver,
-        location: vehicle.location
-      }))
-    };
+    const requestData = { ...buildTourRequest(tourData), algorithm };
 
     const response = await apiClient.post('/api/ishigaki/optimize', requestData);
     
@@ -106,33 +130,66 @@ export const optimizeWithAlgorithm = async (tourData, algorithm = 'nearest_neigh
 };
 
 /**
- * 📊 3アルゴリズム同時比較（新機能）
+ * 📡 アルゴリズム選択最適化（途中経過を順次受信）
+ * 
+ * onEvent(message) が started / progress / log の各イベントで呼ばれ、
+ * 完了後に optimizeWithAlgorithm と同じ形式の結果を返す。
+ * started の run_id を acceptOptimization に渡すと、その時点の暫定解で確定する
+ */
+export const optimizeWithAlgorithmStream = async (tourData, algorithm = 'nearest_neighbor', onEvent) => {
+  try {
+    console.log(`🧠 AI最適化開始（ストリーミング）: ${algorithm}`);
+
+    const response = await fetch(`${API_BASE_URL}/api/ishigaki/optimize/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ ...buildTourRequest(tourData), algorithm })
+    });
+    if (!response.ok) {
+      const detail = await response.json().catch(() => ({}));
+      throw new Error(detail.detail || `HTTP ${response.status}`);
+    }
+
+    let result = null;
+    await readNdjsonStream(response, (message) => {
+      if (message.type === 'result') {
+        const { type, ...rest } = message;
+        result = rest;
+      } else if (message.type === 'error') {
+        throw new Error(message.detail);
+      } else if (onEvent) {
+        onEvent(message);
+      }
+    });
+
+    if (!result) {
+      throw new Error('最適化結果を受信できませんでした');
+    }
+    console.log(`✅ ${algorithm}最適化完了:`, result);
+    return result;
+
+  } catch (error) {
+    console.error(`❌ ${algorithm}最適化エラー:`, error);
+    throw new Error(`AI最適化に失敗しました: ${error.message}`);
+  }
+};
+
+/**
+ * ✋ 実行中の最適化を打ち切り、現在の暫定解で確定
+ */
+export const acceptOptimization = async (runId) => {
+  const response = await apiClient.post(`/api/ishigaki/optimize/runs/${runId}/accept`);
+  return response.data;
+};
+
+/**
+ * 📊 全アルゴリズム同時比較（新機能）
  */
 export const compareAlgorithms = async (tourData) => {
   try {
     console.log('🔍 アルゴリズム比較開始');
     
-    const requestData = {
-      date: tourData.date,
-      activity_type: tourData.activityType,
-      start_time: tourData.startTime || '10:00',
-      guests: tourData.guests.map(guest => ({
-        name: guest.name,
-        hotel_name: guest.hotel_name,
-        pickup_lat: guest.pickup_lat || guest.lat,
-        pickup_lng: guest.pickup_lng || guest.lng,
-        num_people: guest.num_people || guest.people || 1,
-        preferred_pickup_start: guest.preferred_pickup_start || '09:00',
-        preferred_pickup_end: guest.preferred_pickup_end || '09:30'
-      })),
-      vehicles: tourData.vehicles.map(vehicle => ({
-        id: vehicle.id,
-        name: vehicle.name,
-        capacity: vehicle.capacity,
-        driver: vehicle.driver,
-        location: vehicle.location
-      }))
-    };
+    const requestData = buildTourRequest(tourData);
 
     const response = await apiClient.post('/api/ishigaki/compare', requestData);
     
@@ -145,6 +202,107 @@ export const compareAlgorithms = async (tourData) => {
   }
 };
 
+/**
+ * 📡 アルゴリズム比較（完了したアルゴリズムから順次受信）
+ * 
+ * onResult(algorithm, result, progress) が各アルゴリズム完了時に呼ばれ、
+ * 全完了後に compareAlgorithms と同じ形式のサマリーを返す
+ */
+export const compareAlgorithmsStream = async (tourData, onResult) => {
+  try {
+    console.log('🔍 アルゴリズム比較開始（ストリーミング）');
+    
+    const response = await fetch(`${API_BASE_URL}/api/ishigaki/compare/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(buildTourRequest(tourData))
+    });
+    if (!response.ok) {
+      const detail = await response.json().catch(() => ({}));
+      throw new Error(detail.detail || `HTTP ${response.status}`);
+    }
+
+    let summary = null;
+    await readNdjsonStream(response, (message) => {
+      if (message.type === 'result') {
+        console.log(`✅ ${message.algorithm} 完了 (${message.completed}/${message.total})`);
+        if (onResult) {
+          onResult(message.algorithm, message.result, { completed: message.completed, total: message.total });
+        }
+      } else if (message.type === 'summary') {
+        const { type, ...rest } = message;
+        summary = rest;
+      }
+    });
+
+    if (!summary) {
+      throw new Error('比較結果のサマリーを受信できませんでした');
+    }
+    console.log('✅ アルゴリズム比較完了:', summary);
+    return summary;
+    
+  } catch (error) {
+    console.error('❌ アルゴリズム比較エラー:', error);
+    throw new Error(`アルゴリズム比較に失敗しました: ${error.message}`);
+  }
+};
+
+/**
+ * 🗂️ 複数ツアーの一括最適化（完了したツアーから順次受信）
+ * 
+ * tours は { tourData, algorithm } の配列。
+ * onResult(index, result, progress) が各ツアー完了時に呼ばれ（index は tours の添字、
+ * result は optimizeWithAlgorithm と同じ形式）、全完了後にサマリーを返す
+ */
+export const optimizeToursBatch = async (tours, onResult) => {
+  try {
+    console.log(`🗂️ 一括最適化開始: ${tours.length}ツアー`);
+
+    const response = await fetch(`${API_BASE_URL}/api/ishigaki/optimize/batch`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        tours: tours.map(({ tourData, algorithm = 'nearest_neighbor' }) => ({ ...buildTourRequest(tourData), algorithm }))
+      })
+    });
+    if (!response.ok) {
+      const detail = await response.json().catch(() => ({}));
+      throw new Error(detail.detail || `HTTP ${response.status}`);
+    }
+
+    let summary = null;
+    let completed = 0;
+    await readNdjsonStream(response, (message) => {
+      if (message.type === 'result') {
+        const { type, index, ...result } = message;
+        completed += 1;
+        console.log(`✅ ツアー${index} 完了 (${completed}/${tours.length})`);
+        if (onResult) {
+          onResult(index, result, { completed, total: tours.length });
+        }
+      } else if (message.type === 'error') {
+        console.error(`❌ ツアー${message.index} エラー:`, message.detail);
+        if (onResult) {
+          onResult(message.index, { error: message.detail }, { completed, total: tours.length });
+        }
+      } else if (message.type === 'summary') {
+        const { type, ...rest } = message;
+        summary = rest;
+      }
+    });
+
+    if (!summary) {
+      throw new Error('一括最適化のサマリーを受信できませんでした');
+    }
+    console.log('✅ 一括最適化完了:', summary);
+    return summary;
+
+  } catch (error) {
+    console.error('❌ 一括最適化エラー:', error);
+    throw new Error(`一括最適化に失敗しました: ${error.message}`);
+  }
+};
+
 /**
  * 📋 利用可能アルゴリズム一覧取得（新機能）
  */
@@ -396,7 +554,11 @@ export const exportSchedule = async (scheduleData, format = 'pdf') => {
 export default {
   // 新AI最適化API
   optimizeWithAlgorithm,
+  optimizeWithAlgorithmStream,
+  acceptOptimization,
   compareAlgorithms,
+  compareAlgorithmsStream,
+  optimizeToursBatch,
   getAvailableAlgorithms,
   getOptimizationStatistics,
   getOptimizationLogs,
@@ -125,8 +125,12 @@ const RouteOptimizer = ({
   const [isOptimizing, setIsOptimizing] = useState(false);
   const [optimizationProgress, setOptimizationProgress] = useState(0);
   const [currentGeneration, setCurrentGeneration] = useState(0);
-  const [maxGenerations, setMaxGenerations] = useState(75);
+  const [maxGenerations, setMaxGenerations] = useState(0);
   const [optimizationResult, setOptimizationResult] = useState(null);
+  const [optimizationRunId, setOptimizationRunId] = useState(null);
+  const [liveIncumbent, setLiveIncumbent] = useState(null);
+  const [liveLogLines, setLiveLogLines] = useState([]);
+  const [isAccepting, setIsAccepting] = useState(false);
   const [optimizationLogs, setOptimizationLogs] = useState([]);
   const [aiSystemStatus, setAiSystemStatus] = useState(null);
   const [isAnalyzing, setIsAnalyzing] = useState(false);
@@ -406,26 +410,29 @@ const RouteOptimizer = ({
     setIsOptimizing(true);
     setOptimizationProgress(0);
     setCurrentGeneration(0);
+    setMaxGenerations(0);
+    setLiveIncumbent(null);
+    setLiveLogLines([]);
     setActiveStep(1);
 
     try {
-      let progressInterval;
-      if (selectedAlgorithm === 'genetic') {
-        const config = ALGORITHM_CONFIGS[selectedAlgorithm];
-        setMaxGenerations(config.parameters.generations);
-        
-        progressInterval = setInterval(() => {
-          setOptimizationProgress(prev => {
-            const newProgress = prev + (100 / config.parameters.generations);
-            setCurrentGeneration(Math.floor((newProgress / 100) * config.parameters.generations));
-            return Math.min(newProgress, 95);
-          });
-        }, 40);
-      }
-
-      const result = await api.optimizeWithAlgorithm(repairedTourData, selectedAlgorithm);
-      
-      if (progressInterval) clearInterval(progressInterval);
+      // サーバーから暫定解・ログを順次受信（世代数が分かるエンジンは進捗率も更新）
+      const result = await api.optimizeWithAlgorithmStream(repairedTourData, selectedAlgorithm, (event) => {
+        if (event.type === 'started') {
+          setOptimizationRunId(event.run_id);
+        } else if (event.type === 'progress') {
+          setLiveIncumbent({ stage: event.stage, ...event.incumbent });
+          if (event.total) {
+            setMaxGenerations(event.total);
+            setCurrentGeneration(event.iteration);
+            setOptimizationProgress(Math.min((event.iteration / event.total) * 100, 99));
+          }
+        }
+        const lines = event.type === 'log' ? event.lines : event.log;
+        if (lines && lines.length > 0) {
+          setLiveLogLines(prev => [...prev, ...lines].slice(-5));
+        }
+      });
       
       if (result.success) {
         setOptimizationProgress(100);
@@ -472,6 +479,8 @@ const RouteOptimizer = ({
       alert(`❌ 最適化エラー: ${error.message}`);
     } finally {
       setIsOptimizing(false);
+      setIsAccepting(false);
+      setOptimizationRunId(null);
       setTimeout(() => {
         setOptimizationProgress(0);
         setCurrentGeneration(0);
@@ -479,6 +488,18 @@ const RouteOptimizer = ({
     }
   };
 
+  // ========== 暫定解で確定（探索打ち切り） ==========
+  const acceptCurrentSolution = async () => {
+    if (!optimizationRunId) return;
+    setIsAccepting(true);
+    try {
+      await api.acceptOptimization(optimizationRunId);
+    } catch (error) {
+      console.error('確定要求エラー:', error);
+      setIsAccepting(false);
+    }
+  };
+
   // ========== 比較実行 ==========
   const executeComparison = async () => {
     if (!preOptimizationCheck.allValid) {
@@ -494,7 +515,14 @@ const RouteOptimizer = ({
       const repairedTourData = createRepairedTourData();
       console.log('🔧 比較用修復データ:', repairedTourData);
       
-      const result = await api.compareAlgorithms(repairedTourData);
+      // 完了したアルゴリズムから順次表示
+      const result = await api.compareAlgorithmsStream(repairedTourData, (algorithm, algorithmResult) => {
+        setComparisonResults(prev => ({
+          success: true,
+          ...prev,
+          comparison_results: { ...(prev?.comparison_results || {}), [algorithm]: algorithmResult }
+        }));
+      });
       
       if (result.success) {
         setComparisonResults(result);
@@ -978,16 +1006,40 @@ const RouteOptimizer = ({
         {(isOptimizing || isComparing) && (
           <Box>
             <LinearProgress 
-              variant="determinate" 
+              variant={isOptimizing && maxGenerations === 0 ? 'indeterminate' : 'determinate'} 
               value={optimizationProgress} 
               sx={{ mb: 1 }}
             />
             <Typography variant="body2" color="text.secondary">
               {isOptimizing ? 
-                `${algorithmAnalysis ? ALGORITHM_CONFIGS[algorithmAnalysis.selectedAlgorithm]?.name : ''}最適化進行中... ${Math.round(optimizationProgress)}% (世代: ${currentGeneration}/${maxGenerations})` :
+                `${algorithmAnalysis ? ALGORITHM_CONFIGS[algorithmAnalysis.selectedAlgorithm]?.name : ''}最適化進行中...` +
+                (maxGenerations > 0 ? ` ${Math.round(optimizationProgress)}% (世代: ${currentGeneration}/${maxGenerations})` : '') :
                 '全アルゴリズム比較実行中...'
               }
             </Typography>
+            {isOptimizing && liveIncumbent && (
+              <Stack direction="row" spacing={2} alignItems="center" sx={{ mt: 1 }}>
+                <Typography variant="body2">
+                  暫定解（{liveIncumbent.stage}）: {liveIncumbent.distance_km}km / 効率 {liveIncumbent.efficiency_score}%
+                </Typography>
+                <Button
+                  size="small"
+                  variant="outlined"
+                  startIcon={<StopIcon />}
+                  onClick={acceptCurrentSolution}
+                  disabled={!optimizationRunId || isAccepting}
+                >
+                  {isAccepting ? '確定中...' : 'この解で確定'}
+                </Button>
+              </Stack>
+            )}
+            {isOptimizing && liveLogLines.length > 0 && (
+              <Box sx={{ mt: 1, fontFamily: 'monospace', fontSize: '0.75rem', color: 'text.secondary' }}>
+                {liveLogLines.map((line, index) => (
+                  <div key={index}>{line}</div>
+                ))}
+              </Box>
+            )}
           </Box>
         )}
       </CardContent>
@@ -1169,9 +1221,10 @@ const RouteOptimizer = ({
     return (
       <Box sx={{ mt: 3 }}>
         <AlgorithmComparisonDashboard
-          comparisonData={comparisonResults}
-          onAlgorithmSelect={() => {}} // 智能システムでは手動選択無効
-          onOptimize={() => {}} // 智能システムでは手動実行無効
+          comparisonResults={comparisonResults}
+          isComparing={isComparing}
+          onCompare={executeComparison}
+          onSelectAlgorithm={() => {}} // 智能システムでは手動選択無効
         />
       </Box>
     );
@@ -1279,7 +1332,7 @@ const RouteOptimizer = ({
                   全アルゴリズム比較（気象統合版）
                 </Typography>
                 <Typography variant="body2" color="text.secondary" sx={{ mb: 2 }}>
-                  3つの最適化アルゴリズムを同時実行して性能を比較します。気象条件も考慮されます。
+                  全ての最適化アルゴリズムを並列実行し、完了したものから順に性能を比較表示します。気象条件も考慮されます。
                 </Typography>
                 
                 <Button
@@ -169,6 +169,67 @@ function Test-ComplexCase {
     return $results
 }
 
+function Test-ResponseDetail {
+    param(
+        [hashtable]$TestData,
+        [int]$GuestCount = 120
+    )
+    
+    # 🆕 response_detail（compact / standard / verbose）別のレスポンスサイズ比較
+    Write-Host ""
+    Write-Host "📦 レスポンスサイズ比較（$GuestCount ゲスト）" -ForegroundColor Magenta
+    
+    # 基本ケースのゲストを周辺に散らして大規模ケースを作成
+    $random = New-Object System.Random 42
+    $guests = @()
+    for ($i = 0; $i -lt $GuestCount; $i++) {
+        $base = $TestData.guests[$i % $TestData.guests.Count]
+        $guests += @{
+            name = "$($base.name)$i"
+            hotel_name = $base.hotel_name
+            pickup_lat = $base.pickup_lat + ($random.NextDouble() - 0.5) * 0.04
+            pickup_lng = $base.pickup_lng + ($random.NextDouble() - 0.5) * 0.04
+            num_people = $base.num_people
+            preferred_pickup_start = $base.preferred_pickup_start
+            preferred_pickup_end = $base.preferred_pickup_end
+        }
+    }
+    $vehicles = @()
+    for ($i = 0; $i -lt [Math]::Ceiling($GuestCount / 3); $i++) {
+        $vehicles += @{
+            name = "バン$i"
+            capacity = 14
+            driver = "ドライバー$i"
+            location = $TestData.vehicles[$i % $TestData.vehicles.Count].location
+        }
+    }
+    
+    $sizes = @{}
+    foreach ($detail in @("verbose", "standard", "compact")) {
+        $testData = $TestData.Clone()
+        $testData.guests = $guests
+        $testData.vehicles = $vehicles
+        $testData.algorithm = "savings"
+        $testData.response_detail = $detail
+        
+        try {
+            $jsonBody = $testData | ConvertTo-Json -Depth 10
+            $response = Invoke-WebRequest -Uri "$API_BASE/api/ishigaki/optimize" -Method POST -Body ([System.Text.Encoding]::UTF8.GetBytes($jsonBody)) -ContentType "application/json; charset=utf-8" -UseBasicParsing
+            $sizes[$detail] = [System.Text.Encoding]::UTF8.GetByteCount($response.Content)
+            Write-Host "   $detail : $(($sizes[$detail] / 1KB).ToString('F1'))KB" -ForegroundColor Yellow
+        } catch {
+            Write-Host "❌ $detail エラー: $($_.Exception.Message)" -ForegroundColor Red
+        }
+    }
+    
+    if ($sizes.standard -and $sizes.compact) {
+        $saving = (1 - $sizes.compact / $sizes.standard) * 100
+        Write-Host "📉 compact による削減: $($saving.ToString('F1'))%（standard 比）" -ForegroundColor Green
+    }
+    
+    return $sizes
+}
+
 # メイン実行
 Write-Host "サーバーが起動していることを確認してください..." -ForegroundColor Yellow
 Read-Host "Enterキーを押してPhase 4Aテストを開始"
@@ -438,6 +499,9 @@ if ($successResults.Count -gt 0) {
     Write-Host "❌ 有効な結果が得られませんでした" -ForegroundColor Red
 }
 
+# レスポンスサイズ比較
+$payloadSizes = Test-ResponseDetail -TestData $complexCase1
+
 Write-Host ""
 Write-Host "✅ Phase 4A テスト完了" -ForegroundColor Green
 Write-Host "次のステップ: フロントエンド統合、実用機能拡張、パフォーマンス分析" -ForegroundColor Yellow